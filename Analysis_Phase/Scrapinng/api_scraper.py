@@ -0,0 +1,606 @@
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote_plus
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from selenium.webdriver.common.by import By
+from result_sink import ResultSink, FORMATS
+from scraper import (
+    PORTAL_URL, PREFIX_LEVELS, Checkpoint, new_driver, open_calculator, wait_idle, get_options,
+    is_disabled, select_by_value, get_field_value, find_valid_date, submit, parse_date,
+)
+
+RECORDING_FILE = "mcgm_api_recording.json"
+CACHE_FILE = "mcgm_api_cache.db"
+REQUEST_TIMEOUT = 30
+
+LEAF_LEVELS = [
+    ("floor", "ptasdFloorid"),
+    ("building_type", "ptasdNtbid"),
+    ("fsi_factor", "ptasdFsifact"),
+    ("metered_unmetered", "ptasdMetertype"),
+    ("tax_code", "ptawdTaxId"),
+]
+LEVELS = PREFIX_LEVELS + LEAF_LEVELS
+# Levels the form may leave disabled; the browser sweep records them as "N/A"
+OPTIONAL_LEVELS = {"ptasdFloorid", "ptasdNtbid", "ptasdFsifact"}
+FIELD_IDS = {"fsi": "ptasdFsi", "sddr_rate": "ptasdSddrrate", "age_of_building": "ptasdAge"}
+
+# Records every XHR the SPA makes (AngularJS $http goes through XMLHttpRequest)
+HOOK_SCRIPT = """
+    if (window.__captured) return;
+    window.__captured = [];
+    var proto = XMLHttpRequest.prototype, open = proto.open, send = proto.send, setHeader = proto.setRequestHeader;
+    proto.open = function (method, url) {
+        this.__capture = {method: method.toUpperCase(), url: new URL(url, location.href).href, headers: {}};
+        return open.apply(this, arguments);
+    };
+    proto.setRequestHeader = function (name, value) {
+        if (this.__capture) this.__capture.headers[name] = value;
+        return setHeader.apply(this, arguments);
+    };
+    proto.send = function (body) {
+        var xhr = this, record = xhr.__capture;
+        if (record) {
+            record.body = body == null ? null : String(body);
+            xhr.addEventListener('loadend', function () {
+                record.status = xhr.status;
+                record.response = xhr.responseText;
+                window.__captured.push(record);
+            });
+        }
+        return send.apply(this, arguments);
+    };
+"""
+
+
+def drain(driver):
+    return driver.execute_script("return window.__captured ? window.__captured.splice(0) : [];")
+
+
+def _json(text):
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _walk(node, path=()):
+    yield path, node
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _walk(value, path + (key,))
+    elif isinstance(node, list):
+        for i, value in enumerate(node):
+            yield from _walk(value, path + (i,))
+
+
+def _get(node, path):
+    for key in path:
+        node = node[key]
+    return node
+
+
+def _number(value):
+    try:
+        return float(re.sub(r"[^\d.\-]", "", str(value)))
+    except ValueError:
+        return None
+
+
+# Where in a JSON response the option list of a dropdown lives: the list of objects
+# whose value/text fields cover every option the form showed
+def find_option_list(data, options):
+    texts = dict(options)
+    for path, node in _walk(data):
+        if not (isinstance(node, list) and node and all(isinstance(item, dict) for item in node)):
+            continue
+        keys = set.intersection(*(set(item) for item in node))
+        for value_key in keys:
+            found = {str(item[value_key]).strip() for item in node}
+            if not set(texts) <= found:
+                continue
+            for text_key in keys:
+                if all(str(item[text_key]).strip() == texts[str(item[value_key]).strip()]
+                       for item in node if str(item[value_key]).strip() in texts):
+                    return {"path": list(path), "value": value_key, "text": text_key}
+    return None
+
+
+# Path to the first scalar in a JSON response equal to what the form displayed
+def find_value(data, shown):
+    target = _number(shown)
+    for path, node in _walk(data):
+        if isinstance(node, (dict, list)) or node is None:
+            continue
+        if str(node).strip() == shown.strip() or (target is not None and _number(node) == target):
+            return list(path)
+    return None
+
+
+# Name of the level whose chosen value is `value`. Ids are often per-table sequences, so
+# several levels can share one; the deepest wins, since a request is usually about the
+# value just chosen (capture() picks distinct values where it can, and says when it can't).
+def _chosen_name(value, chosen):
+    names = [name for name, chosen_value in chosen if chosen_value and chosen_value == value]
+    return names[-1] if names else None
+
+
+# key=value pairs of a query string or form body
+def _template_pairs(text, chosen):
+    def replace(match):
+        name = _chosen_name(unquote_plus(match.group(3)), chosen)
+        return f"{match.group(1)}{match.group(2)}=${{{name}|q}}" if name else match.group(0)
+
+    return re.sub(r"(^|&)([^=&]+)=([^&]*)", replace, text)
+
+
+# "key": "value" and "key": number members of a JSON body, rewritten in place so the
+# template fills back to the exact text the browser sent
+def _template_json(text, chosen):
+    def replace(match):
+        string, number = match.group(2), match.group(3)
+        name = _chosen_name(string if string is not None else number, chosen)
+        if not name:
+            return match.group(0)
+        return f'{match.group(1)}"${{{name}}}"' if string is not None else f"{match.group(1)}${{{name}}}"
+
+    return re.sub(r'("(?:[^"\\]|\\.)*"\s*:\s*)(?:"([^"\\]*)"|(-?\d+(?:\.\d+)?)(?=\s*[,}\]]))',
+                  replace, text)
+
+
+# Replace the values chosen so far with ${name} (raw) / ${name|q} (URL-quoted) placeholders.
+# Only whole values of named query, form or JSON keys are replaced, never substrings of
+# the host, port, path or other values.
+def templatize(text, chosen):
+    if text is None:
+        return None
+    url = re.match(r"[A-Za-z][\w+.-]*://[^?#]*", text)
+    if url:
+        query, fragment = text[url.end():], ""
+        if "#" in query:
+            query, fragment = query.split("#", 1)
+            fragment = "#" + fragment
+        if query.startswith("?"):
+            return f"{url.group()}?{_template_pairs(query[1:], chosen)}{fragment}"
+        return text
+    if _json(text) is not None:
+        return _template_json(text, chosen)
+    return _template_pairs(text, chosen)
+
+
+def fill(template, values):
+    if template is None:
+        return None
+
+    def replace(match):
+        value = str(values.get(match.group(1), ""))
+        return quote(value, safe="") if match.group(2) else value
+
+    return re.sub(r"\$\{(\w+)(\|q)?\}", replace, template)
+
+
+def _request(exchange, chosen):
+    return {
+        "method": exchange["method"],
+        "url": templatize(exchange["url"], chosen),
+        "body": templatize(exchange.get("body"), chosen),
+        "headers": exchange.get("headers") or {},
+        "options": None,
+        "fields": {},
+    }
+
+
+# Drive one path through the form with the XHR hook installed, and infer from the
+# traffic how to ask the backend directly: for each dropdown, which request returns
+# its options and where they sit in the JSON; for submit, where the results are.
+def capture(url, start_date, carpet_area, headless=True):
+    driver = new_driver(headless)
+    try:
+        open_calculator(driver, url)
+        driver.execute_script(HOOK_SCRIPT)
+        date = find_valid_date(driver, start_date)
+        exchanges = drain(driver)
+        recording = list(exchanges)
+        chosen = [("date", date)]
+        levels = []
+        for name, select_id in LEVELS:
+            options = get_options(driver, select_id) if not is_disabled(driver, select_id) else []
+            level = {"name": name, "select_id": select_id, "requests": []}
+            for exchange in exchanges:
+                data = _json(exchange.get("response"))
+                if data is None:
+                    continue
+                request = _request(exchange, chosen)
+                request["response"] = data
+                if options and not any(r["options"] for r in level["requests"]):
+                    request["options"] = find_option_list(data, options)
+                level["requests"].append(request)
+            levels.append(level)
+            if not options:
+                chosen.append((select_id, ""))
+                exchanges = []
+                continue
+            # A value no level above used, so templatize() can tell the levels' parameters apart
+            used = {value for _, value in chosen}
+            value = next((value for value, _ in options if value not in used), options[0][0])
+            if value in used:
+                print(f"⚠️ Every {select_id} option repeats a value chosen above; "
+                      f"requests carrying {value!r} are attributed to {select_id}")
+            select_by_value(driver, select_id, value)
+            chosen.append((select_id, value))
+            exchanges = drain(driver)
+            recording.extend(exchanges)
+
+        area_field = driver.find_element(By.ID, "ptasdTcptarea")
+        area_field.clear()
+        area_field.send_keys(carpet_area)
+        wait_idle(driver)
+        recording.extend(drain(driver))
+        if carpet_area in {value for _, value in chosen}:
+            print(f"⚠️ Carpet area {carpet_area} equals a dropdown value; requests carrying it "
+                  f"are attributed to carpet_area")
+        chosen.append(("carpet_area", carpet_area))
+        capital_value, total_tax = submit(driver)
+        submit_exchanges = drain(driver)
+        recording.extend(submit_exchanges)
+        shown_fields = {name: get_field_value(driver, field_id) for name, field_id in FIELD_IDS.items()}
+        cookies = {c["name"]: c["value"] for c in driver.get_cookies()}
+    finally:
+        driver.quit()
+
+    result = {"requests": [], "capital_value": None, "total_tax": None}
+    for exchange in submit_exchanges:
+        data = _json(exchange.get("response"))
+        if data is None:
+            continue
+        capital_path, tax_path = find_value(data, capital_value), find_value(data, total_tax)
+        if capital_path is not None and tax_path is not None:
+            result["requests"] = [_request(exchange, chosen)]
+            result["capital_value"], result["total_tax"] = capital_path, tax_path
+            break
+    if not result["requests"]:
+        raise RuntimeError("❌ No captured response carried the calculated tax; the portal may not use XHR here.")
+
+    # Read-only fields the form fills in along the way, deepest level first
+    candidates = [r for level in reversed(levels) for r in level["requests"]]
+    for name, shown in shown_fields.items():
+        if shown in ("", "N/A"):
+            continue
+        for request in candidates:
+            path = find_value(request["response"], shown)
+            if path is not None:
+                request["fields"][name] = path
+                break
+
+    for level in levels:
+        level["requests"] = [r for r in level["requests"] if r["options"] or r["fields"]]
+        for r in level["requests"]:
+            r.pop("response", None)
+        if not any(r["options"] for r in level["requests"]) and level["select_id"] not in OPTIONAL_LEVELS:
+            print(f"⚠️ No option list found for {level['select_id']}")
+
+    return {
+        "date": date,
+        "cookies": cookies,
+        "levels": levels,
+        "submit": result,
+        "captured": {"values": dict(chosen), "capital_value": capital_value, "total_tax": total_tax},
+        "recording": [{k: e.get(k) for k in ("method", "url", "body", "status", "response")} for e in recording],
+    }
+
+
+def _signature(method, url, body):
+    return hashlib.sha256(json.dumps([method, url, body]).encode("utf-8")).hexdigest()
+
+
+# Option-list responses by request signature; dropdown contents don't change within a sweep
+class ResponseCache:
+    def __init__(self, path=CACHE_FILE):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, body TEXT)")
+        self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT body FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, body):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?)", (key, body))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class NotRecorded(Exception):
+    pass
+
+
+class _RecordedResponse:
+    def __init__(self, status, text):
+        self.status_code = status
+        self.text = text
+
+    def raise_for_status(self):
+        if self.status_code and self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} (recorded)")
+
+
+# Stand-in for requests.Session that answers only from a capture, for offline runs
+class RecordedSession:
+    def __init__(self, recording):
+        self.responses = {(e["method"], e["url"], e.get("body")): e for e in recording}
+
+    def request(self, method, url, data=None, headers=None, timeout=None):
+        exchange = self.responses.get((method, url, data))
+        if exchange is None:
+            raise NotRecorded(f"{method} {url}")
+        return _RecordedResponse(exchange.get("status") or 200, exchange.get("response"))
+
+    def close(self):
+        pass
+
+
+def http_session(pool_size, cookies=None):
+    session = requests.Session()
+    retry = Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=None)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.cookies.update(cookies or {})
+    return session
+
+
+# Walks the dropdown tree and submits combinations straight against the backend
+class ApiReplayer:
+    def __init__(self, spec, session, cache=None):
+        self.spec = spec
+        self.session = session
+        self.cache = cache
+
+    def fetch(self, request, values, cached=True):
+        method, url, body = request["method"], fill(request["url"], values), fill(request["body"], values)
+        key = _signature(method, url, body)
+        text = self.cache.get(key) if cached and self.cache else None
+        if text is None:
+            response = self.session.request(method, url, data=body, headers=request["headers"], timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            text = response.text
+            if cached and self.cache:
+                self.cache.put(key, text)
+        return json.loads(text)
+
+    # Options of level `index` given the values chosen above it, plus any fields its responses carry
+    def level(self, index, values):
+        options, fields = [], {}
+        for request in self.spec["levels"][index]["requests"]:
+            data = self.fetch(request, values)
+            extract = request["options"]
+            if extract:
+                options = [(str(item[extract["value"]]).strip(), str(item[extract["text"]]).strip())
+                           for item in _get(data, extract["path"])]
+            for name, path in request["fields"].items():
+                fields[name] = str(_get(data, path))
+        return options, fields
+
+    # Child contexts of `context` at level `index`, following the browser sweep's rules:
+    # disabled optional levels become a single None choice, and only the first FSI factor is used
+    def children(self, index, context):
+        select_id = self.spec["levels"][index]["select_id"]
+        options, fields = self.level(index, context["values"])
+        if select_id == "ptasdFsifact":
+            options = options[:1]
+        if not options and select_id in OPTIONAL_LEVELS:
+            options = [None]
+        return [{
+            "values": dict(context["values"], **{select_id: option[0] if option else ""}),
+            "choices": context["choices"] + [option],
+            "fields": dict(context["fields"], **fields),
+        } for option in options]
+
+    def calculate(self, values):
+        submit_spec = self.spec["submit"]
+        data = self.fetch(submit_spec["requests"][0], values, cached=False)
+        return str(_get(data, submit_spec["capital_value"])), str(_get(data, submit_spec["total_tax"]))
+
+
+def root_context(spec, carpet_area):
+    return {"values": {"date": spec["date"], "carpet_area": carpet_area}, "choices": [], "fields": {}}
+
+
+def make_record(date, carpet_area, context, capital_value, total_tax):
+    choices = context["choices"] + [None] * (len(LEVELS) - len(context["choices"]))
+    record = {"date": date}
+    for (name, _), choice in zip(LEVELS, choices):
+        record[name] = choice[1] if choice else "N/A"
+    return {
+        "date": date,
+        "ward": record["ward"],
+        "zone": record["zone"],
+        "subzone": record["subzone"],
+        "occupancy": record["occupancy"],
+        "main_category": record["main_category"],
+        "sub_category": record["sub_category"],
+        "tax_code": record["tax_code"],
+        "floor": record["floor"],
+        "building_type": record["building_type"],
+        "fsi_factor": record["fsi_factor"],
+        "fsi": context["fields"].get("fsi", "N/A"),
+        "sddr_rate": context["fields"].get("sddr_rate", "N/A"),
+        "age_of_building": context["fields"].get("age_of_building", "N/A"),
+        "metered_unmetered": record["metered_unmetered"],
+        "carpet_area": carpet_area,
+        "capital_value": capital_value,
+        "total_tax": total_tax,
+    }
+
+
+# Same key as the browser sweep (prefix values, floor, building type, meter, tax code),
+# so the two modes share one checkpoint
+def combination_key(context):
+    values = [choice[0] if choice else None for choice in context["choices"]]
+    prefix = values[:len(PREFIX_LEVELS)]
+    floor, btype, _, meter, tax = values[len(PREFIX_LEVELS):]
+    return prefix + [floor, btype, meter] + ([tax] if tax is not None else [])
+
+
+# children() that logs a branch whose option request fails and returns None for it,
+# so one bad branch (or one missing from an offline recording) doesn't sink its siblings
+def expand(replayer, index, context):
+    try:
+        return replayer.children(index, context)
+    except (requests.RequestException, NotRecorded, KeyError, IndexError, ValueError) as e:
+        print(f"[Options error] {[c[1] for c in context['choices'] if c]}: {e}")
+        return None
+
+
+# Request and submit every leaf under a prefix. The prefix is checkpointed as a whole ("*")
+# only if every branch expanded and every leaf was stored; otherwise it's left for a rerun,
+# which skips the stored leaves and retries the rest. Returns whether it was complete.
+def scrape_prefix(replayer, context, carpet_area, checkpoint, sink):
+    date = replayer.spec["date"]
+    complete = True
+    frontier = [context]
+    for index in range(len(PREFIX_LEVELS), len(LEVELS) - 1):
+        children = [expand(replayer, index, ctx) for ctx in frontier]
+        complete = complete and None not in children
+        frontier = [child for group in children if group for child in group]
+
+    for ctx in frontier:
+        tax_options = expand(replayer, len(LEVELS) - 1, ctx)
+        if tax_options is None:
+            complete = False
+            continue
+        if not tax_options:
+            leaf = dict(ctx, choices=ctx["choices"] + [None])
+            if combination_key(leaf) not in checkpoint:
+                sink.write(make_record(date, carpet_area, leaf, "N/A", "N/A"), error=True,
+                           checkpoint_key=combination_key(leaf))
+            continue
+        for leaf in tax_options:
+            key = combination_key(leaf)
+            if key in checkpoint:
+                continue
+            try:
+                capital_value, total_tax = replayer.calculate(leaf["values"])
+            except (requests.RequestException, NotRecorded, KeyError, IndexError, ValueError) as e:
+                print(f"[❌ ERROR] {key}: {e}")
+                sink.write(make_record(date, carpet_area, leaf, "ERROR", "ERROR"), error=True)
+                complete = False
+                continue
+            sink.write(make_record(date, carpet_area, leaf, capital_value, total_tax), checkpoint_key=key)
+    if complete:
+        sink.mark_done([choice[0] for choice in context["choices"]] + ["*"])
+    return complete
+
+
+# Prefixes are expanded breadth-first with the pool, then each prefix's leaves are
+# requested and submitted as one task. Returns the prefixes that failed or are incomplete.
+def run(replayer, carpet_area, checkpoint, sink, workers=16, shard=0, shards=1):
+    frontier = [root_context(replayer.spec, carpet_area)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for index in range(len(PREFIX_LEVELS)):
+            frontier = [child for children in pool.map(lambda ctx: expand(replayer, index, ctx), frontier)
+                        for child in children or []]
+        prefixes = [ctx for i, ctx in enumerate(frontier)
+                    if i % shards == shard and [c[0] for c in ctx["choices"]] + ["*"] not in checkpoint]
+        print(f"{len(frontier)} prefixes enumerated, {len(prefixes)} left in shard {shard}/{shards}.")
+
+        def task(ctx):
+            try:
+                return None if scrape_prefix(replayer, ctx, carpet_area, checkpoint, sink) else ctx
+            except (requests.RequestException, NotRecorded, KeyError, IndexError, ValueError) as e:
+                print(f"[Prefix error] {[c[1] for c in ctx['choices'] if c]}: {e}")
+                return ctx
+
+        return [ctx for ctx in pool.map(task, prefixes) if ctx is not None]
+
+
+# Replay the captured path against the recording alone and check it reproduces the
+# options and the tax the browser showed
+def verify(spec):
+    replayer = ApiReplayer(spec, RecordedSession(spec["recording"]))
+    captured = spec["captured"]["values"]
+    context = root_context(spec, captured["carpet_area"])
+    for index, level in enumerate(spec["levels"]):
+        wanted = captured.get(level["select_id"], "")
+        children = replayer.children(index, context)
+        match = [c for c in children if c["values"][level["select_id"]] == wanted]
+        if not match:
+            print(f"❌ {level['select_id']}: captured value {wanted!r} not among replayed options")
+            return False
+        context = match[0]
+    capital_value, total_tax = replayer.calculate(context["values"])
+    ok = (capital_value, total_tax) == (spec["captured"]["capital_value"], spec["captured"]["total_tax"]) or (
+        _number(capital_value) == _number(spec["captured"]["capital_value"])
+        and _number(total_tax) == _number(spec["captured"]["total_tax"]))
+    print(f"{'✅' if ok else '❌'} Replay gave capital value {capital_value}, total tax {total_tax} "
+          f"(browser showed {spec['captured']['capital_value']}, {spec['captured']['total_tax']})")
+    return ok
+
+
+def load_spec(path=RECORDING_FILE):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture the tax calculator's API once, then sweep it over HTTP")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    capture_cmd = sub.add_parser("capture", help="record the portal's XHR traffic for one path through the form")
+    capture_cmd.add_argument("--url", default=PORTAL_URL)
+    capture_cmd.add_argument("--date", default="24/06/2025")
+    capture_cmd.add_argument("--carpet-area", type=int, default=50)
+    capture_cmd.add_argument("--headed", action="store_true")
+
+    sub.add_parser("verify", help="replay the captured path offline against the recording")
+
+    run_cmd = sub.add_parser("run", help="sweep every combination over HTTP")
+    run_cmd.add_argument("--carpet-area", type=int, default=50)
+    run_cmd.add_argument("--workers", type=int, default=16)
+    run_cmd.add_argument("--shard", default="0/1")
+    run_cmd.add_argument("--format", choices=FORMATS, default="parquet", help="result storage")
+    run_cmd.add_argument("--offline", action="store_true", help="answer from the recording only")
+    args = parser.parse_args()
+
+    if args.command == "capture":
+        spec = capture(args.url, parse_date(args.date), str(args.carpet_area), headless=not args.headed)
+        with open(RECORDING_FILE, "w", encoding="utf-8") as f:
+            json.dump(spec, f, indent=1)
+        print(f"✅ {RECORDING_FILE} written ({len(spec['recording'])} requests recorded).")
+        verify(spec)
+    elif args.command == "verify":
+        raise SystemExit(0 if verify(load_spec()) else 1)
+    else:
+        spec = load_spec()
+        shard, shards = map(int, args.shard.split("/"))
+        if args.offline:
+            session, cache = RecordedSession(spec["recording"]), None
+        else:
+            session, cache = http_session(args.workers, spec["cookies"]), ResponseCache()
+        checkpoint = Checkpoint()
+        sink = ResultSink(fmt=args.format, checkpoint=checkpoint)
+        try:
+            failed = run(ApiReplayer(spec, session, cache), str(args.carpet_area), checkpoint, sink,
+                         workers=args.workers, shard=shard, shards=shards)
+        finally:
+            sink.close()
+            checkpoint.close()
+            session.close()
+            if cache:
+                cache.close()
+        if failed:
+            print(f"⚠️ {len(failed)} prefixes failed; rerun to retry them.")
+        print("✅ Scraping complete.")
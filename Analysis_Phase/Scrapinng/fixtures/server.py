@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+FIXTURES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Option labels per dropdown, in cascade order
+LABELS = {
+    "ptashWardid": ["A", "B"], "ptashZoneid": ["Zone 1", "Zone 2"], "ptashSubzoneid": ["1A", "1B"],
+    "ptasdOccuptpid": ["Owner", "Tenant"], "ptasdUsrctgid": ["Residential", "Commercial"],
+    "ptasdSusubctgid": ["Flat", "Shop"], "ptasdFloorid": ["Ground", "First"], "ptasdNtbid": ["RCC", "Other"],
+    "ptasdFsifact": ["1.0", "1.2"], "ptasdMetertype": ["Metered", "Unmetered"], "ptawdTaxId": ["General", "Water"],
+}
+CASCADE = list(LABELS)
+FIRST_YEAR = 2020
+
+
+def _year(date):
+    parts = date.split("/")
+    return int(parts[2]) if len(parts) == 3 and parts[2].isdigit() else 0
+
+
+# Ids are numbered per table, as in the portal's masters: the children of option `parent`
+# are (parent - 1) * n + 1 .. parent * n. Every level therefore has its own "1", "2", ...
+def child_codes(level, parent):
+    n = len(LABELS[level])
+    first = (int(parent) - 1) * n + 1 if parent else 1
+    return [str(first + i) for i in range(n)]
+
+
+def parent_code(level, code):
+    return str((int(code) - 1) // len(LABELS[level]) + 1)
+
+
+# Options of `level` under the value chosen above it; none for dates before FIRST_YEAR
+def options(level, parent, date):
+    if level not in LABELS or _year(date) < FIRST_YEAR:
+        return []
+    codes = child_codes(level, parent)
+    return [{"code": code, "desc": label} for code, label in zip(codes, LABELS[level])]
+
+
+# Building details the portal sends with the building-type options, once a floor is chosen
+def details(floor):
+    return {"fsi": "1.50", "sddrRate": str(5000 + 10 * int(floor)), "age": "12"}
+
+
+# The submitted ids must form one path down the tree, so a request templated with the
+# wrong level's value is refused rather than priced
+def check_path(values):
+    for level, above in zip(reversed(CASCADE), reversed(CASCADE[:-1])):
+        if parent_code(level, values[level]) != str(values[above]):
+            raise ValueError(f"{level}={values[level]} is not under {above}={values[above]}")
+
+
+def calculate(tax_id, carpet_area):
+    capital = float(carpet_area) * 1000 * (int(tax_id) % 97 + 1)
+    return {"capitalValue": int(capital), "totalTax": f"{capital * 0.002:.2f}"}
+
+
+# Serves tax_calculator.html and the JSON API its XHRs call:
+#   GET  /api/options?level=<select id>&parent=<value above>&date=<dd/mm/yyyy>
+#   POST /api/calculate  {"date": ..., <select id>: <value> for every dropdown, "carpetArea": ...}
+class Handler(SimpleHTTPRequestHandler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=FIXTURES_DIR, **kwargs)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/api/options":
+            query = {key: values[0] for key, values in parse_qs(url.query, keep_blank_values=True).items()}
+            level, parent = query.get("level", ""), query.get("parent", "")
+            reply = {"status": "OK", "data": options(level, parent, query.get("date", ""))}
+            if level == "ptasdNtbid" and parent:
+                reply["details"] = details(parent)
+            return self._json(reply)
+        return super().do_GET()
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/api/calculate":
+            return self._json({"status": "ERROR", "message": "not found"}, 404)
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        try:
+            check_path(body)
+            result = calculate(body["ptawdTaxId"], body["carpetArea"])
+        except (KeyError, ValueError) as e:
+            return self._json({"status": "ERROR", "message": str(e)}, 400)
+        self._json({"status": "OK", "result": result})
+
+    def _json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Start the stand-in on a background thread; returns the server and the page URL
+def serve(port=0):
+    httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=httpd.serve_forever, name="tax-calculator-fixture", daemon=True).start()
+    return httpd, f"http://127.0.0.1:{httpd.server_address[1]}/tax_calculator.html"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the local tax calculator stand-in")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    httpd, url = serve(args.port)
+    print(f"Tax calculator stand-in at {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        httpd.shutdown()
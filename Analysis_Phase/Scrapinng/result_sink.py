@@ -0,0 +1,232 @@
+import csv
+import glob
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+
+OUTPUT_BASE = "mcgm_tax_results"
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 5.0
+
+# Declared result schema: every row is written with exactly these columns, in this
+# order, whatever keys the scraper's dict happens to carry
+RESULT_FIELDS = [
+    "date", "ward", "zone", "subzone", "occupancy", "main_category", "sub_category", "tax_code",
+    "floor", "building_type", "fsi_factor", "fsi", "sddr_rate", "age_of_building",
+    "metered_unmetered", "carpet_area", "capital_value", "total_tax",
+]
+NUMERIC_FIELDS = {"fsi", "sddr_rate", "age_of_building", "carpet_area", "capital_value", "total_tax"}
+# One row per calculator input combination
+KEY_FIELDS = [
+    "date", "ward", "zone", "subzone", "occupancy", "main_category", "sub_category", "tax_code",
+    "floor", "building_type", "metered_unmetered", "carpet_area",
+]
+FORMATS = ("parquet", "sqlite", "csv")
+
+
+def _number(value):
+    try:
+        return float(str(value).replace(",", "").replace("₹", "").strip())
+    except ValueError:
+        return None
+
+
+# Coerce a scraped dict onto the schema; numbers like "1,23,456" become floats,
+# "N/A"/"ERROR" become nulls (the raw text is kept on error rows)
+def normalize(record, error=False):
+    row = {}
+    for field in RESULT_FIELDS:
+        value = record.get(field)
+        if field in NUMERIC_FIELDS and not error:
+            row[field] = _number(value) if value is not None else None
+        else:
+            row[field] = None if value is None else str(value)
+    return row
+
+
+# Combination key comparable across formats: numbers as floats, missing values as ""
+def row_key(row):
+    key = []
+    for field in KEY_FIELDS:
+        value = row[field]
+        if value is None or pd.isna(value):
+            key.append("")
+        elif field in NUMERIC_FIELDS and _number(value) is not None:
+            key.append(repr(_number(value)))
+        else:
+            key.append(str(value))
+    return tuple(key)
+
+
+# Buffered writer for scraper rows. Rows are held until BATCH_SIZE of them (or
+# FLUSH_INTERVAL seconds) accumulate and then written in one go; a combination already
+# stored is skipped. Results and errors are kept apart, and an error row is dropped
+# once the same combination succeeds: SQLite deletes it as the result is written, the
+# file formats rewrite their error output on open and close. Checkpoint keys handed in
+# with rows are only marked done after their batch is on disk, so a crash never skips
+# unwritten rows.
+class ResultSink:
+    def __init__(self, base=OUTPUT_BASE, fmt="parquet", checkpoint=None, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown output format {fmt!r}; expected one of {FORMATS}")
+        self.base = base
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.checkpoint = checkpoint
+        self.pending_done = []
+        self.lock = threading.Lock()
+        self.buffers = {False: [], True: []}
+        self.last_flush = time.monotonic()
+        self.seen = {False: set(), True: set()}
+        getattr(self, f"_open_{fmt}")()
+        self._compact_errors()
+
+    def write(self, record, error=False, checkpoint_key=None):
+        row = normalize(record, error)
+        key = row_key(row)
+        with self.lock:
+            if checkpoint_key is not None:
+                self.pending_done.append(checkpoint_key)
+            if key in self.seen[False] or key in self.seen[error]:
+                return False
+            self.seen[error].add(key)
+            self.buffers[error].append(row)
+            if (len(self.buffers[False]) + len(self.buffers[True]) >= self.batch_size
+                    or time.monotonic() - self.last_flush >= self.flush_interval):
+                self._flush()
+        return True
+
+    # Checkpoint a key with no row of its own (e.g. a finished prefix) once pending rows are written
+    def mark_done(self, checkpoint_key):
+        with self.lock:
+            self.pending_done.append(checkpoint_key)
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        for error in (False, True):
+            rows, self.buffers[error] = self.buffers[error], []
+            if rows:
+                getattr(self, f"_write_{self.fmt}")(rows, error)
+        done, self.pending_done = self.pending_done, []
+        if self.checkpoint is not None:
+            for key in done:
+                self.checkpoint.mark_done(key)
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self._compact_errors()
+            if self.fmt == "sqlite":
+                self.conn.close()
+
+    # Drop stored error rows whose combination has since succeeded
+    def _compact_errors(self):
+        resolved = self.seen[True] & self.seen[False]
+        if resolved and self.fmt != "sqlite":  # SQLite deletes them in _write_sqlite
+            getattr(self, f"_compact_{self.fmt}")(resolved)
+        self.seen[True] -= resolved
+
+    # SQLite: one file, results and errors tables keyed on the combination
+    def _open_sqlite(self):
+        self.conn = sqlite3.connect(f"{self.base}.db", check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        columns = ", ".join(f"{f} {'REAL' if f in NUMERIC_FIELDS else 'TEXT'}" for f in RESULT_FIELDS)
+        key = ", ".join(KEY_FIELDS)
+        for table in ("results", "errors"):
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns}, PRIMARY KEY ({key}))")
+        self.conn.commit()
+        for error, table in ((False, "results"), (True, "errors")):
+            rows = self.conn.execute(f"SELECT {key} FROM {table}")
+            self.seen[error].update(row_key(dict(zip(KEY_FIELDS, r))) for r in rows)
+
+    def _write_sqlite(self, rows, error):
+        table = "errors" if error else "results"
+        placeholders = ", ".join("?" for _ in RESULT_FIELDS)
+        values = [[r[f] for f in RESULT_FIELDS] for r in rows]
+        self.conn.executemany(f"INSERT OR IGNORE INTO {table} VALUES ({placeholders})", values)
+        if not error:
+            match = " AND ".join(f"{f} = ?" for f in KEY_FIELDS)
+            self.conn.executemany(f"DELETE FROM errors WHERE {match}", [[r[f] for f in KEY_FIELDS] for r in rows])
+        self.conn.commit()
+
+    # Parquet: a directory of part files per output, one part per flushed batch
+    def _dir(self, error):
+        return f"{self.base}_errors" if error else self.base
+
+    def _parts(self, error):
+        return sorted(glob.glob(os.path.join(self._dir(error), "part-*.parquet")))
+
+    def _open_parquet(self):
+        for error in (False, True):
+            os.makedirs(self._dir(error), exist_ok=True)
+            parts = self._parts(error)
+            if parts:
+                keys = pd.concat([pd.read_parquet(p, columns=KEY_FIELDS) for p in parts])
+                self.seen[error].update(row_key(r) for r in keys.to_dict("records"))
+        self.part = {e: len(self._parts(e)) for e in (False, True)}
+
+    def _write_parquet(self, rows, error):
+        frame = pd.DataFrame(rows, columns=RESULT_FIELDS)
+        for field in RESULT_FIELDS:
+            frame[field] = frame[field].astype("float64" if field in NUMERIC_FIELDS and not error else "string")
+        path = os.path.join(self._dir(error), f"part-{self.part[error]:05d}.parquet")
+        frame.to_parquet(path, index=False)
+        self.part[error] += 1
+
+    # The surviving error rows go into one new part, written before the old parts are removed
+    def _compact_parquet(self, resolved):
+        parts = self._parts(True)
+        frame = pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True)
+        keep = [row_key(r) not in resolved for r in frame[KEY_FIELDS].to_dict("records")]
+        tmp = os.path.join(self._dir(True), "compact.parquet.tmp")
+        frame[keep].to_parquet(tmp, index=False)
+        for path in parts:
+            os.remove(path)
+        if any(keep):
+            os.replace(tmp, os.path.join(self._dir(True), "part-00000.parquet"))
+        else:
+            os.remove(tmp)
+        self.part[True] = 1 if any(keep) else 0
+
+    # CSV: the legacy layout, with the header always the declared schema
+    def _path(self, error):
+        return "mcgm_errors.csv" if error else f"{self.base}.csv"
+
+    def _read_csv(self, error):
+        path = self._path(error)
+        if not (os.path.exists(path) and os.path.getsize(path)):
+            return []
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames != RESULT_FIELDS:
+                raise ValueError(f"{path} has columns {reader.fieldnames}, expected {RESULT_FIELDS}")
+            return list(reader)
+
+    def _open_csv(self):
+        for error in (False, True):
+            self.seen[error].update(row_key(normalize(r, error)) for r in self._read_csv(error))
+
+    def _compact_csv(self, resolved):
+        path = self._path(True)
+        rows = [r for r in self._read_csv(True) if row_key(normalize(r, error=True)) not in resolved]
+        with open(f"{path}.tmp", "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(f"{path}.tmp", path)
+
+    def _write_csv(self, rows, error):
+        path = self._path(error)
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            if f.tell() == 0:
+                writer.writeheader()
+            writer.writerows(rows)
@@ -1,206 +1,406 @@
-import time
-import csv
+import argparse
+import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import Select
+from selenium.webdriver.support.ui import Select, WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.firefox.service import Service
 from webdriver_manager.firefox import GeckoDriverManager
-from selenium.common.exceptions import NoSuchElementException
-from datetime import datetime, timedelta
+from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
+from result_sink import ResultSink, FORMATS
 
-# Setup driver
-driver = webdriver.Firefox(service=Service(GeckoDriverManager().install()))
-driver.get("https://ptaxportal.mcgm.gov.in/CitizenPortal/#/taxCalculator")
-time.sleep(5)
+PORTAL_URL = "https://ptaxportal.mcgm.gov.in/CitizenPortal/#/taxCalculator"
+CHECKPOINT_FILE = "mcgm_checkpoint.jsonl"
+COMBINATIONS_FILE = "mcgm_combinations.json"
+WAIT_TIMEOUT = 20
 
-OUTFILE = "mcgm_tax_results.csv"
-ERRORFILE = "mcgm_errors.csv"
+# Cascading dropdowns that define a unit of work; the leaf dropdowns below them
+# (floor, building type, meter, tax code) are expanded by the worker that owns the prefix
+PREFIX_LEVELS = [
+    ("ward", "ptashWardid"),
+    ("zone", "ptashZoneid"),
+    ("subzone", "ptashSubzoneid"),
+    ("occupancy", "ptasdOccuptpid"),
+    ("main_category", "ptasdUsrctgid"),
+    ("sub_category", "ptasdSusubctgid"),
+]
+
+# True once the page has no request in flight: AngularJS's $http queue on the portal,
+# a plain counter on the local stand-in page
+IDLE_SCRIPT = """
+    if (window.angular) {
+        var injector = angular.element(document.body).injector();
+        if (injector) return injector.get('$http').pendingRequests.length === 0;
+    }
+    return document.readyState === 'complete' && !window.__pendingRequests;
+"""
+
+OPTIONS_SCRIPT = """
+    var select = document.getElementById(arguments[0]);
+    if (!select) return [];
+    return Array.from(select.options).filter(function (o) { return o.value; })
+                .map(function (o) { return [o.value, o.text.trim()]; });
+"""
+
+# Blank the result panel before submitting so the wait can tell a fresh result from the last one
+CLEAR_RESULTS_SCRIPT = """
+    document.querySelectorAll('label').forEach(function (label) {
+        if (label.textContent === 'Capital Value' || label.textContent === 'Total Tax') {
+            var value = label.nextElementSibling;
+            if (value) value.textContent = '';
+        }
+    });
+"""
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def new_driver(headless=True):
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            _driver_path = GeckoDriverManager().install()
+    options = Options()
+    if headless:
+        options.add_argument("-headless")
+    return webdriver.Firefox(service=Service(_driver_path), options=options)
 
-def get_options(select_id):
-    try:
-        select = Select(driver.find_element(By.ID, select_id))
-        return [opt for opt in select.options if opt.get_attribute("value")]
-    except:
-        return []
 
-def is_disabled(select_id):
+def wait_idle(driver, timeout=WAIT_TIMEOUT):
+    WebDriverWait(driver, timeout, poll_frequency=0.1).until(lambda d: d.execute_script(IDLE_SCRIPT))
+
+
+def open_calculator(driver, url):
+    driver.get(url)
+    WebDriverWait(driver, WAIT_TIMEOUT).until(EC.presence_of_element_located((By.ID, "ptasdDoeffect")))
+    wait_idle(driver)
+
+
+# [(value, text), ...] of a dropdown in one round trip
+def get_options(driver, select_id):
+    return [tuple(option) for option in driver.execute_script(OPTIONS_SCRIPT, select_id)]
+
+
+def is_disabled(driver, select_id):
     try:
         return driver.find_element(By.ID, select_id).get_attribute("disabled") is not None
     except NoSuchElementException:
         return True
 
-def select_by_value(select_id, value):
-    try:
-        Select(driver.find_element(By.ID, select_id)).select_by_value(value)
-        time.sleep(1)
-    except:
-        pass
 
-def get_field_value(field_id):
+def select_by_value(driver, select_id, value):
+    Select(driver.find_element(By.ID, select_id)).select_by_value(value)
+    wait_idle(driver)
+
+
+def get_field_value(driver, field_id):
     try:
         return driver.find_element(By.ID, field_id).get_attribute("value").strip()
-    except:
+    except NoSuchElementException:
         return "N/A"
 
-def prompt_date():
-    user_input = input("📅 Enter starting 'Date of Effect' (dd/mm/yyyy): ").strip()
-    try:
-        return datetime.strptime(user_input, "%d/%m/%Y")
-    except ValueError:
-        print("❌ Invalid format. Using default: 24/06/2025")
-        return datetime(2025, 6, 24)
 
-def find_valid_date(start_date):
+def find_valid_date(driver, start_date):
     date_field = driver.find_element(By.ID, "ptasdDoeffect")
     current = start_date
     while current.year >= 2020:
         date_str = current.strftime("%d/%m/%Y")
-        try:
-            date_field.clear()
-            date_field.send_keys(date_str)
-            time.sleep(1)
-            if not is_disabled("ptashZoneid"):
-                print(f"✅ Using valid date: {date_str}")
-                return date_str
-        except:
-            pass
+        date_field.clear()
+        date_field.send_keys(date_str)
+        wait_idle(driver)
+        if not is_disabled(driver, "ptashZoneid"):
+            print(f"✅ Using valid date: {date_str}")
+            return date_str
         current -= timedelta(days=30)
     raise Exception("❌ Could not find a valid date.")
 
-def save_row(data, error=False):
-    target_file = ERRORFILE if error else OUTFILE
-    file_exists = os.path.exists(target_file)
-    with open(target_file, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=data.keys())
-        if not file_exists or f.tell() == 0:
-            writer.writeheader()
-        writer.writerow(data)
-
-# Prompt date and validate
-user_start_date = prompt_date()
-valid_date = find_valid_date(user_start_date)
-carpet_area = str(int(input("Enter the carpet area: ").strip())) or "50"
-
-# Begin dropdown traversal
-for ward in get_options("ptashWardid"):
-    select_by_value("ptashWardid", ward.get_attribute("value"))
-
-    for zone in get_options("ptashZoneid"):
-        select_by_value("ptashZoneid", zone.get_attribute("value"))
-
-        for subzone in get_options("ptashSubzoneid"):
-            select_by_value("ptashSubzoneid", subzone.get_attribute("value"))
-
-            for occup in get_options("ptasdOccuptpid"):
-                select_by_value("ptasdOccuptpid", occup.get_attribute("value"))
-
-                for main_cat in get_options("ptasdUsrctgid"):
-                    select_by_value("ptasdUsrctgid", main_cat.get_attribute("value"))
-
-                    for sub_cat in get_options("ptasdSusubctgid"):
-                        select_by_value("ptasdSusubctgid", sub_cat.get_attribute("value"))
-
-                        floor_options = get_options("ptasdFloorid") if not is_disabled("ptasdFloorid") else [None]
-                        for floor in floor_options:
-                            if floor:
-                                select_by_value("ptasdFloorid", floor.get_attribute("value"))
-                                floor_val = floor.text
-                            else:
-                                floor_val = "N/A"
-
-                            btype_options = get_options("ptasdNtbid") if not is_disabled("ptasdNtbid") else [None]
-                            for btype in btype_options:
-                                if btype:
-                                    select_by_value("ptasdNtbid", btype.get_attribute("value"))
-                                    btype_val = btype.text
-                                else:
-                                    btype_val = "N/A"
-
-                                fsi_factor_val = "N/A"
-                                if not is_disabled("ptasdFsifact"):
-                                    fsi_factors = get_options("ptasdFsifact")
-                                    if fsi_factors:
-                                        select_by_value("ptasdFsifact", fsi_factors[0].get_attribute("value"))
-                                        fsi_factor_val = fsi_factors[0].text
-
-                                for meter in get_options("ptasdMetertype"):
-                                    select_by_value("ptasdMetertype", meter.get_attribute("value"))
-
-                                    try:
-                                        area_field = driver.find_element(By.ID, "ptasdTcptarea")
-                                        area_field.clear()
-                                        area_field.send_keys(carpet_area)
-                                    except:
-                                        print("❌ Area field not found or not editable.")
-                                        continue
-
-                                    tax_options = get_options("ptawdTaxId") if not is_disabled("ptawdTaxId") else []
-                                    print("Tax options found:", len(tax_options))
-                                    if tax_options:
-                                        for tax in tax_options:
-                                            select_by_value("ptawdTaxId", tax.get_attribute("value"))
-                                            tax_code_val = tax.text
-
-                                            try:
-                                                driver.find_element(By.ID, "btn_submit").click()
-                                                time.sleep(2)
-                                                cap_value = driver.find_element(By.XPATH, '//label[text()="Capital Value"]/following-sibling::div').text.strip()
-                                                total_tax = driver.find_element(By.XPATH, '//label[text()="Total Tax"]/following-sibling::div').text.strip()
-                                            except:
-                                                cap_value = "ERROR"
-                                                total_tax = "ERROR"
-
-                                            record = {
-                                                "date": valid_date,
-                                                "ward": ward.text,
-                                                "zone": zone.text,
-                                                "subzone": subzone.text,
-                                                "occupancy": occup.text,
-                                                "main_category": main_cat.text,
-                                                "sub_category": sub_cat.text,
-                                                "tax_code": tax_code_val,
-                                                "floor": floor_val,
-                                                "building_type": btype_val,
-                                                "fsi_factor": fsi_factor_val,
-                                                "fsi": get_field_value("ptasdFsi"),
-                                                "sddr_rate": get_field_value("ptasdSddrrate"),
-                                                "age_of_building": get_field_value("ptasdAge"),
-                                                "metered_unmetered": meter.text,
-                                                "carpet_area": "50",
-                                                "capital_value": cap_value,
-                                                "total_tax": total_tax
-                                            }
-
-                                            if cap_value == "ERROR" or total_tax == "ERROR":
-                                                print(f"[❌ ERROR] {record}")
-                                                save_row(record, error=True)
-                                            else:
-                                                print(f"[✅ SAVED] {record}")
-                                                save_row(record)
-                                    else:
-                                        record = {
-                                            "date": valid_date,
-                                            "ward": ward.text,
-                                            "zone": zone.text,
-                                            "subzone": subzone.text,
-                                            "occupancy": occup.text,
-                                            "main_category": main_cat.text,
-                                            "sub_category": sub_cat.text,
-                                            "tax_code": "N/A",
-                                            "floor": floor_val,
-                                            "building_type": btype_val,
-                                            "fsi_factor": fsi_factor_val,
-                                            "fsi": get_field_value("ptasdFsi"),
-                                            "sddr_rate": get_field_value("ptasdSddrrate"),
-                                            "age_of_building": get_field_value("ptasdAge"),
-                                            "metered_unmetered": meter.text,
-                                            "carpet_area": "50",
-                                            "capital_value": "N/A",
-                                            "total_tax": "N/A"
-                                        }
-                                        print(f"[❌ ERROR] No tax options available. {record}")
-                                        save_row(record, error=True)
-
-print("✅ Scraping complete.")
-driver.quit()
+
+# Completed combinations, one JSON key per line. Appending keeps marking a tuple done
+# O(1) however long the sweep gets; the file is read back into a set on start.
+class Checkpoint:
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self.done.add(tuple(json.loads(line)))
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __contains__(self, key):
+        return tuple(key) in self.done
+
+    def mark_done(self, key):
+        key = tuple(key)
+        with self.lock:
+            if key in self.done:
+                return
+            self.done.add(key)
+            self._file.write(json.dumps(key) + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self.lock:
+            self._file.close()
+
+
+# Walk the cascading prefix dropdowns once and list every prefix as [(value, text), ...].
+# Only selects are issued here, no submits, so this is a small fraction of a sweep.
+def enumerate_prefixes(driver, level=0, chosen=()):
+    if level == len(PREFIX_LEVELS):
+        return [list(chosen)]
+    _, select_id = PREFIX_LEVELS[level]
+    prefixes = []
+    for value, text in get_options(driver, select_id):
+        select_by_value(driver, select_id, value)
+        prefixes.extend(enumerate_prefixes(driver, level + 1, chosen + ((value, text),)))
+    return prefixes
+
+
+def load_prefixes(url, start_date, refresh=False, headless=True):
+    if os.path.exists(COMBINATIONS_FILE) and not refresh:
+        with open(COMBINATIONS_FILE, encoding="utf-8") as f:
+            saved = json.load(f)
+        return saved["date"], [[tuple(option) for option in prefix] for prefix in saved["prefixes"]]
+
+    driver = new_driver(headless)
+    try:
+        open_calculator(driver, url)
+        date = find_valid_date(driver, start_date)
+        prefixes = enumerate_prefixes(driver)
+    finally:
+        driver.quit()
+    tmp = COMBINATIONS_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"date": date, "prefixes": prefixes}, f)
+    os.replace(tmp, COMBINATIONS_FILE)
+    return date, prefixes
+
+
+def optional_options(driver, select_id):
+    return get_options(driver, select_id) if not is_disabled(driver, select_id) else [None]
+
+
+def submit(driver):
+    driver.execute_script(CLEAR_RESULTS_SCRIPT)
+    driver.find_element(By.ID, "btn_submit").click()
+    value_xpath = '//label[text()="{}"]/following-sibling::div'
+    WebDriverWait(driver, WAIT_TIMEOUT, poll_frequency=0.1).until(
+        lambda d: d.find_element(By.XPATH, value_xpath.format("Total Tax")).text.strip()
+    )
+    cap_value = driver.find_element(By.XPATH, value_xpath.format("Capital Value")).text.strip()
+    total_tax = driver.find_element(By.XPATH, value_xpath.format("Total Tax")).text.strip()
+    return cap_value, total_tax
+
+
+# One browser per worker thread, opened on the calculator with the date already set
+class Worker:
+    def __init__(self, url, date, carpet_area, checkpoint, sink, headless=True):
+        self.url = url
+        self.date = date
+        self.carpet_area = carpet_area
+        self.checkpoint = checkpoint
+        self.sink = sink
+        self.headless = headless
+        self.driver = None
+        self.selected = {}
+
+    def start(self):
+        self.driver = new_driver(self.headless)
+        self.selected = {}
+        open_calculator(self.driver, self.url)
+        date_field = self.driver.find_element(By.ID, "ptasdDoeffect")
+        date_field.clear()
+        date_field.send_keys(self.date)
+        wait_idle(self.driver)
+
+    def quit(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except WebDriverException:
+                pass
+            self.driver = None
+
+    def select(self, select_id, value):
+        select_by_value(self.driver, select_id, value)
+        self.selected[select_id] = value
+
+    # Re-select the prefix; levels that already hold the right value (shared with the
+    # previous prefix) are left alone, everything below the first change is reselected
+    def select_prefix(self, prefix):
+        changed = False
+        for (_, select_id), (value, _) in zip(PREFIX_LEVELS, prefix):
+            if changed or self.selected.get(select_id) != value:
+                self.select(select_id, value)
+                changed = True
+
+    # Sweep every leaf under `prefix`. The prefix is checkpointed as a whole ("*") only if
+    # every leaf was stored; otherwise a rerun revisits it and retries the failed leaves.
+    def scrape_prefix(self, prefix):
+        driver = self.driver
+        self.select_prefix(prefix)
+        base_key = [value for value, _ in prefix]
+        base = {name: text for (name, _), (_, text) in zip(PREFIX_LEVELS, prefix)}
+        base["date"] = self.date
+        complete = True
+
+        for floor in optional_options(driver, "ptasdFloorid"):
+            if floor:
+                self.select("ptasdFloorid", floor[0])
+
+            for btype in optional_options(driver, "ptasdNtbid"):
+                if btype:
+                    self.select("ptasdNtbid", btype[0])
+
+                fsi_factor_val = "N/A"
+                if not is_disabled(driver, "ptasdFsifact"):
+                    fsi_factors = get_options(driver, "ptasdFsifact")
+                    if fsi_factors:
+                        self.select("ptasdFsifact", fsi_factors[0][0])
+                        fsi_factor_val = fsi_factors[0][1]
+
+                for meter in get_options(driver, "ptasdMetertype"):
+                    self.select("ptasdMetertype", meter[0])
+
+                    try:
+                        area_field = driver.find_element(By.ID, "ptasdTcptarea")
+                        area_field.clear()
+                        area_field.send_keys(self.carpet_area)
+                    except (NoSuchElementException, WebDriverException):
+                        print("❌ Area field not found or not editable.")
+                        complete = False
+                        continue
+
+                    record = {
+                        "date": self.date,
+                        "ward": base["ward"],
+                        "zone": base["zone"],
+                        "subzone": base["subzone"],
+                        "occupancy": base["occupancy"],
+                        "main_category": base["main_category"],
+                        "sub_category": base["sub_category"],
+                        "tax_code": "N/A",
+                        "floor": floor[1] if floor else "N/A",
+                        "building_type": btype[1] if btype else "N/A",
+                        "fsi_factor": fsi_factor_val,
+                        "fsi": get_field_value(driver, "ptasdFsi"),
+                        "sddr_rate": get_field_value(driver, "ptasdSddrrate"),
+                        "age_of_building": get_field_value(driver, "ptasdAge"),
+                        "metered_unmetered": meter[1],
+                        "carpet_area": self.carpet_area,
+                        "capital_value": "N/A",
+                        "total_tax": "N/A",
+                    }
+                    leaf_key = base_key + [floor[0] if floor else None, btype[0] if btype else None, meter[0]]
+
+                    tax_options = get_options(driver, "ptawdTaxId") if not is_disabled(driver, "ptawdTaxId") else []
+                    if not tax_options:
+                        if leaf_key not in self.checkpoint:
+                            print(f"[❌ ERROR] No tax options available. {record}")
+                            self.sink.write(record, error=True, checkpoint_key=leaf_key)
+                        continue
+
+                    for tax_value, tax_text in tax_options:
+                        key = leaf_key + [tax_value]
+                        if key in self.checkpoint:
+                            continue
+                        self.select("ptawdTaxId", tax_value)
+                        try:
+                            cap_value, total_tax = submit(driver)
+                        except (NoSuchElementException, TimeoutException):
+                            cap_value = total_tax = "ERROR"
+
+                        row = dict(record, tax_code=tax_text, capital_value=cap_value, total_tax=total_tax)
+                        if cap_value == "ERROR" or total_tax == "ERROR":
+                            print(f"[❌ ERROR] {row}")
+                            self.sink.write(row, error=True)
+                            complete = False
+                        else:
+                            print(f"[✅ SAVED] {row}")
+                            self.sink.write(row, checkpoint_key=key)
+
+        if complete:
+            self.sink.mark_done(base_key + ["*"])
+        return complete
+
+
+# Run the prefixes on a pool of headless browsers. Each thread keeps its own driver;
+# a prefix whose browser dies is retried once on a fresh one. Returns the prefixes that
+# failed or still have leaves to retry.
+def run_pool(prefixes, url, date, carpet_area, checkpoint, sink, workers=4, headless=True):
+    local = threading.local()
+    all_workers = []
+    workers_lock = threading.Lock()
+
+    def worker():
+        if not hasattr(local, "worker"):
+            local.worker = Worker(url, date, carpet_area, checkpoint, sink, headless)
+            with workers_lock:
+                all_workers.append(local.worker)
+        if local.worker.driver is None:
+            local.worker.start()
+        return local.worker
+
+    def run(prefix):
+        for attempt in range(2):
+            try:
+                return None if worker().scrape_prefix(prefix) else prefix
+            except (WebDriverException, TimeoutException) as e:
+                print(f"[Worker error] {[text for _, text in prefix]}: {e.__class__.__name__}")
+                local.worker.quit()
+        return prefix
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return [prefix for prefix in pool.map(run, prefixes) if prefix is not None]
+    finally:
+        for w in all_workers:
+            w.quit()
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%d/%m/%Y")
+    except ValueError:
+        print("❌ Invalid format. Using default: 24/06/2025")
+        return datetime(2025, 6, 24)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep the MCGM property tax calculator")
+    parser.add_argument("--url", default=PORTAL_URL, help="portal URL, or the local stand-in page")
+    parser.add_argument("--date", default="24/06/2025", help="starting 'Date of Effect' (dd/mm/yyyy)")
+    parser.add_argument("--carpet-area", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4, help="parallel headless browsers")
+    parser.add_argument("--shard", default="0/1", help="i/n: take every n-th prefix starting at i")
+    parser.add_argument("--format", choices=FORMATS, default="parquet", help="result storage")
+    parser.add_argument("--refresh-combinations", action="store_true", help="re-enumerate the dropdown tree")
+    parser.add_argument("--headed", action="store_true", help="show the browsers")
+    args = parser.parse_args()
+
+    shard, shards = map(int, args.shard.split("/"))
+    valid_date, prefixes = load_prefixes(args.url, parse_date(args.date), args.refresh_combinations, not args.headed)
+    checkpoint = Checkpoint()
+    sink = ResultSink(fmt=args.format, checkpoint=checkpoint)
+    pending = [p for i, p in enumerate(prefixes)
+               if i % shards == shard and [v for v, _ in p] + ["*"] not in checkpoint]
+    print(f"{len(prefixes)} prefixes enumerated, {len(pending)} left in shard {args.shard}.")
+
+    try:
+        failed = run_pool(pending, args.url, valid_date, str(args.carpet_area), checkpoint, sink,
+                          workers=args.workers, headless=not args.headed)
+    finally:
+        sink.close()
+        checkpoint.close()
+    if failed:
+        print(f"⚠️ {len(failed)} prefixes failed; rerun to retry them.")
+    print("✅ Scraping complete.")
@@ -0,0 +1,165 @@
+import shutil
+import sqlite3
+import pytest
+
+pytest.importorskip("selenium")
+
+import requests
+import api_scraper
+from api_scraper import ApiReplayer, LEVELS, capture, fill, http_session, run, templatize, verify
+from fixtures import server
+from result_sink import ResultSink
+from scraper import Checkpoint, parse_date
+
+needs_firefox = pytest.mark.skipif(shutil.which("firefox") is None, reason="needs Firefox to drive the calculator page")
+
+
+class ListSink:
+    def __init__(self):
+        self.rows = []
+        self.done = []
+
+    def write(self, record, error=False, checkpoint_key=None):
+        self.rows.append((record, error, checkpoint_key))
+
+    def mark_done(self, key):
+        self.done.append(key)
+
+
+# Ids numbered per table collide across levels, with the host and port, and inside longer values
+def test_templatize_replaces_named_values_only():
+    chosen = [("date", "24/06/2025"), ("ptashWardid", "1"), ("ptashZoneid", "12")]
+    url = "http://10.1.1.1:1/api/1/options?level=ptashSubzoneid&parent=12&date=24%2F06%2F2025&limit=120"
+    template = templatize(url, chosen)
+    assert template == "http://10.1.1.1:1/api/1/options?level=ptashSubzoneid&parent=${ptashZoneid|q}" \
+                       "&date=${date|q}&limit=120"
+    assert fill(template, dict(chosen)) == url
+    assert fill(template, {"date": "01/07/2025", "ptashZoneid": "7"}).endswith(
+        "parent=7&date=01%2F07%2F2025&limit=120")
+
+    body = '{"date":"24/06/2025","wardId":"1","zoneId":12,"note":"ward 1","codes":[1],"area":"112"}'
+    template = templatize(body, chosen)
+    assert template == ('{"date":"${date}","wardId":"${ptashWardid}","zoneId":${ptashZoneid},'
+                        '"note":"ward 1","codes":[1],"area":"112"}')
+    assert fill(template, dict(chosen)) == body
+
+    assert templatize("ward=1&zone=12&page=112", chosen) == "ward=${ptashWardid|q}&zone=${ptashZoneid|q}&page=112"
+
+
+# When two levels chose the same id, a parameter carrying it belongs to the deeper level
+def test_templatize_attributes_shared_values_to_deepest_level():
+    chosen = [("ptashWardid", "1"), ("ptashZoneid", "1")]
+    assert templatize("http://portal/api/options?parent=1", chosen) == "http://portal/api/options?parent=${ptashZoneid|q}"
+
+
+# Replayer answering from a fixed tree: one option per level, two tax codes; calculate()
+# fails for the tax codes in `failing`
+class StubReplayer(ApiReplayer):
+    def __init__(self):
+        super().__init__({"date": "24/06/2025", "levels": [{"select_id": select_id} for _, select_id in LEVELS]},
+                         session=None)
+        self.failing = set()
+        self.submitted = []
+
+    def level(self, index, values):
+        if LEVELS[index][1] == "ptawdTaxId":
+            return [("1", "General"), ("2", "Water")], {}
+        return [("1", LEVELS[index][0])], {"fsi": "1.50"}
+
+    def calculate(self, values):
+        self.submitted.append(values["ptawdTaxId"])
+        if values["ptawdTaxId"] in self.failing:
+            raise requests.ConnectionError("connection reset")
+        return "100000", "200.00"
+
+
+def sweep(tmp_path, replayer):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.jsonl"))
+    sink = ResultSink(str(tmp_path / "results"), fmt="sqlite", checkpoint=checkpoint)
+    try:
+        return run(replayer, "50", checkpoint, sink, workers=2)
+    finally:
+        sink.close()
+        checkpoint.close()
+
+
+def stored(tmp_path, table):
+    with sqlite3.connect(tmp_path / "results.db") as conn:
+        return sorted(row[0] for row in conn.execute(f"SELECT tax_code FROM {table}"))
+
+
+def test_prefix_with_failed_leaf_is_retried_on_resume(tmp_path):
+    replayer = StubReplayer()
+    replayer.failing = {"2"}
+    assert len(sweep(tmp_path, replayer)) == 1
+    assert stored(tmp_path, "results") == ["General"]
+    assert stored(tmp_path, "errors") == ["Water"]
+
+    # The prefix wasn't checkpointed, so the rerun revisits it and submits only the failed leaf
+    replayer.failing = set()
+    replayer.submitted.clear()
+    assert sweep(tmp_path, replayer) == []
+    assert replayer.submitted == ["2"]
+    assert stored(tmp_path, "results") == ["General", "Water"]
+    assert stored(tmp_path, "errors") == []
+
+    replayer.submitted.clear()
+    assert sweep(tmp_path, replayer) == []
+    assert replayer.submitted == []
+
+
+@pytest.fixture(scope="module")
+def calculator():
+    httpd, url = server.serve()
+    try:
+        yield url
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+@pytest.fixture(scope="module")
+def spec(calculator):
+    return capture(calculator, parse_date("24/06/2025"), "50")
+
+
+@needs_firefox
+def test_capture_infers_every_level(spec):
+    assert [level["select_id"] for level in spec["levels"]] == [select_id for _, select_id in LEVELS]
+    assert all(level["requests"] for level in spec["levels"])
+    building = spec["levels"][LEVELS.index(("building_type", "ptasdNtbid"))]
+    assert building["requests"][0]["fields"].keys() == {"fsi", "sddr_rate", "age_of_building"}
+    # Each level chose an id no level above had used
+    values = [value for name, value in spec["captured"]["values"].items() if name != "date"]
+    assert len(values) == len(set(values))
+
+
+# The recording alone reproduces what Selenium read off the page
+@needs_firefox
+def test_offline_replay_matches_browser(spec):
+    assert verify(spec)
+
+
+# Replayed over HTTP, the captured path gives the browser's values, and every combination
+# gives what the backend computes for it (the backend refuses ids that aren't one path)
+@needs_firefox
+def test_online_replay_matches_backend(spec, tmp_path, monkeypatch):
+    replayer = ApiReplayer(spec, http_session(4))
+    captured = spec["captured"]
+    assert replayer.calculate(captured["values"]) == (captured["capital_value"], captured["total_tax"])
+
+    # Two wards is 2**10 leaves; one ward keeps the sweep quick
+    monkeypatch.setitem(server.LABELS, "ptashWardid", ["A"])
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.jsonl"))
+    sink = ListSink()
+    try:
+        assert run(replayer, "50", checkpoint, sink, workers=4) == []
+    finally:
+        checkpoint.close()
+    assert len(sink.rows) == 2 ** 9
+    floor = len(api_scraper.PREFIX_LEVELS)
+    for record, error, key in sink.rows:
+        assert not error
+        assert record["sddr_rate"] == server.details(key[floor])["sddrRate"]
+        expected = server.calculate(key[-1], "50")
+        assert (record["capital_value"], record["total_tax"]) == (str(expected["capitalValue"]), expected["totalTax"])
@@ -0,0 +1,90 @@
+import sqlite3
+import pytest
+
+pytest.importorskip("selenium")
+
+import scraper
+from result_sink import ResultSink
+from scraper import Checkpoint, Worker
+from selenium.common.exceptions import TimeoutException
+
+PREFIX = [("1", "A"), ("1", "Zone 1"), ("1", "1A"), ("1", "Owner"), ("1", "Residential"), ("1", "Flat")]
+# Dropdowns below the prefix; building type and FSI factor are disabled on this branch
+OPTIONS = {
+    "ptasdFloorid": [("1", "Ground")],
+    "ptasdMetertype": [("1", "Metered")],
+    "ptawdTaxId": [("1", "General"), ("2", "Water")],
+}
+
+
+class FakeField:
+    def clear(self):
+        pass
+
+    def send_keys(self, value):
+        pass
+
+
+class FakeDriver:
+    def find_element(self, by, element_id):
+        return FakeField()
+
+
+# Page helpers answered from OPTIONS; submit() fails for the tax codes in `failing`
+@pytest.fixture
+def page(monkeypatch):
+    state = {"selected": {}, "failing": set(), "submitted": []}
+
+    def submit(driver):
+        tax = state["selected"]["ptawdTaxId"]
+        state["submitted"].append(tax)
+        if tax in state["failing"]:
+            raise TimeoutException("no result")
+        return "1,00,000", "200.00"
+
+    monkeypatch.setattr(scraper, "get_options", lambda driver, select_id: OPTIONS.get(select_id, []))
+    monkeypatch.setattr(scraper, "is_disabled", lambda driver, select_id: select_id not in OPTIONS)
+    monkeypatch.setattr(scraper, "select_by_value",
+                        lambda driver, select_id, value: state["selected"].__setitem__(select_id, value))
+    monkeypatch.setattr(scraper, "get_field_value", lambda driver, field_id: "1.5")
+    monkeypatch.setattr(scraper, "submit", submit)
+    return state
+
+
+def sweep(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.jsonl"))
+    sink = ResultSink(str(tmp_path / "results"), fmt="sqlite", checkpoint=checkpoint)
+    worker = Worker("http://calculator", "24/06/2025", "50", checkpoint, sink)
+    worker.driver = FakeDriver()
+    try:
+        if [value for value, _ in PREFIX] + ["*"] in checkpoint:
+            return None
+        return worker.scrape_prefix(PREFIX)
+    finally:
+        sink.close()
+        checkpoint.close()
+
+
+def stored(tmp_path, table):
+    with sqlite3.connect(tmp_path / "results.db") as conn:
+        return sorted(row[0] for row in conn.execute(f"SELECT tax_code FROM {table}"))
+
+
+def test_prefix_with_failed_leaf_is_retried_on_resume(tmp_path, page):
+    page["failing"] = {"2"}
+    assert sweep(tmp_path) is False
+    assert stored(tmp_path, "results") == ["General"]
+    assert stored(tmp_path, "errors") == ["Water"]
+
+    # The prefix wasn't checkpointed, so the rerun visits it and submits only the failed leaf
+    page["failing"] = set()
+    page["submitted"].clear()
+    assert sweep(tmp_path) is True
+    assert page["submitted"] == ["2"]
+    assert stored(tmp_path, "results") == ["General", "Water"]
+    assert stored(tmp_path, "errors") == []
+
+    # Now complete, the prefix is skipped outright
+    page["submitted"].clear()
+    assert sweep(tmp_path) is None
+    assert page["submitted"] == []
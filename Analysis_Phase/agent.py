@@ -1,14 +1,31 @@
 import os
 import re
-import time
-from openai import OpenAI
-from db import run_sql
-from logger import log, fetch_logs_for_table, format_logs_as_context
 import pandas as pd
+from db import MAX_ROWS
+from query_cache import cached_run_sql, normalize_sql, fingerprint
+from sql_guard import validate, check_cost
+from result_format import render_result, persist_result, PREVIEW_ROWS
+from logger import log, format_logs_as_context
+from log_store import fetch_logs_for_table
+from rag import get_index, retrieve_context
+from prompt_builder import Conversation, PROMPT_TOKEN_BUDGET
+from profiler import profile_table, parse_columns, parse_num_rows, format_profile
+from relationships import get_graph, format_relationships
+from scheduler import Checkpoint, run_concurrently, CHECKPOINT_PATH
+from llm_gateway import LLMGateway
+from tracing import span, get_tracer, summarize, format_summary, write_prometheus, TRACING
 
-client = OpenAI(api_key=os.getenv("MISTRAL_API_KEY"), base_url="https://api.mistral.ai/v1")
 model_id = "mistral-small-latest"
 
+# Scheduler defaults (overridable from main.py)
+WORKERS = int(os.getenv("AGENT_WORKERS", "4"))
+REQUESTS_PER_SECOND = float(os.getenv("MISTRAL_RPS", "0.9"))
+MAX_ROUNDS = 5
+
+# Related findings pulled from the vector index into each table's prompt
+RAG_TOP_K = 8
+RAG_TOKEN_BUDGET = 600
+
 SYSTEM_PROMPT = [
     {
         "role": "system",
@@ -56,86 +73,154 @@ SYSTEM_PROMPT = [
 
 
 def extract_table_name(schema: str) -> str:
-    match = re.search(r"CREATE\s+TABLE\s+(\w+)", schema, re.IGNORECASE)
+    match = re.search(r"^Table:\s*(\w+)", schema, re.MULTILINE)
+    if not match:
+        match = re.search(r"CREATE\s+TABLE\s+(\w+)", schema, re.IGNORECASE)
     return match.group(1) if match else "unknown_table"
 
-def clean_cell(val):
-    if isinstance(val, bytes):
-        try:
-            return val.decode("utf-8", errors="replace")
-        except:
-            return "<binary>"
-    elif isinstance(val, (list, tuple)):
-        return str([clean_cell(v) for v in val])
-    elif val is None:
-        return ""
-    return str(val)
-
-def process_schema_chunks(chunks, start_index=0):
-    for step, schema in enumerate(chunks[start_index:], start=start_index):
-        table_name = extract_table_name(schema)
+def analyze_table(step, schema, gateway, max_rounds=MAX_ROUNDS):
+    table_name = extract_table_name(schema)
+    with span("table", step=step, table_name=table_name):
+        _analyze_table(step, schema, table_name, gateway, max_rounds)
+
+
+def _analyze_table(step, schema, table_name, gateway, max_rounds):
+    with span("log_lookup") as s:
         previous_logs = fetch_logs_for_table(table_name)
-        prior_context = format_logs_as_context(previous_logs)
-
-        executed_queries = {row[1] for row in previous_logs if row[1]}
-        rounds = 0
-        table_done = False
-
-        while not table_done and rounds < 5:
-            rounds += 1
-
-            messages = SYSTEM_PROMPT + [{
-                "role": "user",
-                "content": f"Schema:\n{schema.strip()}\n\nPrevious analysis:\n{prior_context}"
-            }]
-
-            time.sleep(1.1)  # Mistral rate limit
-
-            response = client.chat.completions.create(
-                model=model_id,
-                messages=messages,
-                temperature=0.7
-            )
-            msg = response.choices[0].message.content
-            print(f"\nStep {step+1} - Round {rounds}\n{msg}")
-
-            sql_match = re.search(r"SQL:\s*```sql\s*(.*?)\s*```", msg, re.DOTALL | re.IGNORECASE)
-            if not sql_match:
-                sql_match = re.search(r"SQL:\s*(SELECT .*?)(?:\n|$)", msg, re.DOTALL | re.IGNORECASE)
-
-            explanation = re.search(r"Explanation:\s*(.*)", msg, re.DOTALL | re.IGNORECASE)
-            error = re.search(r"Error:\s*(.*)", msg, re.DOTALL | re.IGNORECASE)
-
-            sql_text = sql_match.group(1).strip().rstrip(";") if sql_match else None
-            explanation_text = explanation.group(1).strip() if explanation else ""
-            error_text = error.group(1).strip() if error else ""
-
-            print(explanation_text)
-
-            if sql_text:
-                if sql_text in executed_queries:
-                    print("[Duplicate query. Skipping.]")
-                    break
-
-                result = run_sql(sql_text)
-                if isinstance(result, str) and result.startswith("Error"):
-                    error_text = result
-                    result_preview = error_text
-                else:
-                    if isinstance(result, str):
-                        result_preview = result
-                    else:
-                        safe_result = result.copy()
-                        for col in safe_result.columns:
-                            safe_result[col] = safe_result[col].apply(clean_cell)
-
-                        result_preview = safe_result.head(5).to_markdown(index=False)
-
-                print(result_preview)
-                executed_queries.add(sql_text)
-                log(step, sql_text, str(result), explanation_text, error_text)
+        s.set(rows=len(previous_logs))
+    prior_context = format_logs_as_context(previous_logs)
+    with span("rag_retrieve"):
+        related = retrieve_context(get_index(), schema, k=RAG_TOP_K, token_budget=RAG_TOKEN_BUDGET)
+    if related:
+        prior_context += f"\n\nRelated findings from other tables:\n{related}"
+
+    # Generic facts (counts, nulls, distincts, ranges, dummy values) come from one
+    # aggregate query instead of several LLM rounds
+    with span("profile"):
+        profile = format_profile(profile_table(table_name, parse_columns(schema), num_rows=parse_num_rows(schema)))
+    relationships = format_relationships(table_name, get_graph())
+    if relationships:
+        profile += f"\n\nVerified relationships (declared FKs and key-overlap checks):\n{relationships}"
+
+    executed_queries = {normalize_sql(row[1]) for row in previous_logs if row[1]}
+    conversation = Conversation(
+        SYSTEM_PROMPT,
+        f"Schema:\n{schema.strip()}\n\n"
+        f"Precomputed profile (already known, do not re-query these facts):\n{profile}\n\n"
+        f"Previous analysis:\n{prior_context}",
+        budget=PROMPT_TOKEN_BUDGET,
+    )
+    rounds = 0
+    table_done = False
+
+    while not table_done and rounds < max_rounds:
+        rounds += 1
+        with span("round", round=rounds):
+            table_done = analysis_round(step, table_name, rounds, conversation, executed_queries, gateway)
+
+
+# One LLM reply and the query it asks for; returns True once the model moves on
+def analysis_round(step, table_name, rounds, conversation, executed_queries, gateway):
+    messages = conversation.messages()
+
+    # Rate limiting, retries and response caching are handled by the gateway
+    with span("llm") as s:
+        response = gateway.complete(messages, model=model_id, temperature=0.7)
+        s.set(prompt_tokens=response.prompt_tokens, completion_tokens=response.completion_tokens,
+              cached=int(response.cached))
+    msg = response.content
+    if response.prompt_tokens:
+        conversation.observe_usage(response.prompt_tokens)
+    print(f"\nStep {step+1} - Round {rounds}\n{msg}")
+
+    sql_match = re.search(r"SQL:\s*```sql\s*(.*?)\s*```", msg, re.DOTALL | re.IGNORECASE)
+    if not sql_match:
+        sql_match = re.search(r"SQL:\s*(SELECT .*?)(?:\n|$)", msg, re.DOTALL | re.IGNORECASE)
+
+    explanation = re.search(r"Explanation:\s*(.*)", msg, re.DOTALL | re.IGNORECASE)
+    error = re.search(r"Error:\s*(.*)", msg, re.DOTALL | re.IGNORECASE)
+
+    sql_text = sql_match.group(1).strip().rstrip(";") if sql_match else None
+    explanation_text = explanation.group(1).strip() if explanation else ""
+    error_text = error.group(1).strip() if error else ""
+
+    print(explanation_text)
+
+    if sql_text:
+        if normalize_sql(sql_text) in executed_queries:
+            print("[Duplicate query. Skipping.]")
+            return True
+
+        with span("sql", detail=sql_text) as s:
+            rejection = validate(sql_text)
+            if rejection:
+                result = f"[SQL Error] Query rejected: {rejection}"
             else:
-                log(step, None, None, explanation_text, error_text)
-
-            if "Next table?" in msg:
-                table_done = True
+                result = cached_run_sql(sql_text, guard=check_cost)
+            s.set(status="ok" if isinstance(result, pd.DataFrame) else "rejected" if rejection else "error")
+        if isinstance(result, str):
+            if result.startswith("[SQL Error]"):
+                error_text = result
+            result_preview = logged_result = result
+        else:
+            with span("render", rows=len(result)):
+                result_preview = logged_result = render_result(result, row_cap=MAX_ROWS)
+                if len(result) > PREVIEW_ROWS:
+                    path = persist_result(result, f"step{step}_{fingerprint(sql_text)[:12]}")
+                    logged_result += f"\n[full result: {path}]"
+
+        print(result_preview)
+        executed_queries.add(normalize_sql(sql_text))
+        log(step, sql_text, logged_result, explanation_text, error_text, table_name=table_name)
+        conversation.add_reply(msg, sql=sql_text, result_preview=result_preview)
+    else:
+        log(step, None, None, explanation_text, error_text, table_name=table_name)
+        conversation.add_reply(msg)
+
+    return "Next table?" in msg
+
+# Analyze up to `workers` tables at once. LLM calls from every worker share one
+# gateway and its adaptive rate limiter, so throughput follows the allowed request
+# rate instead of the sum of per-round latencies. Finished tables are recorded by name in the checkpoint
+# file and skipped on the next run; `round_budgets` overrides max_rounds per table name.
+# `steps` restricts the run to those chunk numbers (e.g. SchemaIndex.steps(pattern=...)).
+# `gateway` replaces the Mistral gateway (e.g. mock_llm.ScriptedLLM); it is closed at the end.
+# Each call is one traced run: its spans go to the metrics table, a summary is printed at the
+# end and, with `prometheus_path`, written there in Prometheus text format.
+def process_schema_chunks(chunks, start_index=0, workers=WORKERS, requests_per_second=REQUESTS_PER_SECOND,
+                          max_rounds=MAX_ROUNDS, round_budgets=None, checkpoint_path=CHECKPOINT_PATH, steps=None,
+                          gateway=None, prometheus_path=None):
+    # Opened first so the setup below is traced under this run
+    tracer = get_tracer()
+    run_id = tracer.start_run(note=f"workers={workers} max_rounds={max_rounds}")
+    if gateway is None:
+        gateway = LLMGateway(rate=requests_per_second)
+    checkpoint = Checkpoint(checkpoint_path)
+    round_budgets = round_budgets or {}
+
+    def worker(step, schema):
+        table_name = extract_table_name(schema)
+        analyze_table(step, schema, gateway, max_rounds=round_budgets.get(table_name, max_rounds))
+        # Make this table's findings retrievable for the tables still in flight
+        with span("rag_sync", step=step, table_name=table_name):
+            get_index().sync()
+
+    get_index().sync()
+    if steps is None:
+        steps = range(start_index, len(chunks))
+    # Chunks are only read for tables that still need analysis; the checkpoint is keyed
+    # by table name, so step numbers only order the run
+    items = ((step, chunks.name(step), chunks[step]) for step in steps if chunks.name(step) not in checkpoint)
+    failed = []
+    try:
+        failed = run_concurrently(items, worker, workers=workers, checkpoint=checkpoint)
+        return failed
+    finally:
+        print(f"LLM calls: {gateway.metrics()}")
+        gateway.close()
+        tracer.finish_run(failed=len(failed))
+        if TRACING:
+            summary = summarize(run_id, path=tracer.path)
+            print(format_summary(summary))
+            if prometheus_path:
+                write_prometheus(summary, prometheus_path)
@@ -0,0 +1,115 @@
+import argparse
+import contextlib
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import agent
+import db
+import logger
+import tracing
+from mock_llm import ScriptedLLM, load_script
+from schema_loader import load_schema_chunks
+from sqlite_backend import SQLiteBackend, seed_database, write_schema_file, ROWS_PER_TABLE
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCHEMA_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Datasets", "aoms_schema.csv")
+TABLES = 300
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # kB on Linux
+
+
+# Seed a SQLite PROP schema, then run process_schema_chunks on it with the scripted LLM.
+# Everything the agent writes (logs, caches, index, results, spans) stays under `workdir`;
+# per-stage timings come from the run's spans (see tracing.py).
+def run_benchmark(workdir, tables=TABLES, rows=ROWS_PER_TABLE, workers=agent.WORKERS, script=None,
+                  latency=0.0, jitter=0.0, max_rounds=agent.MAX_ROUNDS, trace_memory=False, verbose=False):
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    seed_start = time.perf_counter()
+    layout = seed_database("bench_prop.db", SCHEMA_CSV, tables=tables, rows=rows)
+    write_schema_file(layout, "initial_prompt.txt", rows=rows)
+    seed_seconds = time.perf_counter() - seed_start
+
+    backend = SQLiteBackend(os.path.abspath("bench_prop.db"))
+    db.set_backend(backend)
+    gateway = ScriptedLLM(script=script, latency=latency, jitter=jitter)
+    chunks = load_schema_chunks("initial_prompt.txt", max_lines=20)
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    output = open(os.devnull, "w") if not verbose else None
+    with contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+        failed = agent.process_schema_chunks(chunks, workers=workers, max_rounds=max_rounds,
+                                             checkpoint_path="bench_checkpoint.json", gateway=gateway)
+        logger.flush_pending()
+    elapsed = time.perf_counter() - start
+    if output:
+        output.close()
+    traced_peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    if trace_memory:
+        tracemalloc.stop()
+    db.set_backend(None)
+
+    done = len(chunks) - len(failed)
+    return {
+        "tables": len(chunks),
+        "failed": len(failed),
+        "workers": workers,
+        "seed_seconds": round(seed_seconds, 2),
+        "elapsed_seconds": round(elapsed, 2),
+        "tables_per_minute": round(60 * done / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_traced_mb": round(traced_peak / 2 ** 20, 1) if traced_peak is not None else None,
+        "llm": gateway.metrics(),
+        "trace": tracing.summarize(tracing.get_tracer().run_id),
+    }
+
+
+def print_report(report):
+    print(f"{report['tables']} tables ({report['failed']} failed), {report['workers']} workers: "
+          f"{report['elapsed_seconds']}s, {report['tables_per_minute']} tables/min "
+          f"(seeding took {report['seed_seconds']}s)")
+    print(f"Peak RSS: {report['peak_rss_mb']} MB" + (
+        f", peak traced Python memory: {report['peak_traced_mb']} MB" if report["peak_traced_mb"] is not None else ""))
+    print(f"LLM: {report['llm']}")
+    print(tracing.format_summary(report["trace"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Offline agent benchmark: SQLite stand-in for PROP and a scripted LLM")
+    parser.add_argument("--tables", type=int, default=TABLES, help="tables taken from aoms_schema.csv")
+    parser.add_argument("--rows", type=int, default=ROWS_PER_TABLE, help="synthetic rows per table")
+    parser.add_argument("--workers", type=int, default=agent.WORKERS)
+    parser.add_argument("--max-rounds", type=int, default=agent.MAX_ROUNDS)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per LLM call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds per LLM call")
+    parser.add_argument("--script", help="JSON list of scripted replies, one per round")
+    parser.add_argument("--workdir", help="where the run's files go (default: a new temp directory)")
+    parser.add_argument("--trace-memory", action="store_true", help="also report peak Python allocations (slower)")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the agent's console output")
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="agent_bench_")
+    report = run_benchmark(workdir, tables=args.tables, rows=args.rows, workers=args.workers,
+                           script=load_script(args.script) if args.script else None,
+                           latency=args.latency, jitter=args.jitter, max_rounds=args.max_rounds,
+                           trace_memory=args.trace_memory, verbose=args.verbose)
+    print_report(report)
+    print(f"Run files: {workdir}")
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+from datetime import date, datetime
+import pandas as pd
+from dotenv import load_dotenv
+from db import run_sql, close_pool
+
+DATASETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Datasets")
+DATASET_DIR = os.path.join(DATASETS_DIR, "property_data")
+LEGACY_CSV = os.path.join(DATASETS_DIR, "clean_property_data.csv")
+MANIFEST = "_manifest.json"
+
+PROPERTY_TABLE = "PROP.AOMS_PROP_MAS_KBMC82"
+BILL_TABLE = "PROP.AOMS_BILL_MAS_KBMC"
+# Months aggregated per query; each query returns at most months x zones x wards rows
+MONTHS_PER_QUERY = int(os.getenv("DATASET_MONTHS_PER_QUERY", "6"))
+MAX_GROUP_ROWS = 500_000
+QUERY_TIMEOUT_MS = 30 * 60 * 1000
+
+KEYS = ["VAR_PROP_ZONEID", "NUM_PROP_WARDNO"]
+MEASURES = ["TOTAL_TAX", "NUM_PROP_RATE", "NUM_PROP_AREA", "NUM_PROP_ANNUALRENT"]
+COLUMNS = ["YEAR", "MONTH"] + KEYS + MEASURES
+
+# Bills per month, zone and ward: tax summed, property attributes averaged. The grouping
+# runs on the server, so only the aggregate rows are fetched.
+AGGREGATE_QUERY = """
+SELECT EXTRACT(YEAR FROM b.DAT_BILL_BILLDT) AS YEAR, EXTRACT(MONTH FROM b.DAT_BILL_BILLDT) AS MONTH,
+       p.VAR_PROP_ZONEID, p.NUM_PROP_WARDNO,
+       SUM(b.NUM_BILL_TOTTAX) AS TOTAL_TAX, AVG(p.NUM_PROP_RATE) AS NUM_PROP_RATE,
+       AVG(p.NUM_PROP_AREA) AS NUM_PROP_AREA, AVG(p.NUM_PROP_ANNUALRENT) AS NUM_PROP_ANNUALRENT
+FROM {bills} b JOIN {properties} p ON p.NUM_PROP_PROP = b.NUM_BILL_PROPID
+WHERE b.DAT_BILL_BILLDT >= DATE '{start}' AND b.DAT_BILL_BILLDT < DATE '{end}'
+GROUP BY EXTRACT(YEAR FROM b.DAT_BILL_BILLDT), EXTRACT(MONTH FROM b.DAT_BILL_BILLDT),
+         p.VAR_PROP_ZONEID, p.NUM_PROP_WARDNO
+"""
+
+
+def month_key(year, month):
+    return f"{int(year):04d}-{int(month):02d}"
+
+
+def next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def month_range(first, last):
+    months = []
+    while first <= last:
+        months.append(first)
+        first = next_month(*first)
+    return months
+
+
+# Consecutive months in runs of at most `size`, one aggregate query per run
+def month_chunks(months, size=MONTHS_PER_QUERY):
+    chunk = []
+    for ym in sorted(months):
+        if chunk and (len(chunk) >= size or next_month(*chunk[-1]) != ym):
+            yield chunk
+            chunk = []
+        chunk.append(ym)
+    if chunk:
+        yield chunk
+
+
+# The declared column types: keys as categoricals over their integer codes, measures as
+# float64. Rows whose zone or ward isn't a number are dropped (and counted).
+def typed(frame):
+    frame = frame[COLUMNS].copy()
+    for col in KEYS:
+        frame[col] = pd.to_numeric(frame[col], errors="coerce")
+    bad = frame[KEYS].isna().any(axis=1)
+    if bad.any():
+        print(f"[dataset] dropped {int(bad.sum())} rows without a numeric zone/ward")
+        frame = frame[~bad]
+    frame["YEAR"] = frame["YEAR"].astype("int16")
+    frame["MONTH"] = frame["MONTH"].astype("int8")
+    for col in KEYS:
+        frame[col] = frame[col].astype("int16").astype("category")
+    for col in MEASURES:
+        frame[col] = pd.to_numeric(frame[col], errors="coerce").astype("float64")
+    return frame.reset_index(drop=True)
+
+
+def load_manifest(root):
+    path = os.path.join(root, MANIFEST)
+    if not os.path.exists(path):
+        return {"months": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(root, manifest):
+    path = os.path.join(root, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+# One month as YEAR=y/MONTH=m/part-0.parquet (hive layout, the keys live in the path).
+# The file is replaced atomically, so a rebuilt month is never half-written.
+def write_partition(root, year, month, frame):
+    directory = os.path.join(root, f"YEAR={int(year)}", f"MONTH={int(month)}")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "part-0.parquet")
+    tmp = os.path.join(directory, ".part-0.parquet.tmp")
+    frame.drop(columns=["YEAR", "MONTH"]).to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+# Write each month of `frame`; months listed in `months` without rows are recorded as
+# empty (and any stale partition for them removed) so they aren't queried again
+def write_months(root, frame, source, manifest, months=()):
+    parts = {(int(y), int(m)): part for (y, m), part in frame.groupby(["YEAR", "MONTH"], observed=True)}
+    built = datetime.now().isoformat(timespec="seconds")
+    for year, month in sorted(set(parts) | set(months)):
+        part = parts.get((year, month))
+        if part is not None:
+            write_partition(root, year, month, part)
+        else:
+            stale = os.path.join(root, f"YEAR={year}", f"MONTH={month}", "part-0.parquet")
+            if os.path.exists(stale):
+                os.remove(stale)
+        manifest["months"][month_key(year, month)] = {
+            "rows": 0 if part is None else len(part), "source": source, "built": built,
+        }
+    save_manifest(root, manifest)
+
+
+def source_months(bills=BILL_TABLE):
+    result = run_sql(f"SELECT MIN(DAT_BILL_BILLDT), MAX(DAT_BILL_BILLDT) FROM {bills}", max_rows=1,
+                     timeout_ms=QUERY_TIMEOUT_MS)
+    if isinstance(result, str):
+        raise RuntimeError(result)
+    first, last = result.iloc[0]
+    if pd.isna(first):
+        return []
+    return month_range((first.year, first.month), (last.year, last.month))
+
+
+def extract(chunk, bills=BILL_TABLE, properties=PROPERTY_TABLE):
+    end = next_month(*chunk[-1])
+    query = AGGREGATE_QUERY.format(bills=bills, properties=properties,
+                                   start=date(*chunk[0], 1).isoformat(), end=date(*end, 1).isoformat())
+    result = run_sql(query, max_rows=MAX_GROUP_ROWS, timeout_ms=QUERY_TIMEOUT_MS)
+    if isinstance(result, str):
+        raise RuntimeError(f"{month_key(*chunk[0])}..{month_key(*chunk[-1])}: {result}")
+    if len(result) >= MAX_GROUP_ROWS:
+        raise RuntimeError(f"{month_key(*chunk[0])}..{month_key(*chunk[-1])}: result hit {MAX_GROUP_ROWS} rows; "
+                           "lower DATASET_MONTHS_PER_QUERY")
+    return typed(result)
+
+
+# Extract the months not yet stored, plus the newest stored month (it may have been
+# built before the month was over). `refresh` rebuilds everything in range.
+def build(root=DATASET_DIR, since=None, until=None, refresh=False):
+    os.makedirs(root, exist_ok=True)
+    manifest = load_manifest(root)
+    months = source_months()
+    if since:
+        months = [ym for ym in months if month_key(*ym) >= since]
+    if until:
+        months = [ym for ym in months if month_key(*ym) <= until]
+    stored = set(manifest["months"])
+    newest = max(stored) if stored else None
+    pending = [ym for ym in months if refresh or month_key(*ym) not in stored or month_key(*ym) == newest]
+
+    for chunk in month_chunks(pending):
+        frame = extract(chunk)
+        write_months(root, frame, "oracle", manifest, months=chunk)
+        print(f"[dataset] {month_key(*chunk[0])}..{month_key(*chunk[-1])}: {len(frame)} rows")
+    return len(pending)
+
+
+# Partition an existing clean_property_data.csv (leading unnamed index column included)
+def import_csv(path=LEGACY_CSV, root=DATASET_DIR):
+    os.makedirs(root, exist_ok=True)
+    frame = typed(pd.read_csv(path, index_col=0))
+    write_months(root, frame, "csv", load_manifest(root))
+    return len(frame)
+
+
+# The partitions back in the legacy CSV layout, for anything still reading the flat file
+def export_csv(root=DATASET_DIR, path=LEGACY_CSV):
+    frame = pd.read_parquet(root)[COLUMNS]
+    for col in ["YEAR", "MONTH"] + KEYS:
+        frame[col] = frame[col].astype("int64")
+    frame = frame.sort_values(["YEAR", "MONTH"] + KEYS, kind="stable").reset_index(drop=True)
+    frame.to_csv(path)
+    return len(frame)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Build the year/month-partitioned property tax dataset")
+    parser.add_argument("--out", default=DATASET_DIR, help="dataset directory")
+    parser.add_argument("--since", help="first month to extract, YYYY-MM")
+    parser.add_argument("--until", help="last month to extract, YYYY-MM")
+    parser.add_argument("--refresh", action="store_true", help="re-extract months already stored")
+    parser.add_argument("--from-csv", nargs="?", const=LEGACY_CSV,
+                        help="partition an existing clean_property_data.csv instead of querying Oracle")
+    parser.add_argument("--export-csv", nargs="?", const=LEGACY_CSV, help="also write the legacy flat CSV")
+    args = parser.parse_args()
+
+    if args.from_csv:
+        print(f"Imported {import_csv(args.from_csv, args.out)} rows from {args.from_csv}")
+    else:
+        try:
+            print(f"Extracted {build(args.out, since=args.since, until=args.until, refresh=args.refresh)} months")
+        finally:
+            close_pool()
+    if args.export_csv:
+        print(f"Wrote {export_csv(args.out, args.export_csv)} rows to {args.export_csv}")
@@ -1,7 +1,11 @@
 import os
+import re
+import time
+import threading
 import oracledb
 import pandas as pd
 from dotenv import load_dotenv
+from tracing import span, frame_bytes
 
 # Load environment variables
 load_dotenv()
@@ -15,29 +19,152 @@ DB_CONFIG = {
     "password": os.getenv("DB_PASSWORD")
 }
 
+# Pool and per-query limits
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))
+MAX_ROWS = int(os.getenv("DB_MAX_ROWS", "50"))
+CALL_TIMEOUT_MS = int(os.getenv("DB_CALL_TIMEOUT_MS", "60000"))
+# Rows per fetch round trip; the row cap itself is the ROWNUM wrap, so large caps
+# (e.g. build_dataset's aggregates) don't size the client buffer
+FETCH_ARRAYSIZE = int(os.getenv("DB_FETCH_ARRAYSIZE", "1000"))
+# "oracle" (default) or "sqlite:<path>" for an offline stand-in built by benchmark.py
+DB_BACKEND = os.getenv("DB_BACKEND", "oracle")
+
 # Build DSN (Oracle thin connection string)
 dsn = f"{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['service_name']}"
 
-# Establish connection
-try:
-    connection = oracledb.connect(
-        user=DB_CONFIG["user"],
-        password=DB_CONFIG["password"],
-        dsn=dsn
-    )
-    cursor = connection.cursor()
-except Exception as e:
-    raise RuntimeError(f"Failed to connect to Oracle DB: {e}")
-
-# SQL execution function
-def run_sql(query: str, retries: int = 2):
-    for attempt in range(retries):
-        try:
-            cursor.execute(query)
-            columns = [col[0] for col in cursor.description]
-            data = cursor.fetchall()
-            return pd.DataFrame(data, columns=columns)
-        except Exception as e:
-            if attempt < retries - 1:
-                continue
-            return f"[SQL Error] {str(e)}"
+# Return CLOB/BLOB columns as str/bytes so rows stay valid after the connection goes back to the pool
+oracledb.defaults.fetch_lobs = False
+
+# Errors worth another attempt: dropped sessions, network hiccups, listener/pool exhaustion.
+# Syntax errors, missing tables and call timeouts fail immediately.
+TRANSIENT_ERRORS = {
+    "ORA-03113", "ORA-03114", "ORA-03135", "ORA-12170", "ORA-12537", "ORA-12541",
+    "ORA-12543", "ORA-12571", "ORA-25408", "DPI-1080", "DPY-4011", "DPY-6005",
+}
+
+# Wrapping a query whose select list has duplicate names fails with this code
+AMBIGUOUS_COLUMN = "ORA-00918"
+
+_pool = None
+_pool_lock = threading.Lock()
+_backend = None
+_backend_ready = False
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            try:
+                _pool = oracledb.create_pool(
+                    user=DB_CONFIG["user"],
+                    password=DB_CONFIG["password"],
+                    dsn=dsn,
+                    min=POOL_MIN,
+                    max=POOL_MAX,
+                    increment=1,
+                    getmode=oracledb.POOL_GETMODE_WAIT,
+                )
+            except Exception as e:
+                raise RuntimeError(f"Failed to connect to Oracle DB: {e}")
+        return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close(force=True)
+            _pool = None
+
+
+# Replacement for the Oracle pool: an object with execute(query, max_rows, timeout_ms)
+# returning a DataFrame, explain(sql) returning (cost, rows), close() and a `name`
+# identifying the data it serves. None means Oracle.
+def set_backend(backend):
+    global _backend, _backend_ready
+    with _pool_lock:
+        if _backend is not None and _backend is not backend:
+            _backend.close()
+        _backend, _backend_ready = backend, True
+
+
+def get_backend():
+    global _backend, _backend_ready
+    with _pool_lock:
+        if not _backend_ready:
+            if DB_BACKEND.startswith("sqlite:"):
+                from sqlite_backend import SQLiteBackend
+                _backend = SQLiteBackend(DB_BACKEND[len("sqlite:"):])
+            _backend_ready = True
+        return _backend
+
+
+# Which database answers queries, e.g. for cache keys: the backend's name, or the Oracle DSN
+def backend_name():
+    backend = get_backend()
+    if backend is not None:
+        return backend.name
+    return f"oracle:{DB_CONFIG['user']}@{dsn}"
+
+
+def limit_rows(query: str, max_rows: int) -> str:
+    # Only plain queries get a server-side cap; anything else is passed through untouched
+    if not re.match(r"\s*(SELECT|WITH)\b", query, re.IGNORECASE):
+        return query
+    return f"SELECT * FROM ({query}) WHERE ROWNUM <= {int(max_rows)}"
+
+
+def error_code(e: Exception) -> str:
+    if e.args and hasattr(e.args[0], "full_code"):
+        return e.args[0].full_code
+    match = re.match(r"((?:ORA|DPI|DPY)-\d+)", str(e))
+    return match.group(1) if match else ""
+
+
+def is_transient(e: Exception) -> bool:
+    if not isinstance(e, oracledb.Error):
+        return False
+    if e.args and getattr(e.args[0], "isrecoverable", False):
+        return True
+    return error_code(e) in TRANSIENT_ERRORS
+
+
+def _execute(query: str, max_rows: int, timeout_ms: int):
+    with get_pool().acquire() as connection:
+        connection.call_timeout = timeout_ms
+        with connection.cursor() as cursor:
+            # Small agent results arrive in one round trip; big ones are fetched in batches
+            cursor.arraysize = min(max_rows, FETCH_ARRAYSIZE)
+            cursor.prefetchrows = min(max_rows + 1, FETCH_ARRAYSIZE)
+            try:
+                cursor.execute(limit_rows(query, max_rows))
+            except oracledb.DatabaseError as e:
+                if error_code(e) != AMBIGUOUS_COLUMN:
+                    raise
+                cursor.execute(query)
+            with span("db.fetch") as s:
+                columns = [col[0] for col in cursor.description]
+                data = cursor.fetchmany(max_rows)
+                df = pd.DataFrame(data, columns=columns)
+                s.set(rows=len(df))
+    return df
+
+
+# SQL execution function, safe to call from several threads at once
+def run_sql(query: str, retries: int = 3, max_rows: int = MAX_ROWS, timeout_ms: int = CALL_TIMEOUT_MS):
+    backend = get_backend()
+    execute = backend.execute if backend is not None else _execute
+    with span("db.run_sql", detail=query) as s:
+        for attempt in range(retries):
+            try:
+                result = execute(query, max_rows, timeout_ms)
+                s.set(rows=len(result), bytes=frame_bytes(result), status="ok")
+                return result
+            except Exception as e:
+                if attempt < retries - 1 and is_transient(e):
+                    time.sleep(0.5 * 2 ** attempt)
+                    continue
+                s.set(status=error_code(e) or type(e).__name__)
+                return f"[SQL Error] {str(e)}"
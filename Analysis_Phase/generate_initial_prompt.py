@@ -1,60 +1,22 @@
-import os
-import oracledb
+import argparse
 from dotenv import load_dotenv
+from db import close_pool
+from schema_catalog import refresh_catalog, write_prompt_file
 
 # Load .env variables
 load_dotenv()
 
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT"),
-    "service_name": os.getenv("DB_SERVICE"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-}
-dsn = f"{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['service_name']}"
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot the PROP schema and write initial_prompt.txt")
+    parser.add_argument("--full", action="store_true", help="re-pull every table, not just ones with newer DDL")
+    parser.add_argument("--out", default="initial_prompt.txt")
+    args = parser.parse_args()
 
-# Connect to Oracle
-connection = oracledb.connect(
-    user=DB_CONFIG["user"],
-    password=DB_CONFIG["password"],
-    dsn=dsn,
-    encoding="UTF-8"
-)
-cursor = connection.cursor()
+    changed, dropped = refresh_catalog(full=args.full)
+    print(f"Catalog refreshed: {changed} tables changed, {dropped} dropped.")
 
-# Get list of tables owned by PROP
-cursor.execute("""
-    SELECT table_name
-    FROM all_tables
-    WHERE owner = 'PROP'
-    ORDER BY table_name
-""")
-tables = [row[0] for row in cursor.fetchall()]
+    count = write_prompt_file(args.out)
+    print(f"✅ {args.out} generated ({count} tables).")
 
-lines = []
-
-for table in tables:
-    lines.append(f"Table: {table}")
-
-    cursor.execute("""
-        SELECT column_name, data_type
-        FROM all_tab_columns
-        WHERE owner = 'PROP' AND table_name = :table
-        ORDER BY column_id
-    """, [table])
-
-    columns = cursor.fetchall()
-    col_line = "Columns: " + ", ".join(f"{col} ({dtype})" for col, dtype in columns)
-    lines.append(col_line)
-    lines.append("")  # blank line between tables
-
-# Write to file
-with open("initial_prompt.txt", "w") as f:
-    f.write("\n".join(lines))
-
-print("✅ initial_prompt.txt generated.")
-
-# Cleanup
-cursor.close()
-connection.close()
\ No newline at end of file
+    # Cleanup
+    close_pool()
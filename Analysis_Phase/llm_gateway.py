@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+import openai
+from openai import AsyncOpenAI
+from scheduler import TokenBucket
+
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.mistral.ai/v1")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+REQUEST_TIMEOUT = 120.0
+
+LLMResponse = namedtuple("LLMResponse", "content prompt_tokens completion_tokens cached latency")
+
+RETRYABLE = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+# Token bucket whose rate follows the provider: additive increase after each success
+# (up to max_rate), halved on a 429, and capped by whatever the rate-limit headers say
+# is left in the current window.
+class AdaptiveRateLimiter(TokenBucket):
+    def __init__(self, rate: float, max_rate: float = None, min_rate: float = 0.05):
+        super().__init__(rate)
+        self.max_rate = max_rate or rate
+        self.min_rate = min_rate
+        self.paused_until = 0.0
+
+    def acquire(self, tokens: float = 1.0):
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+        super().acquire(tokens)
+
+    def _set_rate(self, rate):
+        with self.lock:
+            self._refill()
+            self.rate = max(self.min_rate, min(self.max_rate, rate))
+
+    def on_success(self, headers):
+        rate = self.rate + 0.05 * self.max_rate
+        remaining, reset = rate_limit_window(headers)
+        if remaining is not None and reset:
+            # Spread what's left of the window over the time until it resets
+            rate = min(rate, remaining / reset)
+        self._set_rate(rate)
+
+    def on_rate_limited(self, retry_after=None):
+        self._set_rate(self.rate / 2)
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+
+def _header(headers, *names):
+    for name in names:
+        value = headers.get(name) if headers is not None else None
+        if value is not None:
+            try:
+                return float(str(value).rstrip("s"))
+            except ValueError:
+                continue
+    return None
+
+
+# (requests remaining, seconds until the window resets) from OpenAI- or Mistral-style headers
+def rate_limit_window(headers):
+    remaining = _header(headers, "x-ratelimit-remaining-requests", "x-ratelimit-remaining-req-minute",
+                        "x-ratelimit-remaining")
+    reset = _header(headers, "x-ratelimit-reset-requests", "x-ratelimit-reset")
+    if remaining is not None and reset is None and "x-ratelimit-remaining-req-minute" in (headers or {}):
+        reset = 60.0
+    return remaining, reset
+
+
+def cache_key(model, messages, temperature):
+    payload = json.dumps({"model": model, "messages": messages, "temperature": temperature},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Chat-completion client shared by all scheduler workers. Requests run on one asyncio
+# loop in a background thread (one pooled HTTP client); complete() is the blocking
+# entry point for worker threads, acomplete() for async callers on that loop.
+class LLMGateway:
+    def __init__(self, api_key=None, base_url=LLM_BASE_URL, rate=1.0, max_rate=None,
+                 cache_path=LLM_CACHE_PATH, use_cache=True):
+        self.limiter = AdaptiveRateLimiter(rate, max_rate=max_rate)
+        self.use_cache = use_cache
+        # llm_calls outlives the process; metrics() only counts this gateway's session
+        self.session = uuid.uuid4().hex[:12]
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(cache_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                content TEXT,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                created REAL
+            );
+            CREATE TABLE IF NOT EXISTS llm_calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp REAL,
+                model TEXT,
+                latency REAL,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                retries INTEGER,
+                cached INTEGER,
+                status TEXT,
+                session TEXT
+            );
+        """)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(llm_calls)")}
+        if "session" not in columns:
+            self.db.execute("ALTER TABLE llm_calls ADD COLUMN session TEXT")
+        self.db.commit()
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="llm-gateway", daemon=True)
+        self.thread.start()
+        self.client = AsyncOpenAI(api_key=api_key or os.getenv("MISTRAL_API_KEY"), base_url=base_url,
+                                  timeout=REQUEST_TIMEOUT, max_retries=0)
+
+    def _cached(self, key):
+        with self.lock:
+            return self.db.execute(
+                "SELECT content, prompt_tokens, completion_tokens FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+    def _store(self, key, model, response):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                            (key, model, response.content, response.prompt_tokens,
+                             response.completion_tokens, time.time()))
+            self.db.commit()
+
+    def _record(self, model, latency, prompt_tokens, completion_tokens, retries, cached, status):
+        with self.lock:
+            self.db.execute("""
+                INSERT INTO llm_calls (timestamp, model, latency, prompt_tokens, completion_tokens, retries, cached,
+                                       status, session)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (time.time(), model, latency, prompt_tokens, completion_tokens, retries, int(cached), status,
+                  self.session))
+            self.db.commit()
+
+    async def acomplete(self, messages, model, temperature=0.7):
+        key = cache_key(model, messages, temperature)
+        if self.use_cache:
+            hit = self._cached(key)
+            if hit:
+                self._record(model, 0.0, hit[1], hit[2], 0, True, "ok")
+                return LLMResponse(hit[0], hit[1], hit[2], True, 0.0)
+
+        for attempt in range(MAX_RETRIES + 1):
+            await asyncio.get_running_loop().run_in_executor(None, self.limiter.acquire)
+            start = time.monotonic()
+            try:
+                raw = await self.client.chat.completions.with_raw_response.create(
+                    model=model, messages=messages, temperature=temperature
+                )
+            except RETRYABLE as e:
+                latency = time.monotonic() - start
+                headers = getattr(getattr(e, "response", None), "headers", None)
+                if isinstance(e, openai.RateLimitError):
+                    self.limiter.on_rate_limited(_header(headers, "retry-after"))
+                self._record(model, latency, None, None, attempt, False, type(e).__name__)
+                if attempt == MAX_RETRIES:
+                    raise
+                # Exponential backoff with full jitter
+                await asyncio.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+                continue
+
+            latency = time.monotonic() - start
+            self.limiter.on_success(raw.headers)
+            completion = raw.parse()
+            usage = completion.usage
+            response = LLMResponse(
+                completion.choices[0].message.content,
+                usage.prompt_tokens if usage else None,
+                usage.completion_tokens if usage else None,
+                False,
+                latency,
+            )
+            self._record(model, latency, response.prompt_tokens, response.completion_tokens, attempt, False, "ok")
+            if self.use_cache:
+                self._store(key, model, response)
+            return response
+
+    def complete(self, messages, model, temperature=0.7):
+        future = asyncio.run_coroutine_threadsafe(self.acomplete(messages, model, temperature), self.loop)
+        return future.result()
+
+    # Latency and token totals of this gateway's calls (earlier runs' rows are left out)
+    def metrics(self):
+        with self.lock:
+            row = self.db.execute("""
+                SELECT COUNT(*), COALESCE(SUM(cached), 0), AVG(CASE WHEN cached = 0 THEN latency END),
+                       SUM(prompt_tokens), SUM(completion_tokens), COALESCE(SUM(status != 'ok'), 0)
+                FROM llm_calls WHERE session = ?
+            """, (self.session,)).fetchone()
+        keys = ("calls", "cache_hits", "avg_latency", "prompt_tokens", "completion_tokens", "errors")
+        return dict(zip(keys, row))
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.client.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        with self.lock:
+            self.db.close()
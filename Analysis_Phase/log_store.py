@@ -0,0 +1,120 @@
+import glob
+import os
+import sqlite3
+from logger import DB_PATH, ensure_table_exists, flush_pending
+
+# SQLite attaches at most 10 databases per connection by default; main plus 9 shards
+ATTACH_LIMIT = 9
+COPY_CHUNK_ROWS = 5000
+LOG_COLUMNS = "id, timestamp, step, table_name, query, result, explanation, error, result_id"
+
+_prepared = set()
+
+
+# Archived shards live next to the active store: agent_logs.db -> agent_logs_*.db
+def list_shards(db_path=DB_PATH):
+    stem, ext = os.path.splitext(db_path)
+    return sorted(p for p in glob.glob(f"{glob.escape(stem)}_*{ext}") if p != db_path)
+
+
+# Bring a shard up to the current schema once per process so the federated view lines up
+def _prepare(path):
+    if path in _prepared:
+        return
+    conn = sqlite3.connect(path)
+    ensure_table_exists(conn)
+    conn.close()
+    _prepared.add(path)
+
+
+def _quote(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+# Run `sql` against an `all_logs` view spanning the active store and every shard.
+# all_logs has the logs columns plus `shard` (the file a row came from). Shards are
+# attached in groups of ATTACH_LIMIT, so ORDER BY/LIMIT apply per group and rows come
+# back concatenated; callers sort the combined result when order matters.
+def federated_query(sql, params=(), db_path=DB_PATH):
+    flush_pending(db_path)
+    paths = [db_path] + list_shards(db_path)
+    rows = []
+    for i in range(0, len(paths), ATTACH_LIMIT + 1):
+        group = paths[i:i + ATTACH_LIMIT + 1]
+        for path in group:
+            _prepare(path)
+        conn = sqlite3.connect(group[0])
+        selects = [f"SELECT {LOG_COLUMNS}, {_quote(os.path.basename(group[0]))} AS shard FROM main.logs"]
+        for n, path in enumerate(group[1:]):
+            conn.execute(f"ATTACH DATABASE ? AS shard{n}", (path,))
+            selects.append(f"SELECT {LOG_COLUMNS}, {_quote(os.path.basename(path))} AS shard FROM shard{n}.logs")
+        conn.execute("CREATE TEMP VIEW all_logs AS " + " UNION ALL ".join(selects))
+        rows.extend(conn.execute(sql, params).fetchall())
+        conn.close()
+    return rows
+
+
+# Table-keyed lookup across all shards, oldest first
+def fetch_logs_for_table(table_name, db_path=DB_PATH):
+    rows = federated_query("""
+        SELECT step, query, explanation, error, timestamp FROM all_logs
+        WHERE table_name = ?
+    """, (table_name.upper(),), db_path)
+    rows.sort(key=lambda r: (r[0], r[4] or ""))
+    return [row[:4] for row in rows]
+
+
+# Stream logs with ids in [start_id, end_id] from one store into another, chunk by chunk,
+# entirely inside SQLite. Rows already present in the target (same timestamp and step)
+# are skipped, so overlapping shards can be merged and a copy can be re-run safely.
+# Truncated results bring their log_results blob along under a shifted id.
+def copy_range(source_db, target_db, start_id, end_id, chunk_size=COPY_CHUNK_ROWS):
+    _prepare(source_db)
+    _prepare(target_db)
+    conn = sqlite3.connect(source_db)
+    conn.execute("ATTACH DATABASE ? AS target", (target_db,))
+    conn.execute("CREATE INDEX IF NOT EXISTS target.idx_logs_timestamp ON logs(timestamp, step)")
+    offset = conn.execute("SELECT COALESCE(MAX(id), 0) FROM target.log_results").fetchone()[0]
+    missing = """
+        id BETWEEN ? AND ? AND NOT EXISTS (
+            SELECT 1 FROM target.logs t WHERE t.timestamp = logs.timestamp AND t.step = logs.step
+        )
+    """
+    copied = 0
+    low = start_id
+    while low <= end_id:
+        high = min(low + chunk_size - 1, end_id)
+        conn.execute(f"""
+            INSERT INTO target.log_results (id, size, data)
+            SELECT id + ?, size, data FROM main.log_results
+            WHERE id IN (SELECT result_id FROM main.logs WHERE {missing})
+        """, (offset, low, high))
+        cursor = conn.execute(f"""
+            INSERT INTO target.logs (timestamp, step, table_name, query, result, explanation, error, result_id)
+            SELECT timestamp, step, table_name, query, result, explanation, error, result_id + ?
+            FROM main.logs WHERE {missing}
+            ORDER BY id
+        """, (offset, low, high))
+        copied += cursor.rowcount
+        conn.commit()
+        low = high + 1
+    conn.close()
+    return copied
+
+
+# Merge several shards into one file (streamed, deduplicated) and reclaim space
+def compact(shard_paths, target_db, chunk_size=COPY_CHUNK_ROWS):
+    copied = 0
+    for path in shard_paths:
+        conn = sqlite3.connect(path)
+        _prepare(path)
+        first_id, last_id = conn.execute("SELECT MIN(id), MAX(id) FROM logs").fetchone()
+        conn.close()
+        if first_id is None:
+            continue
+        copied += copy_range(path, target_db, first_id, last_id, chunk_size)
+        print(f"Merged {path} into {target_db} ({copied} rows so far)")
+    conn = sqlite3.connect(target_db)
+    conn.execute("VACUUM")
+    conn.close()
+    return copied
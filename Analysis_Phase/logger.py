@@ -1,8 +1,24 @@
+import atexit
+import os
+import queue
+import re
 import sqlite3
+import threading
+import time
+import zlib
 from datetime import datetime
+from tracing import span
 
 DB_PATH = "agent_logs.db"
 
+# Results longer than this are truncated inline; the full text is kept compressed in log_results
+RESULT_INLINE_CHARS = 1000
+BATCH_SIZE = 100
+FLUSH_INTERVAL = 1.0  # seconds between commits while the agent is busy
+FLUSH_TIMEOUT = 60.0  # seconds flush() waits for the writer before giving up
+# The active store is archived as agent_logs_<first step>_<last step>.db once it grows past this
+SHARD_MAX_BYTES = int(os.getenv("LOG_SHARD_MAX_BYTES", str(64 * 1024 * 1024)))
+
 def ensure_table_exists(conn):
     cursor = conn.cursor()
     cursor.execute("""
@@ -16,34 +32,283 @@ def ensure_table_exists(conn):
             error TEXT
         )
     """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS log_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            size INTEGER,
+            data BLOB
+        )
+    """)
+    # Older stores predate these columns
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(logs)")}
+    if "result_id" not in columns:
+        cursor.execute("ALTER TABLE logs ADD COLUMN result_id INTEGER")
+    if "table_name" not in columns:
+        cursor.execute("ALTER TABLE logs ADD COLUMN table_name TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_table_name ON logs(table_name, step)")
+
+    # Full-text index over query/explanation, kept in sync with triggers
+    has_fts = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'logs_fts'"
+    ).fetchone()
+    if not has_fts:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE logs_fts USING fts5(
+                query, explanation, content='logs', content_rowid='id'
+            )
+        """)
+        cursor.execute("INSERT INTO logs_fts(logs_fts) VALUES ('rebuild')")
+    cursor.executescript("""
+        CREATE TRIGGER IF NOT EXISTS logs_fts_insert AFTER INSERT ON logs BEGIN
+            INSERT INTO logs_fts(rowid, query, explanation) VALUES (new.id, new.query, new.explanation);
+        END;
+        CREATE TRIGGER IF NOT EXISTS logs_fts_delete AFTER DELETE ON logs BEGIN
+            INSERT INTO logs_fts(logs_fts, rowid, query, explanation)
+            VALUES ('delete', old.id, old.query, old.explanation);
+        END;
+        CREATE TRIGGER IF NOT EXISTS logs_fts_update AFTER UPDATE OF query, explanation ON logs BEGIN
+            INSERT INTO logs_fts(logs_fts, rowid, query, explanation)
+            VALUES ('delete', old.id, old.query, old.explanation);
+            INSERT INTO logs_fts(rowid, query, explanation) VALUES (new.id, new.query, new.explanation);
+        END;
+    """)
     conn.commit()
 
+
+# Single long-lived connection fed from a queue. Rows are committed in batches
+# on a background thread, so a logging call never waits on an fsync.
+class LogWriter:
+    def __init__(self, db_path=DB_PATH, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_bytes=SHARD_MAX_BYTES):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.queue = queue.Queue()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def write(self, row):
+        self.queue.put(row)
+
+    # Block until everything queued so far is committed. Raises if the writer thread has
+    # died or doesn't get there within `timeout`, rather than stalling every caller.
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        if not self.thread.is_alive():
+            raise RuntimeError("log writer thread is not running")
+        done = threading.Event()
+        self.queue.put(done)
+        deadline = time.monotonic() + timeout
+        while not done.wait(min(1.0, max(deadline - time.monotonic(), 0))):
+            if not self.thread.is_alive():
+                raise RuntimeError("log writer thread died before flushing")
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"log writer did not flush within {timeout:.0f}s")
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        ensure_table_exists(conn)
+        return conn
+
+    def _run(self):
+        conn = self._connect()
+        self.ready.set()
+
+        pending = 0
+        last_commit = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            # A failing insert costs its row and a failing commit or rotation its batch,
+            # never the thread: flush() and every reader depend on it
+            try:
+                if isinstance(item, threading.Event):
+                    self._commit(conn, pending)
+                    pending, last_commit = 0, time.monotonic()
+                    continue
+                if item:
+                    try:
+                        self._insert(conn, item)
+                        pending += 1
+                    except Exception as e:
+                        print(f"[Log writer error] {type(e).__name__}: {e} (step {item[1]} row dropped)")
+                if pending and (pending >= self.batch_size or time.monotonic() - last_commit >= self.flush_interval):
+                    self._commit(conn, pending)
+                    pending, last_commit = 0, time.monotonic()
+                    conn = self._maybe_rotate(conn)
+            except Exception as e:
+                print(f"[Log writer error] {type(e).__name__}: {e} ({pending} uncommitted rows dropped)")
+                conn = self._recover(conn)
+                pending, last_commit = 0, time.monotonic()
+            finally:
+                if isinstance(item, threading.Event):
+                    item.set()
+        conn.commit()
+        conn.close()
+
+    # After a failed batch: drop its uncommitted rows, or reopen the store if a rotation
+    # failed after closing the connection
+    def _recover(self, conn):
+        try:
+            conn.rollback()
+            return conn
+        except sqlite3.ProgrammingError:
+            return self._connect()
+
+    def _commit(self, conn, pending):
+        with span("log.commit", rows=pending):
+            conn.commit()
+
+    # Archive the active store once it passes max_bytes and continue in a fresh file.
+    # Ids keep counting from the archived shard so they stay unique across shards.
+    def _maybe_rotate(self, conn):
+        wal_path = self.db_path + "-wal"
+        size = os.path.getsize(self.db_path) + (os.path.getsize(wal_path) if os.path.exists(wal_path) else 0)
+        if not self.max_bytes or size < self.max_bytes:
+            return conn
+        first_step, last_step, last_id = conn.execute(
+            "SELECT MIN(step), MAX(step), MAX(id) FROM logs"
+        ).fetchone()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+        archived = shard_path(self.db_path, first_step, last_step)
+        os.replace(self.db_path, archived)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+        print(f"[Log store rotated to {archived}]")
+
+        conn = self._connect()
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('logs', ?)", (last_id or 0,))
+        conn.commit()
+        return conn
+
+    def _insert(self, conn, row):
+        timestamp, step, table_name, query, result, explanation, error = row
+        result_id = None
+        if result is not None and len(result) > RESULT_INLINE_CHARS:
+            data = result.encode("utf-8")
+            cursor = conn.execute(
+                "INSERT INTO log_results (size, data) VALUES (?, ?)",
+                (len(data), zlib.compress(data)),
+            )
+            result_id = cursor.lastrowid
+            result = result[:RESULT_INLINE_CHARS] + f"... [truncated, full result in log_results #{result_id}]"
+        conn.execute("""
+            INSERT INTO logs (timestamp, step, table_name, query, result, explanation, error, result_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (timestamp, step, table_name, query, result, explanation, error, result_id))
+
+
+def shard_path(db_path, first_step, last_step):
+    stem, ext = os.path.splitext(db_path)
+    path = f"{stem}_{first_step}_{last_step}{ext}"
+    n = 1
+    while os.path.exists(path):
+        path = f"{stem}_{first_step}_{last_step}_{n}{ext}"
+        n += 1
+    return path
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LogWriter(DB_PATH)
+            atexit.register(_writer.close)
+        return _writer
+
 # Called during every analysis step
-def log(step, query, result, explanation, error):
-    conn = sqlite3.connect(DB_PATH)
+def log(step, query, result, explanation, error, table_name=None):
+    table_name = table_name.upper() if table_name else None
+    with span("log", bytes=sum(len(v) for v in (query, result, explanation, error) if v)):
+        get_writer().write((datetime.now().isoformat(), step, table_name, query, result, explanation, error))
+
+# Full text of a result that was truncated in the logs table
+def fetch_result(result_id, db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    row = conn.execute("SELECT data FROM log_results WHERE id = ?", (result_id,)).fetchone()
+    conn.close()
+    return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+# Make rows still queued in the writer visible to readers
+def flush_pending(db_path=DB_PATH):
+    if _writer is not None and _writer.db_path == db_path:
+        _writer.flush()
+
+# Fetch logs related to a specific table (RAG source), explanation-only steps included
+def fetch_logs_for_table(table_name, db_path=DB_PATH):
+    flush_pending(db_path)
+    conn = sqlite3.connect(db_path)
     ensure_table_exists(conn)
     cursor = conn.cursor()
     cursor.execute("""
-        INSERT INTO logs (timestamp, step, query, result, explanation, error)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (datetime.now().isoformat(), step, query, result, explanation, error))
-    conn.commit()
+        SELECT step, query, explanation, error FROM logs
+        WHERE table_name = ?
+        ORDER BY step ASC, id ASC
+    """, (table_name.upper(),))
+    rows = cursor.fetchall()
     conn.close()
+    return rows
 
-# Fetch logs related to a specific table (RAG source)
-def fetch_logs_for_table(table_name, db_path=DB_PATH):
+# Full-text search over logged queries and explanations, best matches first
+def search_logs(text, limit=20, db_path=DB_PATH):
+    terms = " ".join('"' + term.replace('"', '""') + '"' for term in text.split())
+    if not terms:
+        return []
+    flush_pending(db_path)
     conn = sqlite3.connect(db_path)
     ensure_table_exists(conn)
     cursor = conn.cursor()
     cursor.execute("""
-        SELECT step, query, explanation, error FROM logs
-        WHERE LOWER(query) LIKE ?
-        ORDER BY step ASC
-    """, (f"%{table_name.lower()}%",))
+        SELECT logs.step, logs.table_name, logs.query, logs.explanation, logs.error
+        FROM logs_fts JOIN logs ON logs.id = logs_fts.rowid
+        WHERE logs_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    """, (terms, limit))
     rows = cursor.fetchall()
     conn.close()
     return rows
 
+# Bring an older store up to the current schema and fill in table_name for rows
+# logged before it existed. `step_tables` maps step number to table name (the
+# step is the chunk index in initial_prompt.txt); rows whose step isn't listed
+# fall back to the first PROP.<table> referenced in their query.
+def migrate_log_store(db_path, step_tables):
+    conn = sqlite3.connect(db_path)
+    ensure_table_exists(conn)
+    cursor = conn.cursor()
+    rows = cursor.execute("SELECT id, step, query FROM logs WHERE table_name IS NULL").fetchall()
+    updates = []
+    for row_id, step, query in rows:
+        table_name = step_tables.get(step)
+        if table_name is None and query:
+            match = re.search(r"PROP\.(\w+)", query, re.IGNORECASE)
+            table_name = match.group(1) if match else None
+        if table_name:
+            updates.append((table_name.upper(), row_id))
+    cursor.executemany("UPDATE logs SET table_name = ? WHERE id = ?", updates)
+    conn.commit()
+    conn.close()
+    return len(updates)
+
 # Convert logs into prompt-compatible format (limited to recent entries)
 def format_logs_as_context(logs, max_entries=5):
     context = []
@@ -1,11 +1,51 @@
+import argparse
+import json
 from dotenv import load_dotenv
 from schema_loader import load_schema_chunks
-from agent import process_schema_chunks
+from agent import process_schema_chunks, WORKERS, REQUESTS_PER_SECOND, MAX_ROUNDS
+from scheduler import Checkpoint, CHECKPOINT_PATH
 
 load_dotenv()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze the PROP schema table by table")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="tables analyzed concurrently")
+    parser.add_argument("--rps", type=float, default=REQUESTS_PER_SECOND, help="LLM requests per second across all workers")
+    parser.add_argument("--max-rounds", type=int, default=MAX_ROUNDS, help="default round budget per table")
+    parser.add_argument("--round-budgets", help="JSON file mapping table name to round budget")
+    parser.add_argument("--start-index", type=int, default=0, help="skip tables before this number (0-based)")
+    parser.add_argument("--start-table", help="skip tables before this one (by name)")
+    parser.add_argument("--tables", help="only analyze tables matching this glob, e.g. 'TB_BILL_DET_*'")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="resume checkpoint file")
+    parser.add_argument("--reset", action="store_true", help="ignore the checkpoint and start over")
+    parser.add_argument("--metrics-out", help="write the run's stage metrics here in Prometheus text format")
+    args = parser.parse_args()
+
+    round_budgets = None
+    if args.round_budgets:
+        with open(args.round_budgets, "r") as f:
+            round_budgets = json.load(f)
+
+    if args.reset:
+        Checkpoint(args.checkpoint).reset()
+
     schema_chunks = load_schema_chunks("initial_prompt.txt", max_lines=20)
-    # Resume from a specific table number (0-based)
-    start_index = int(input("Enter the table number to start from (0 for first table): ") or 0)
-    process_schema_chunks(schema_chunks, start_index=start_index)
+    start_index = args.start_index
+    if args.start_table:
+        start_index = schema_chunks.position(args.start_table.upper())
+        if start_index is None:
+            parser.error(f"table {args.start_table} not found in initial_prompt.txt")
+    # Already finished tables are read from the checkpoint, so a restart resumes automatically
+    failed = process_schema_chunks(
+        schema_chunks,
+        start_index=start_index,
+        workers=args.workers,
+        requests_per_second=args.rps,
+        max_rounds=args.max_rounds,
+        round_budgets=round_budgets,
+        checkpoint_path=args.checkpoint,
+        steps=schema_chunks.steps(start=start_index, pattern=args.tables),
+        prometheus_path=args.metrics_out,
+    )
+    if failed:
+        print(f"{len(failed)} tables failed and will be retried on the next run: {sorted(failed)}")
@@ -0,0 +1,14 @@
+import sys
+from schema_loader import load_schema_chunks
+from logger import migrate_log_store
+
+# Usage: python migrate_logs.py agent_logs_237_477.db agent_logs_last_part.db ...
+# Adds the table_name column, its index and the FTS index to each store and
+# backfills table_name from the step -> table order of initial_prompt.txt.
+if __name__ == "__main__":
+    schema_chunks = load_schema_chunks("initial_prompt.txt")
+    step_tables = {step: schema_chunks.name(step) for step in range(len(schema_chunks))}
+
+    for db_path in sys.argv[1:]:
+        updated = migrate_log_store(db_path, step_tables)
+        print(f"{db_path}: tagged {updated} rows with their table name")
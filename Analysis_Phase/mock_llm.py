@@ -0,0 +1,163 @@
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from llm_gateway import LLMResponse
+from profiler import parse_columns
+
+# One reply per round, in the agent's Explanation/SQL/Error format. {table} and {column}
+# are filled from the table under analysis; the rounds cover a plain aggregate, a wide
+# result that gets persisted, a failing query, a query the guard rejects and the summary.
+DEFAULT_SCRIPT = [
+    "Explanation: {table} looks like a master table keyed on {column}.\n"
+    "SQL: SELECT COUNT(*) AS total, COUNT(DISTINCT \"{column}\") AS distinct_values FROM PROP.{table}\n"
+    "Error: None",
+    "Explanation: Checking how {column} is distributed.\n"
+    "SQL: SELECT \"{column}\", COUNT(*) AS cnt FROM PROP.{table} GROUP BY \"{column}\" ORDER BY cnt DESC\n"
+    "Error: None",
+    "Explanation: Looking for a status column.\n"
+    "SQL: SELECT NO_SUCH_COLUMN FROM PROP.{table} WHERE ROWNUM <= 5\n"
+    "Error: None",
+    "Explanation: Sampling raw rows.\n"
+    "SQL: SELECT * FROM {table}\n"
+    "Error: None",
+    "Explanation: {table} stores reference rows keyed on {column}; no further checks needed.\n"
+    "Error: None\n"
+    "Next table? Summary: {table} is keyed on {column} with a skewed distribution.",
+]
+
+
+def load_script(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Drop-in for LLMGateway that replays a fixed script instead of calling the API. Replies
+# depend only on the table and how many calls it has had, so runs are reproducible;
+# `latency` (seconds, with up to `jitter` extra, seeded per call) stands in for the network.
+class ScriptedLLM:
+    def __init__(self, script=None, latency=0.0, jitter=0.0, seed=0):
+        self.script = script or DEFAULT_SCRIPT
+        self.latency = latency
+        self.jitter = jitter
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.rounds = {}
+        self.stats = {"calls": 0, "latency": 0.0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def complete(self, messages, model=None, temperature=None):
+        start = time.monotonic()
+        opening = next((m["content"] for m in messages if m["role"] == "user"), "")
+        match = re.search(r"^Table:\s*(\w+)", opening, re.MULTILINE)
+        table = match.group(1) if match else "unknown_table"
+        columns = parse_columns(opening)
+        with self.lock:
+            n = self.rounds.get(table, 0)
+            self.rounds[table] = n + 1
+        content = self.script[min(n, len(self.script) - 1)].format(
+            table=table, column=columns[0][0] if columns else "ROWID")
+
+        delay = self.latency
+        if self.jitter:
+            delay += random.Random(zlib.crc32(f"{self.seed}:{table}:{n}".encode("utf-8"))).uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        latency = time.monotonic() - start
+        with self.lock:
+            self.stats["calls"] += 1
+            self.stats["latency"] += latency
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+        return LLMResponse(content, prompt_tokens, completion_tokens, False, latency)
+
+    def metrics(self):
+        with self.lock:
+            calls = self.stats["calls"]
+            return {"calls": calls, "cache_hits": 0, "avg_latency": self.stats["latency"] / calls if calls else None,
+                    "prompt_tokens": self.stats["prompt_tokens"],
+                    "completion_tokens": self.stats["completion_tokens"], "errors": 0}
+
+    def close(self):
+        pass
+
+
+class _ChatHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server.mock
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            return self._reply(404, {"error": {"message": f"no route {self.path}", "type": "not_found"}})
+        with server.lock:
+            server.requests += 1
+            limited = server.rate_limited > 0
+            if limited:
+                server.rate_limited -= 1
+        if limited:
+            headers = {"retry-after": str(server.retry_after)} if server.retry_after is not None else {}
+            return self._reply(429, {"error": {"message": "Requests rate limit exceeded", "type": "rate_limited"}},
+                               headers)
+        response = server.llm.complete(body.get("messages", []), model=body.get("model"))
+        self._reply(200, {
+            "id": f"mock-{server.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": response.content}}],
+            "usage": {"prompt_tokens": response.prompt_tokens, "completion_tokens": response.completion_tokens,
+                      "total_tokens": response.prompt_tokens + response.completion_tokens},
+        }, server.headers)
+
+    def _reply(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# OpenAI-compatible /v1/chat/completions on localhost, answering from a ScriptedLLM, so
+# LLMGateway can be run end to end without the API. The next `rate_limited` requests get
+# a 429 (with `retry_after` if given); `headers` go on every successful reply, e.g.
+# x-ratelimit-remaining-requests. Use as a context manager; `base_url` is set once started.
+class MockChatServer:
+    def __init__(self, llm=None, rate_limited=0, retry_after=None, headers=None):
+        self.llm = llm or ScriptedLLM()
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.headers = headers or {}
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = None
+        self.base_url = None
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _ChatHandler)
+        self.httpd.mock = self
+        threading.Thread(target=self.httpd.serve_forever, name="mock-llm", daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
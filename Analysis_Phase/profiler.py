@@ -0,0 +1,164 @@
+import re
+import pandas as pd
+from query_cache import cached_run_sql
+
+# Tables with more rows than this (per optimizer stats) are profiled from a SAMPLE
+SAMPLE_THRESHOLD = 1_000_000
+SAMPLE_ROWS = 200_000
+# Oracle allows 1000 expressions per select list; stay well under it
+MAX_EXPRESSIONS = 900
+TOP_K = 5
+TOP_K_MAX_DISTINCT = 50
+DUMMY_VALUES = ("test", "dummy", "na", "n/a", "null", "none", "xxx", "abc", "-", "0")
+
+NUMERIC_TYPES = ("NUMBER", "FLOAT", "BINARY_FLOAT", "BINARY_DOUBLE", "INTEGER")
+CHAR_TYPES = ("VARCHAR2", "NVARCHAR2", "CHAR", "NCHAR", "VARCHAR")
+# No aggregates beyond COUNT on these; LONG can't even be counted
+LOB_TYPES = ("CLOB", "NCLOB", "BLOB", "BFILE", "LONG", "LONG RAW", "XMLTYPE")
+
+
+def parse_columns(schema: str):
+    match = re.search(r"^Columns:\s*(.*)$", schema, re.MULTILINE)
+    if not match:
+        return []
+    columns = []
+    seen = set()
+    for name, dtype in re.findall(r"(\w+) \((.+?)\)(?=, |$)", match.group(1)):
+        # The dictionary dump repeats some columns; profile each once
+        if name not in seen:
+            seen.add(name)
+            columns.append((name, dtype.upper()))
+    return columns
+
+
+# Optimizer row count written into the schema file by schema_catalog, if present
+def parse_num_rows(schema: str):
+    match = re.search(r"^Rows \(stats\):\s*(\d+)", schema, re.MULTILINE)
+    return int(match.group(1)) if match else None
+
+
+def _base_type(dtype):
+    return re.sub(r"\(.*\)", "", dtype).strip()
+
+
+def column_expressions(name, dtype):
+    col = f'"{name}"'
+    base = _base_type(dtype)
+    if base in ("LONG", "LONG RAW"):
+        return []
+    exprs = [("non_null", f"COUNT({col})")]
+    if base in LOB_TYPES:
+        return exprs
+    exprs.append(("distinct", f"APPROX_COUNT_DISTINCT({col})"))
+    if base in NUMERIC_TYPES or base == "DATE" or base.startswith("TIMESTAMP"):
+        exprs.append(("min", f"TO_CHAR(MIN({col}))"))
+        exprs.append(("max", f"TO_CHAR(MAX({col}))"))
+    elif base in CHAR_TYPES:
+        exprs.append(("min_len", f"MIN(LENGTH({col}))"))
+        exprs.append(("max_len", f"MAX(LENGTH({col}))"))
+        dummies = ", ".join(f"'{v}'" for v in DUMMY_VALUES)
+        exprs.append(("dummy", f"SUM(CASE WHEN LOWER(TRIM({col})) IN ({dummies}) THEN 1 ELSE 0 END)"))
+    return exprs
+
+
+def _source(table_name, num_rows):
+    if num_rows and num_rows > SAMPLE_THRESHOLD:
+        percent = max(0.001, min(99.0, 100.0 * SAMPLE_ROWS / num_rows))
+        return f"PROP.{table_name} SAMPLE ({percent:.3f})", percent
+    return f"PROP.{table_name}", None
+
+
+def table_num_rows(table_name):
+    result = cached_run_sql(
+        f"SELECT num_rows FROM all_tables WHERE owner = 'PROP' AND table_name = '{table_name}'"
+    )
+    if isinstance(result, pd.DataFrame) and not result.empty and pd.notna(result.iloc[0, 0]):
+        return int(result.iloc[0, 0])
+    return None
+
+
+# Profile a table with one aggregate query (split only past Oracle's select-list limit),
+# plus one UNION ALL query for the top values of low-cardinality columns.
+# `num_rows` comes from optimizer stats and decides whether to SAMPLE.
+def profile_table(table_name, columns, num_rows=None):
+    if num_rows is None:
+        num_rows = table_num_rows(table_name)
+    source, sample_percent = _source(table_name, num_rows)
+
+    exprs = [("*", "rows", "COUNT(*)")]
+    for name, dtype in columns:
+        exprs.extend((name, stat, sql) for stat, sql in column_expressions(name, dtype))
+
+    profile = {"table": table_name, "num_rows": num_rows, "sample_percent": sample_percent,
+               "row_count": None, "columns": {name: {"type": dtype} for name, dtype in columns}}
+    for start in range(0, len(exprs), MAX_EXPRESSIONS):
+        batch = exprs[start:start + MAX_EXPRESSIONS]
+        select_list = ", ".join(f"{sql} AS c{i}" for i, (_, _, sql) in enumerate(batch))
+        result = cached_run_sql(f"SELECT {select_list} FROM {source}")
+        if not isinstance(result, pd.DataFrame) or result.empty:
+            profile["error"] = result if isinstance(result, str) else "empty result"
+            return profile
+        values = result.iloc[0].tolist()
+        for (name, stat, _), value in zip(batch, values):
+            value = None if pd.isna(value) else value
+            if name == "*":
+                profile["row_count"] = int(value or 0)
+            else:
+                profile["columns"][name][stat] = value
+
+    profile["top_values"] = top_values(source, profile)
+    return profile
+
+
+def top_values(source, profile):
+    candidates = [
+        name for name, stats in profile["columns"].items()
+        if stats.get("distinct") is not None and 0 < stats["distinct"] <= TOP_K_MAX_DISTINCT
+    ]
+    if not candidates:
+        return {}
+    parts = [
+        f"SELECT '{name}' AS col, TO_CHAR(\"{name}\") AS val, COUNT(*) AS cnt FROM {source} GROUP BY \"{name}\""
+        for name in candidates
+    ]
+    query = (
+        "SELECT col, val, cnt FROM (SELECT col, val, cnt, "
+        "ROW_NUMBER() OVER (PARTITION BY col ORDER BY cnt DESC) AS rn FROM ("
+        + " UNION ALL ".join(parts)
+        + f")) WHERE rn <= {TOP_K}"
+    )
+    result = cached_run_sql(query, max_rows=TOP_K * len(candidates))
+    if not isinstance(result, pd.DataFrame):
+        return {}
+    top = {}
+    for col, val, cnt in result.itertuples(index=False):
+        top.setdefault(col, []).append((val, int(cnt)))
+    return top
+
+
+# Compact text form for the agent's prompt
+def format_profile(profile):
+    if profile.get("error"):
+        return f"Profile unavailable: {profile['error']}"
+    rows = profile["row_count"] or 0
+    header = f"Rows: {rows}"
+    if profile["sample_percent"]:
+        header += f" in a {profile['sample_percent']:.3f}% sample (~{profile['num_rows']} total per stats)"
+    lines = [header]
+    for name, stats in profile["columns"].items():
+        parts = [stats["type"]]
+        if "non_null" in stats and rows:
+            parts.append(f"nulls {100.0 * (rows - (stats['non_null'] or 0)) / rows:.1f}%")
+        if stats.get("distinct") is not None:
+            parts.append(f"~{stats['distinct']} distinct")
+        if stats.get("min") is not None:
+            parts.append(f"range {stats['min']} .. {stats['max']}")
+        if stats.get("max_len") is not None:
+            parts.append(f"length {stats['min_len']}-{stats['max_len']}")
+        if stats.get("dummy"):
+            parts.append(f"{stats['dummy']} dummy-looking values")
+        top = profile.get("top_values", {}).get(name)
+        if top:
+            parts.append("top " + ", ".join(f"{val}({cnt})" for val, cnt in top))
+        lines.append(f"{name}: " + "; ".join(parts))
+    return "\n".join(lines)
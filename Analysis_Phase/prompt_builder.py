@@ -0,0 +1,75 @@
+import os
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+RESULT_PREVIEW_CHARS = 1500
+SUMMARY_LINE_CHARS = 200
+
+
+# One-line gist of a result preview: for a render_result table, its header plus the
+# first row (after the sampling note, if any); for anything else, its first line
+def headline(preview):
+    lines = [" ".join(line.split()) for line in preview.strip().splitlines()]
+    sampled = bool(lines) and lines[0].startswith("[sampled")
+    if sampled:
+        lines = lines[1:]
+    if len(lines) >= 2 and not lines[0].startswith("["):
+        gist = f"{lines[0]} {lines[1]}"
+    else:
+        gist = lines[0] if lines else ""
+    return f"{gist} (sampled)" if sampled else gist
+
+
+# Per-table conversation that only ever appends deltas: the model's reply and the
+# result of the query it asked for. The message prefix stays identical between rounds
+# (which keeps provider-side prefix caching effective) until the budget is exceeded;
+# then the oldest turns are folded into a one-line-per-query summary.
+class Conversation:
+    def __init__(self, system_messages, opening, budget=PROMPT_TOKEN_BUDGET):
+        self.system_messages = list(system_messages)
+        self.opening = {"role": "user", "content": opening}
+        self.budget = budget
+        self.turns = []  # [assistant message, user message] pairs
+        self.summary = []
+        self.chars_per_token = 4.0
+
+    def count_tokens(self, messages):
+        return int(sum(len(m["content"]) for m in messages) / self.chars_per_token) + 4 * len(messages)
+
+    # Calibrate the chars/token ratio against the usage the API reports for the last request
+    def observe_usage(self, prompt_tokens):
+        chars = sum(len(m["content"]) for m in self._assemble())
+        if prompt_tokens:
+            self.chars_per_token = max(1.0, chars / prompt_tokens)
+
+    def add_reply(self, reply, sql=None, result_preview=None, error=None):
+        if sql:
+            outcome = error or result_preview or "(no rows)"
+            note = f"Result of `{sql}`:\n{outcome[:RESULT_PREVIEW_CHARS]}"
+            summary = f"- {sql} -> {headline(outcome)}"
+        else:
+            note = ("No SQL query was found in your reply. Continue with the next query, "
+                    "or say **Next table?** with your summary if the analysis is complete.")
+            summary = None
+        self.turns.append(({"role": "assistant", "content": reply}, {"role": "user", "content": note}, summary))
+        self._fit()
+
+    def _assemble(self):
+        messages = self.system_messages + [self.opening]
+        if self.summary:
+            messages.append({
+                "role": "user",
+                "content": "Queries already run on this table (older turns, summarized):\n" + "\n".join(self.summary),
+            })
+        for reply, note, _ in self.turns:
+            messages.extend([reply, note])
+        return messages
+
+    def _fit(self):
+        # Keep at least the latest turn verbatim so the model can build on its last result
+        while len(self.turns) > 1 and self.count_tokens(self._assemble()) > self.budget:
+            _, _, summary = self.turns.pop(0)
+            if summary:
+                self.summary.append(summary[:SUMMARY_LINE_CHARS])
+
+    def messages(self):
+        return self._assemble()
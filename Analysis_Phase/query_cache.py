@@ -0,0 +1,170 @@
+import hashlib
+import io
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+import pandas as pd
+from db import run_sql, backend_name, MAX_ROWS
+from tracing import annotate
+
+CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "query_cache.db")
+CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+_literal = re.compile(r"""('(?:[^']|'')*'|"[^"]*")""")
+
+
+# Normalize SQL so the same profiling query written with different whitespace,
+# keyword case, comments or trailing semicolons maps to one key. String literals and
+# quoted identifiers are kept verbatim since they change the result, and so are column
+# aliases, which name the result's columns.
+def normalize_sql(query: str) -> str:
+    query = re.sub(r"--[^\n]*", " ", query)
+    query = re.sub(r"/\*.*?\*/", " ", query, flags=re.DOTALL)
+    parts = _literal.split(query.strip().rstrip(";"))
+    normalized = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            normalized.append(part)
+            continue
+        part = re.sub(r"\s*([(),=<>*+/-])\s*", r"\1", part)
+        part = re.sub(r"\s+", " ", part)
+        normalized.append(part.upper())
+    return "".join(normalized).strip()
+
+
+# Keyed by the backend too, so offline benchmark results never answer Oracle queries
+def fingerprint(query: str, max_rows: int = MAX_ROWS) -> str:
+    return hashlib.sha256(f"{backend_name()}:{max_rows}:{normalize_sql(query)}".encode("utf-8")).hexdigest()
+
+
+def encode_result(df):
+    # Parquet keeps blobs small; frames pyarrow can't type (mixed objects, raw LOB bytes) fall back to pickle
+    buf = io.BytesIO()
+    try:
+        df.to_parquet(buf, index=False, compression="zstd")
+        return "parquet", buf.getvalue()
+    except Exception:
+        return "pickle", pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_result(fmt, blob):
+    if fmt == "parquet":
+        return pd.read_parquet(io.BytesIO(blob))
+    return pickle.loads(blob)
+
+
+# Disk-backed result cache with TTL expiry and size-bounded LRU eviction
+class QueryCache:
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS query_cache (
+                key TEXT PRIMARY KEY,
+                query TEXT,
+                format TEXT,
+                result BLOB,
+                size INTEGER,
+                created REAL,
+                last_access REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_query_cache_access ON query_cache(last_access)")
+        self.conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT format, result, created FROM query_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            fmt, blob, created = row
+            if now - created > self.ttl:
+                self.conn.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE query_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        return decode_result(fmt, blob)
+
+    def put(self, key, query, df):
+        fmt, blob = encode_result(df)
+        now = time.time()
+        with self.lock:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO query_cache (key, query, format, result, size, created, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (key, query, fmt, blob, len(blob), now, now))
+            self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now):
+        self.conn.execute("DELETE FROM query_cache WHERE created < ?", (now - self.ttl,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM query_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the cache fits again
+        rows = self.conn.execute("SELECT key, size FROM query_cache ORDER BY last_access ASC").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM query_cache WHERE key = ?", stale)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryCache()
+        return _cache
+
+
+# run_sql with the result cache in front of it. Hits never touch Oracle; errors are not cached.
+# On a miss, `guard(query)` (if given) may veto the query or hand back a rewritten one to
+# execute, as (sql, sample percent, rejection) like sql_guard.check_cost. A rewritten query
+# is cached under its own SQL, never the original's, and a sampled frame carries
+# attrs["sample_percent"] so render_result labels it as an estimate.
+def cached_run_sql(query: str, max_rows: int = MAX_ROWS, guard=None):
+    cache = get_cache()
+    key = fingerprint(query, max_rows)
+    result = cache.get(key)
+    if result is not None:
+        annotate(cached=1)
+        return result
+    to_run, sample_percent = query, None
+    if guard is not None:
+        to_run, sample_percent, rejection = guard(query)
+        if rejection:
+            return f"[SQL Error] Query rejected: {rejection}"
+        if to_run != query:
+            key = fingerprint(to_run, max_rows)
+            result = cache.get(key)
+            if result is not None:
+                annotate(cached=1)
+    if result is None:
+        result = run_sql(to_run, max_rows=max_rows)
+        if isinstance(result, pd.DataFrame):
+            cache.put(key, to_run, result)
+    if sample_percent and isinstance(result, pd.DataFrame):
+        result.attrs["sample_percent"] = sample_percent
+    return result
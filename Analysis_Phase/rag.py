@@ -0,0 +1,273 @@
+import os
+import re
+import sqlite3
+import threading
+import zlib
+import numpy as np
+from logger import DB_PATH
+from log_store import federated_query
+
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", "rag_index")
+EMBED_DIM = 1024
+SNIPPET_CHARS = 600
+# Switch from flat search to IVF once the index is large enough to train centroids on
+IVF_LISTS = 64
+IVF_MIN_VECTORS = IVF_LISTS * 40
+IVF_PROBES = 8
+
+STOPWORDS = {
+    "select", "from", "where", "and", "or", "as", "by", "group", "order", "count", "distinct",
+    "is", "not", "null", "prop", "rownum", "the", "a", "an", "of", "to", "in", "this", "that",
+    "table", "with", "for", "are", "be", "on", "it", "which", "having", "desc", "asc",
+}
+
+
+# Rough prompt cost of a piece of text (about 4 characters per token)
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+# Deterministic feature-hashing embedder. Identifiers are kept whole and also split on
+# underscores, so NUM_PROP_WARDNO matches both itself and other *_WARDNO columns.
+class HashingEmbedder:
+    def __init__(self, dim=EMBED_DIM):
+        self.dim = dim
+
+    def _features(self, text):
+        for token in re.findall(r"[A-Za-z0-9_]+", text.lower()):
+            if token in STOPWORDS or token.isdigit():
+                continue
+            yield token
+            parts = [p for p in token.split("_") if p and p not in STOPWORDS and not p.isdigit()]
+            if len(parts) > 1:
+                yield from parts
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                vectors[i, h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-6)
+
+
+# Embeddings from Mistral's API, for when lexical matching isn't enough
+class MistralEmbedder:
+    def __init__(self, client, model="mistral-embed", dim=1024):
+        self.client = client
+        self.model = model
+        self.dim = dim
+
+    def embed(self, texts):
+        response = self.client.embeddings.create(model=self.model, input=list(texts))
+        vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-6)
+
+
+# Vectors are appended to a raw float32 file and searched through a read-only memmap;
+# snippet text and IVF list assignments live in a small SQLite file beside it.
+class VectorIndex:
+    def __init__(self, directory=INDEX_DIR, embedder=None):
+        self.embedder = embedder or HashingEmbedder()
+        self.dim = self.embedder.dim
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.centroids_path = os.path.join(directory, "centroids.npy")
+        self.conn = sqlite3.connect(os.path.join(directory, "meta.db"), check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS snippets (
+                position INTEGER PRIMARY KEY,
+                timestamp TEXT,
+                step INTEGER,
+                table_name TEXT,
+                text TEXT,
+                list_id INTEGER,
+                UNIQUE (timestamp, step)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_snippets_list ON snippets(list_id)")
+        # Highest log id indexed per shard file. Ids grow in insert order within a store,
+        # unlike timestamps, which several workers and the batched writer commit out of order.
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                shard TEXT PRIMARY KEY,
+                last_id INTEGER
+            )
+        """)
+        self.conn.commit()
+        self.centroids = np.load(self.centroids_path) if os.path.exists(self.centroids_path) else None
+
+    def __len__(self):
+        if not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.dim)
+
+    def _matrix(self):
+        n = len(self)
+        if n == 0:
+            return None
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+
+    def _assign(self, vectors):
+        if self.centroids is None:
+            return [None] * len(vectors)
+        return np.argmax(vectors @ self.centroids.T, axis=1).tolist()
+
+    def add(self, rows):
+        # rows: (timestamp, step, table_name, text)
+        with self.lock:
+            known = {
+                (ts, step) for ts, step in self.conn.execute(
+                    "SELECT timestamp, step FROM snippets WHERE timestamp >= ?",
+                    (min(r[0] or "" for r in rows),),
+                )
+            } if rows else set()
+            fresh = []
+            for row in rows:
+                # Overlapping legacy shards hold the same row more than once
+                if (row[0], row[1]) not in known:
+                    known.add((row[0], row[1]))
+                    fresh.append(row)
+            rows = fresh
+            if not rows:
+                return 0
+            vectors = self.embedder.embed([r[3] for r in rows])
+            start = len(self)
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.astype(np.float32).tobytes())
+            lists = self._assign(vectors)
+            self.conn.executemany("""
+                INSERT INTO snippets (position, timestamp, step, table_name, text, list_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(start + i, *row, lists[i]) for i, row in enumerate(rows)])
+            self.conn.commit()
+            if self.centroids is None and len(self) >= IVF_MIN_VECTORS:
+                self._train()
+            return len(rows)
+
+    # A few rounds of k-means over a sample of the stored vectors
+    def _train(self, iters=10, sample=20000):
+        matrix = self._matrix()
+        rng = np.random.default_rng(0)
+        idx = rng.choice(len(matrix), size=min(sample, len(matrix)), replace=False)
+        data = np.asarray(matrix[np.sort(idx)])
+        centroids = data[rng.choice(len(data), size=IVF_LISTS, replace=False)].copy()
+        for _ in range(iters):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            for c in range(IVF_LISTS):
+                members = data[labels == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-6)
+        self.centroids = centroids.astype(np.float32)
+        np.save(self.centroids_path, self.centroids)
+
+        updates = []
+        for start in range(0, len(matrix), 8192):
+            block = np.asarray(matrix[start:start + 8192])
+            for offset, label in enumerate(np.argmax(block @ self.centroids.T, axis=1)):
+                updates.append((int(label), start + offset))
+        self.conn.executemany("UPDATE snippets SET list_id = ? WHERE position = ?", updates)
+        self.conn.commit()
+
+    def search(self, text, k=10):
+        matrix = self._matrix()
+        if matrix is None:
+            return []
+        query = self.embedder.embed([text])[0]
+        with self.lock:
+            if self.centroids is not None:
+                probes = np.argsort(-(self.centroids @ query))[:IVF_PROBES].tolist()
+                placeholders = ",".join("?" * len(probes))
+                positions = np.array([p for (p,) in self.conn.execute(
+                    f"SELECT position FROM snippets WHERE list_id IN ({placeholders})", probes
+                )], dtype=np.int64)
+                positions = positions[positions < len(matrix)]
+            else:
+                positions = np.arange(len(matrix))
+            if len(positions) == 0:
+                return []
+            scores = np.asarray(matrix[positions]) @ query
+            top = np.argsort(-scores)[:k]
+            hits = []
+            for i in top:
+                row = self.conn.execute(
+                    "SELECT table_name, step, text FROM snippets WHERE position = ?", (int(positions[i]),)
+                ).fetchone()
+                if row:
+                    hits.append((float(scores[i]), *row))
+        return hits
+
+    # Index log rows written since the last sync, across every shard. Each shard is read
+    # past its own id watermark; a shard seen for the first time (freshly rotated or
+    # compacted) is read in full and add() skips the rows already indexed.
+    def sync(self, db_path=DB_PATH):
+        with self.sync_lock:
+            return self._sync(db_path)
+
+    def _sync(self, db_path):
+        with self.lock:
+            marks = dict(self.conn.execute("SELECT shard, last_id FROM sync_state"))
+        watermark = "CASE shard " + "WHEN ? THEN ? " * len(marks) + "ELSE 0 END" if marks else "0"
+        rows = federated_query(f"""
+            SELECT shard, id, timestamp, step, table_name, query, explanation FROM all_logs
+            WHERE id > {watermark} AND (query IS NOT NULL OR explanation IS NOT NULL)
+        """, [value for mark in marks.items() for value in mark], db_path)
+        rows.sort(key=lambda r: (r[0], r[1]))
+        last_ids = {}
+        snippets = []
+        for shard, row_id, timestamp, step, table_name, query, explanation in rows:
+            last_ids[shard] = row_id
+            parts = []
+            if query:
+                parts.append(f"SQL: {query}")
+            if explanation:
+                parts.append(f"Explanation: {explanation}")
+            snippets.append((timestamp, step, table_name, "\n".join(parts)[:SNIPPET_CHARS]))
+        added = 0
+        for start in range(0, len(snippets), 1000):
+            added += self.add(snippets[start:start + 1000])
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO sync_state (shard, last_id) VALUES (?, ?)",
+                                  list(last_ids.items()))
+            self.conn.commit()
+        return added
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = VectorIndex()
+        return _index
+
+
+# Top-k snippets related to `text` from any table, packed into `token_budget` tokens.
+# At most `per_table` snippets come from one table so a single neighbour can't fill the budget.
+def retrieve_context(index, text, k=8, token_budget=600, min_score=0.1, per_table=2):
+    lines = []
+    used = 0
+    seen = set()
+    per_table_count = {}
+    for score, table_name, step, snippet in index.search(text, k=k * 4):
+        if score < min_score or snippet in seen or per_table_count.get(table_name, 0) >= per_table:
+            continue
+        line = f"[{table_name or 'unknown'} / step {step}] {snippet}"
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            continue
+        seen.add(snippet)
+        per_table_count[table_name] = per_table_count.get(table_name, 0) + 1
+        lines.append(line)
+        used += cost
+        if len(lines) >= k:
+            break
+    return "\n".join(lines)
@@ -0,0 +1,346 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from query_cache import cached_run_sql
+from profiler import NUMERIC_TYPES, CHAR_TYPES
+from schema_catalog import CATALOG_PATH
+
+SCHEMA_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Datasets", "aoms_schema.csv")
+GRAPH_PATH = os.getenv("RELATIONSHIP_GRAPH_PATH", "relationship_graph.json")
+SKETCH_PATH = os.getenv("RELATIONSHIP_SKETCH_PATH", "relationship_sketches.db")
+SKETCH_K = 256            # bottom-k hashes kept per column
+COLUMNS_PER_QUERY = 20    # UNION ALL branches per sketch query
+MIN_CONTAINMENT = 0.8
+MIN_DISTINCT = 5          # constant-ish columns (e.g. a single ULBID) overlap trivially
+HASH_SPACE = 2 ** 32      # ORA_HASH range
+# Tables past this many rows are sketched from the values hashing below a cutoff that
+# leaves about HASH_FILTER_MARGIN * k distinct values per column. The cutoff is on the
+# hash, so every table keeps the same subset of key values and the bottom-k is unchanged.
+HASH_FILTER_MIN_ROWS = 1_000_000
+HASH_FILTER_MARGIN = 8
+
+TYPE_PREFIXES = {"NUM", "VAR", "DAT", "NVAR", "CHR", "CHAR", "INT", "FLT"}
+KEY_SUFFIXES = ("ID", "IDNO", "NO", "CODE")
+NOT_KEYS = {"EMAILID", "MOBILENO", "PHONENO", "SRNO", "FLATNO", "HOUSENO", "OLDHOUSENO"}
+
+
+# Key concept a column name refers to, with the type prefix and table abbreviation
+# dropped: NUM_PROP_CONSTTYPEID -> CONSTTYPEID, and a table's own NUM_CONSTTYPE_ID ->
+# CONSTTYPEID as well, so a master's primary key lands next to the columns pointing at it.
+def key_concept(column_name):
+    parts = [p for p in column_name.upper().split("_") if p]
+    if len(parts) > 1 and parts[0] in TYPE_PREFIXES:
+        parts = parts[1:]
+    if len(parts) > 1 and parts[-1] in KEY_SUFFIXES:
+        concept = parts[-2] + parts[-1]
+    else:
+        concept = parts[-1]
+    if concept in NOT_KEYS or not concept.endswith(KEY_SUFFIXES):
+        return None
+    return concept
+
+
+def _type_family(data_type):
+    base = data_type.upper().split("(")[0].strip()
+    if base in NUMERIC_TYPES:
+        return "number"
+    if base in CHAR_TYPES:
+        return "text"
+    return None
+
+
+# Column catalog: the local schema snapshot when it has been built, otherwise the CSV export
+def load_columns(catalog_path=CATALOG_PATH, csv_path=SCHEMA_CSV):
+    if os.path.exists(catalog_path):
+        conn = sqlite3.connect(catalog_path)
+        try:
+            rows = conn.execute("SELECT table_name, column_name, data_type FROM columns").fetchall()
+        finally:
+            conn.close()
+        if rows:
+            return rows
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return [(r["TABLE_NAME"], r["COLUMN_NAME"], r["DATA_TYPE"]) for r in csv.DictReader(f)]
+
+
+def load_num_rows(catalog_path=CATALOG_PATH):
+    if not os.path.exists(catalog_path):
+        return {}
+    conn = sqlite3.connect(catalog_path)
+    try:
+        return dict(conn.execute("SELECT table_name, num_rows FROM tables"))
+    finally:
+        conn.close()
+
+
+# Candidate key pairs: columns in different tables sharing a key concept and a type family
+def candidate_pairs(columns):
+    groups = defaultdict(list)
+    for table_name, column_name, data_type in columns:
+        concept = key_concept(column_name)
+        family = _type_family(data_type)
+        if concept and family:
+            groups[concept, family].append((table_name, column_name))
+    pairs = []
+    for (concept, _), members in groups.items():
+        members = sorted(set(members))
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                if a[0] != b[0]:
+                    pairs.append((a, b, concept))
+    return pairs
+
+
+# Bottom-k sketch of a column's distinct values: the k smallest ORA_HASH values.
+# One sketch gives both a distinct-count estimate and, merged with another column's,
+# a Jaccard/containment estimate, so no pairwise joins are needed.
+class Sketch:
+    def __init__(self, hashes, k=SKETCH_K):
+        self.hashes = np.unique(np.asarray(hashes, dtype=np.int64))[:k]
+        self.k = k
+
+    def distinct(self):
+        if len(self.hashes) < self.k:
+            return float(len(self.hashes))
+        return (self.k - 1) * HASH_SPACE / float(self.hashes[-1] + 1)
+
+    # (|A∩B|/|A|, |A∩B|/|B|, jaccard)
+    def overlap(self, other):
+        k = min(self.k, other.k)
+        union = np.union1d(self.hashes, other.hashes)[:k]
+        if len(union) == 0:
+            return 0.0, 0.0, 0.0
+        both = np.intersect1d(np.intersect1d(union, self.hashes), other.hashes)
+        jaccard = len(both) / len(union)
+        if len(union) < k:
+            union_size = float(len(union))
+        else:
+            union_size = (k - 1) * HASH_SPACE / float(union[-1] + 1)
+        common = jaccard * union_size
+        return (min(1.0, common / max(self.distinct(), 1.0)),
+                min(1.0, common / max(other.distinct(), 1.0)),
+                jaccard)
+
+
+def _quote_literal(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+# Hash cutoff for a table of `num_rows` rows, or None to hash every value
+def hash_cutoff(num_rows, k=SKETCH_K):
+    if not num_rows or num_rows <= HASH_FILTER_MIN_ROWS:
+        return None
+    return int(HASH_SPACE * min(1.0, HASH_FILTER_MARGIN * k / num_rows))
+
+
+# Bottom-k hashes of each column over the whole table (never a SAMPLE: containment between
+# a sampled and a full sketch is biased low). With `cutoff`, only hashes below it are kept.
+def sketch_query(table_name, column_names, k=SKETCH_K, cutoff=None):
+    source = f"PROP.{_quote(table_name)}"
+    keep = f" WHERE h < {int(cutoff)}" if cutoff else ""
+    branches = "\n            UNION ALL\n".join(
+        f"            SELECT DISTINCT {_quote_literal(name)} col, h FROM ("
+        f"SELECT ORA_HASH(TRIM(TO_CHAR({_quote(name)}))) h FROM {source} WHERE {_quote(name)} IS NOT NULL){keep}"
+        for name in column_names
+    )
+    return f"""
+        SELECT col, h FROM (
+            SELECT col, h, ROW_NUMBER() OVER (PARTITION BY col ORDER BY h) rn FROM (
+{branches}
+            )
+        ) WHERE rn <= {k}
+    """
+
+
+# Persisted per-column sketches so each column is hashed on the server once
+class SketchStore:
+    def __init__(self, path=SKETCH_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sketches (
+                table_name TEXT,
+                column_name TEXT,
+                k INTEGER,
+                sampled INTEGER,
+                hashes BLOB,
+                PRIMARY KEY (table_name, column_name)
+            )
+        """)
+        self.conn.commit()
+
+    # Sketches built from a SAMPLE by older versions don't count; they are rebuilt
+    def get(self, table_name, column_name, k=SKETCH_K):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT hashes FROM sketches WHERE table_name = ? AND column_name = ? AND k >= ? AND sampled = 0",
+                (table_name, column_name, k),
+            ).fetchone()
+        return Sketch(np.frombuffer(row[0], dtype=np.int64), k) if row else None
+
+    def put(self, table_name, column_name, sketch):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO sketches VALUES (?, ?, ?, 0, ?)",
+                              (table_name, column_name, sketch.k, sketch.hashes.tobytes()))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def _sketch_batch(table_name, batch, k, cutoff):
+    result = cached_run_sql(sketch_query(table_name, batch, k, cutoff), max_rows=k * len(batch))
+    if not isinstance(result, pd.DataFrame):
+        print(f"[Sketch failed] {table_name}: {result}")
+        return None
+    result.columns = [c.upper() for c in result.columns]
+    grouped = result.groupby("COL")["H"]
+    return {name: grouped.get_group(name).to_numpy() if name in grouped.groups else [] for name in batch}
+
+
+# Sketch every column of one table that still lacks one, a batch of columns per query.
+# A column with fewer than k hashes under the cutoff (few distinct values) is re-sketched
+# without it, since its bottom-k may lie above the cutoff.
+def sketch_table(store, table_name, column_names, num_rows=None, k=SKETCH_K):
+    missing = [c for c in column_names if store.get(table_name, c, k) is None]
+    cutoff = hash_cutoff(num_rows, k)
+    for start in range(0, len(missing), COLUMNS_PER_QUERY):
+        batch = missing[start:start + COLUMNS_PER_QUERY]
+        hashes = _sketch_batch(table_name, batch, k, cutoff)
+        if hashes is None:
+            continue
+        short = [name for name in batch if cutoff and len(hashes[name]) < k]
+        if short:
+            hashes.update(_sketch_batch(table_name, short, k, None) or {name: None for name in short})
+        for name in batch:
+            if hashes[name] is not None:
+                store.put(table_name, name, Sketch(hashes[name], k))
+
+
+# Verify candidate pairs against their sketches. An edge points from the column whose
+# values are (mostly) contained in the other, i.e. from referencing to referenced.
+def score_pairs(pairs, sketches, min_containment=MIN_CONTAINMENT, min_distinct=MIN_DISTINCT):
+    edges = []
+    for a, b, concept in pairs:
+        sa, sb = sketches.get(a), sketches.get(b)
+        if sa is None or sb is None or min(sa.distinct(), sb.distinct()) < min_distinct:
+            continue
+        a_in_b, b_in_a, jaccard = sa.overlap(sb)
+        if max(a_in_b, b_in_a) < min_containment:
+            continue
+        child, parent, containment = (a, b, a_in_b) if a_in_b >= b_in_a else (b, a, b_in_a)
+        edges.append({
+            "from_table": child[0], "from_column": child[1],
+            "to_table": parent[0], "to_column": parent[1],
+            "concept": concept, "containment": round(containment, 3), "jaccard": round(jaccard, 3),
+            "source": "overlap",
+        })
+    return edges
+
+
+def declared_edges(catalog_path=CATALOG_PATH):
+    if not os.path.exists(catalog_path):
+        return []
+    conn = sqlite3.connect(catalog_path)
+    try:
+        rows = conn.execute("""
+            SELECT table_name, column_name, r_table_name, r_column_name
+            FROM constraints WHERE constraint_type = 'R' AND r_table_name IS NOT NULL
+        """).fetchall()
+    finally:
+        conn.close()
+    return [{"from_table": t, "from_column": c, "to_table": rt, "to_column": rc, "concept": None,
+             "containment": 1.0, "jaccard": None, "source": "constraint"} for t, c, rt, rc in rows]
+
+
+# Whole batch job: propose pairs, sketch each involved column once, score, write the graph
+def build_relationship_graph(out_path=GRAPH_PATH, workers=4, tables=None, k=SKETCH_K):
+    columns = load_columns()
+    if tables:
+        wanted = {t.upper() for t in tables}
+        columns = [c for c in columns if c[0] in wanted]
+    pairs = candidate_pairs(columns)
+    involved = defaultdict(set)
+    for a, b, _ in pairs:
+        involved[a[0]].add(a[1])
+        involved[b[0]].add(b[1])
+    print(f"{len(pairs)} candidate pairs over {sum(map(len, involved.values()))} columns in {len(involved)} tables")
+
+    num_rows = load_num_rows()
+    store = SketchStore()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda t: sketch_table(store, t, sorted(involved[t]), num_rows.get(t), k), involved))
+        sketches = {(t, c): store.get(t, c, k) for t, cols in involved.items() for c in cols}
+    finally:
+        store.close()
+
+    edges = declared_edges() + score_pairs(pairs, sketches)
+    seen = set()
+    unique = []
+    for edge in edges:
+        key = (edge["from_table"], edge["from_column"], edge["to_table"], edge["to_column"])
+        if key not in seen:
+            seen.add(key)
+            unique.append(edge)
+    graph = {"nodes": sorted({e["from_table"] for e in unique} | {e["to_table"] for e in unique}), "edges": unique}
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(graph, f, indent=1)
+    return graph
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_graph(path=GRAPH_PATH):
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    _graph = json.load(f)
+            else:
+                _graph = {"nodes": [], "edges": []}
+        return _graph
+
+
+# Prompt lines for one table: the verified relationships it takes part in
+def format_relationships(table_name, graph, limit=15):
+    name = table_name.upper()
+    lines = []
+    for e in graph["edges"]:
+        if name not in (e["from_table"], e["to_table"]):
+            continue
+        note = "declared FK" if e["source"] == "constraint" else f"{e['containment']:.0%} of values match"
+        lines.append(f"- {e['from_table']}.{e['from_column']} -> {e['to_table']}.{e['to_column']} ({note})")
+    lines.sort(key=lambda line: "declared FK" not in line)
+    return "\n".join(lines[:limit])
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from db import close_pool
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Discover key relationships between PROP tables")
+    parser.add_argument("--out", default=GRAPH_PATH)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--tables", nargs="*", help="restrict to these tables")
+    args = parser.parse_args()
+
+    graph = build_relationship_graph(args.out, workers=args.workers, tables=args.tables)
+    print(f"✅ {args.out} written: {len(graph['edges'])} relationships between {len(graph['nodes'])} tables.")
+    close_pool()
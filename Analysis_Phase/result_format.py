@@ -0,0 +1,53 @@
+import os
+import pandas as pd
+
+PREVIEW_ROWS = 5
+CELL_CHARS = 60
+RESULTS_DIR = os.getenv("RESULTS_DIR", "results")
+
+
+# Whole-column cleanup: raw bytes decoded, missing values blanked, everything as str
+def clean_column(series):
+    if series.dtype == object:
+        try:
+            decoded = series.str.decode("utf-8", errors="replace")
+            series = decoded.where(decoded.notna(), series)
+        except AttributeError:
+            pass  # no str/bytes values in this column
+    cleaned = series.astype(object).where(series.notna(), "").astype(str)
+    return cleaned.str.slice(0, CELL_CHARS).str.replace("|", "\\|", regex=False).str.replace("\n", " ", regex=False)
+
+
+# Compact, token-cheap table for the prompt: a header line and one line per row,
+# pipe-separated, with a note when rows were cut. Only the rows shown are cleaned.
+# Results the cost gate ran on a SAMPLE (attrs["sample_percent"]) are labelled as such.
+# A frame that filled the fetch cap (`row_cap`) may have had more rows, so its count is "N+".
+def render_result(df, max_rows=PREVIEW_ROWS, row_cap=None):
+    note = []
+    if df.attrs.get("sample_percent"):
+        note.append(f"[sampled at {df.attrs['sample_percent']:.4g}% of the table: "
+                    f"counts and sums are estimates, not exact]")
+    shown = df.head(max_rows)
+    if shown.empty:
+        return "\n".join(note + ["|".join(map(str, df.columns)), "[0 rows]"])
+    columns = [clean_column(shown[col]) for col in shown.columns]
+    lines = note + ["|".join(map(str, df.columns))]
+    lines.extend("|".join(row) for row in zip(*columns))
+    total = f"{len(df)}+" if row_cap and len(df) >= row_cap else str(len(df))
+    if len(df) > len(shown):
+        lines.append(f"[{len(shown)} of {total} rows shown]")
+    else:
+        lines.append(f"[{total} rows]")
+    return "\n".join(lines)
+
+
+# Full result as parquet, for results larger than what the prompt shows
+def persist_result(df, name, directory=RESULTS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.parquet")
+    try:
+        df.to_parquet(path, index=False)
+    except Exception:
+        # Columns pyarrow can't type (raw LOB bytes, mixed objects) are stored as text
+        pd.DataFrame({col: clean_column(df[col]) for col in df.columns}).to_parquet(path, index=False)
+    return path
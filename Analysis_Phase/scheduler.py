@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+CHECKPOINT_PATH = "analysis_checkpoint.json"
+
+
+# Shared token bucket: every worker takes a token before calling the LLM,
+# so total throughput is bounded by `rate` no matter how many tables are in flight
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Records which tables have been fully analyzed so a crashed run resumes where it
+# left off. Completion is out of order when several tables run at once, so the whole
+# set is stored rather than a single "last index". Entries are table names, not chunk
+# indices: initial_prompt.txt is regenerated incrementally, and an added or dropped
+# table shifts every index after it.
+class Checkpoint:
+    def __init__(self, path: str = CHECKPOINT_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                done = json.load(f).get("done", [])
+            self.done = {entry for entry in done if isinstance(entry, str)}
+            if len(self.done) < len(done):
+                print(f"[Checkpoint] ignoring {len(done) - len(self.done)} chunk indices from an older "
+                      f"checkpoint format; those tables will be analyzed again")
+
+    def __contains__(self, table_name):
+        return table_name in self.done
+
+    def mark_done(self, table_name):
+        with self.lock:
+            self.done.add(table_name)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"done": sorted(self.done)}, f)
+            os.replace(tmp_path, self.path)
+
+    def reset(self):
+        with self.lock:
+            self.done = set()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+# Run fn(step, item) for every pending (step, table_name, item) with `workers` tables
+# in flight. A failing table is reported and left out of the checkpoint so the next run
+# retries it; the names of the failed tables are returned.
+def run_concurrently(items, fn, workers=4, checkpoint=None):
+    pending = [(step, name, item) for step, name, item in items if checkpoint is None or name not in checkpoint]
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fn, step, item): (step, name) for step, name, item in pending}
+        for future in as_completed(futures):
+            step, name = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"[Step {step+1} ({name}) failed] {e}")
+                failed.append(name)
+                continue
+            if checkpoint is not None:
+                checkpoint.mark_done(name)
+    return failed
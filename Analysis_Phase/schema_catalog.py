@@ -0,0 +1,218 @@
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from db import get_pool
+
+CATALOG_PATH = os.getenv("SCHEMA_CATALOG_PATH", "schema_catalog.db")
+OWNER = "PROP"
+# Past this many changed tables it's cheaper to pull the whole owner than bind an IN list
+IN_LIST_LIMIT = 300
+BIND_CHUNK = 500
+FETCH_ARRAYSIZE = 5000
+
+TABLES_SQL = """
+    SELECT t.table_name, t.num_rows, t.last_analyzed, o.last_ddl_time
+    FROM all_tables t
+    JOIN all_objects o ON o.owner = t.owner AND o.object_name = t.table_name AND o.object_type = 'TABLE'
+    WHERE t.owner = :owner
+"""
+
+# Creating or rebuilding an index doesn't always touch the table's own last_ddl_time
+INDEX_DDL_SQL = """
+    SELECT i.table_name, MAX(o.last_ddl_time)
+    FROM all_indexes i
+    JOIN all_objects o ON o.owner = i.owner AND o.object_name = i.index_name AND o.object_type = 'INDEX'
+    WHERE i.table_owner = :owner
+    GROUP BY i.table_name
+"""
+
+COLUMNS_SQL = """
+    SELECT table_name, column_id, column_name, data_type, data_length, nullable
+    FROM all_tab_columns
+    WHERE owner = :owner {filter}
+"""
+
+CONSTRAINTS_SQL = """
+    SELECT c.table_name, c.constraint_name, c.constraint_type, cc.column_name, cc.position,
+           r.table_name, rc.column_name
+    FROM all_constraints c
+    JOIN all_cons_columns cc ON cc.owner = c.owner AND cc.constraint_name = c.constraint_name
+    LEFT JOIN all_constraints r ON r.owner = c.r_owner AND r.constraint_name = c.r_constraint_name
+    LEFT JOIN all_cons_columns rc ON rc.owner = r.owner AND rc.constraint_name = r.constraint_name
+                                  AND rc.position = cc.position
+    WHERE c.owner = :owner AND c.constraint_type IN ('P', 'U', 'R') {filter}
+"""
+
+INDEXES_SQL = """
+    SELECT i.table_name, i.index_name, i.uniqueness, ic.column_name, ic.column_position
+    FROM all_indexes i
+    JOIN all_ind_columns ic ON ic.index_owner = i.owner AND ic.index_name = i.index_name
+    WHERE i.table_owner = :owner {filter}
+"""
+
+
+def connect_catalog(path=CATALOG_PATH):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS tables (
+            table_name TEXT PRIMARY KEY,
+            num_rows INTEGER,
+            last_analyzed TEXT,
+            last_ddl_time TEXT
+        );
+        CREATE TABLE IF NOT EXISTS columns (
+            table_name TEXT,
+            column_id INTEGER,
+            column_name TEXT,
+            data_type TEXT,
+            data_length INTEGER,
+            nullable TEXT,
+            PRIMARY KEY (table_name, column_id)
+        );
+        CREATE TABLE IF NOT EXISTS constraints (
+            table_name TEXT,
+            constraint_name TEXT,
+            constraint_type TEXT,
+            column_name TEXT,
+            position INTEGER,
+            r_table_name TEXT,
+            r_column_name TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_constraints_table ON constraints(table_name);
+        CREATE TABLE IF NOT EXISTS indexes (
+            table_name TEXT,
+            index_name TEXT,
+            uniqueness TEXT,
+            column_name TEXT,
+            column_position INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_indexes_table ON indexes(table_name);
+    """)
+    return conn
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def _fetch(sql, params):
+    with get_pool().acquire() as connection:
+        with connection.cursor() as cursor:
+            cursor.arraysize = FETCH_ARRAYSIZE
+            cursor.prefetchrows = FETCH_ARRAYSIZE
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+# Run one detail query for the changed tables: a single owner-wide pull when many
+# tables changed, otherwise bound IN lists in chunks
+def _fetch_for_tables(sql, table_column, tables, full):
+    wanted = set(tables)
+    if full or len(tables) > IN_LIST_LIMIT:
+        return [row for row in _fetch(sql.format(filter=""), {"owner": OWNER}) if row[0] in wanted]
+    rows = []
+    tables = sorted(tables)
+    for start in range(0, len(tables), BIND_CHUNK):
+        chunk = tables[start:start + BIND_CHUNK]
+        binds = {f"t{i}": name for i, name in enumerate(chunk)}
+        names = ", ".join(f":{key}" for key in binds)
+        rows.extend(_fetch(sql.format(filter=f"AND {table_column} IN ({names})"), {"owner": OWNER, **binds}))
+    return [row for row in rows if row[0] in wanted]
+
+
+# Snapshot PROP's dictionary into the local catalog. Only tables whose DDL (or index
+# DDL) changed since the last snapshot have their columns, keys and indexes re-pulled;
+# row statistics are refreshed for every table since they change without DDL.
+def refresh_catalog(path=CATALOG_PATH, full=False):
+    conn = connect_catalog(path)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        tables_future = pool.submit(_fetch, TABLES_SQL, {"owner": OWNER})
+        index_ddl_future = pool.submit(_fetch, INDEX_DDL_SQL, {"owner": OWNER})
+        remote = tables_future.result()
+        index_ddl = {name: ddl for name, ddl in index_ddl_future.result()}
+
+    known = dict(conn.execute("SELECT table_name, last_ddl_time FROM tables"))
+    current = {}
+    for table_name, num_rows, last_analyzed, last_ddl_time in remote:
+        ddl = max(filter(None, (last_ddl_time, index_ddl.get(table_name))), default=None)
+        current[table_name] = (num_rows, _iso(last_analyzed), _iso(ddl))
+
+    changed = [name for name, (_, _, ddl) in current.items() if full or known.get(name) != ddl]
+    dropped = [name for name in known if name not in current]
+
+    if changed:
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            columns = pool.submit(_fetch_for_tables, COLUMNS_SQL, "table_name", changed, full)
+            constraints = pool.submit(_fetch_for_tables, CONSTRAINTS_SQL, "c.table_name", changed, full)
+            indexes = pool.submit(_fetch_for_tables, INDEXES_SQL, "i.table_name", changed, full)
+            columns, constraints, indexes = columns.result(), constraints.result(), indexes.result()
+    else:
+        columns, constraints, indexes = [], [], []
+
+    stale = [(name,) for name in changed + dropped]
+    for table in ("columns", "constraints", "indexes"):
+        conn.executemany(f"DELETE FROM {table} WHERE table_name = ?", stale)
+    conn.executemany("DELETE FROM tables WHERE table_name = ?", [(name,) for name in dropped])
+    conn.executemany("""
+        INSERT OR REPLACE INTO tables (table_name, num_rows, last_analyzed, last_ddl_time)
+        VALUES (?, ?, ?, ?)
+    """, [(name, *values) for name, values in current.items()])
+    conn.executemany("INSERT INTO columns VALUES (?, ?, ?, ?, ?, ?)", columns)
+    conn.executemany("INSERT INTO constraints VALUES (?, ?, ?, ?, ?, ?, ?)", constraints)
+    conn.executemany("INSERT INTO indexes VALUES (?, ?, ?, ?, ?)", indexes)
+    conn.commit()
+    conn.close()
+    return len(changed), len(dropped)
+
+
+def table_details(conn, table_name):
+    columns = conn.execute(
+        "SELECT column_name, data_type FROM columns WHERE table_name = ? ORDER BY column_id", (table_name,)
+    ).fetchall()
+    keys = {}
+    for name, ctype, column, r_table, r_column in conn.execute("""
+        SELECT constraint_name, constraint_type, column_name, r_table_name, r_column_name
+        FROM constraints WHERE table_name = ? ORDER BY constraint_name, position
+    """, (table_name,)):
+        entry = keys.setdefault(name, {"type": ctype, "columns": [], "r_table": r_table, "r_columns": []})
+        entry["columns"].append(column)
+        if r_column:
+            entry["r_columns"].append(r_column)
+    indexes = {}
+    for name, uniqueness, column in conn.execute("""
+        SELECT index_name, uniqueness, column_name FROM indexes
+        WHERE table_name = ? ORDER BY index_name, column_position
+    """, (table_name,)):
+        indexes.setdefault(name, {"unique": uniqueness == "UNIQUE", "columns": []})["columns"].append(column)
+    return columns, keys, indexes
+
+
+def render_table(conn, table_name, num_rows):
+    columns, keys, indexes = table_details(conn, table_name)
+    lines = [f"Table: {table_name}",
+             "Columns: " + ", ".join(f"{col} ({dtype})" for col, dtype in columns)]
+    primary = [k for k in keys.values() if k["type"] == "P"]
+    if primary:
+        lines.append("Primary key: " + ", ".join(primary[0]["columns"]))
+    foreign = [k for k in keys.values() if k["type"] == "R" and k["r_table"]]
+    if foreign:
+        lines.append("Foreign keys: " + "; ".join(
+            f"{', '.join(k['columns'])} -> {OWNER}.{k['r_table']}({', '.join(k['r_columns'])})" for k in foreign
+        ))
+    if indexes:
+        lines.append("Indexes: " + "; ".join(
+            f"{name} ({', '.join(ix['columns'])}){' unique' if ix['unique'] else ''}" for name, ix in indexes.items()
+        ))
+    if num_rows is not None:
+        lines.append(f"Rows (stats): {num_rows}")
+    return "\n".join(lines)
+
+
+# Write the agent's schema file from the catalog, one block per table
+def write_prompt_file(out_path="initial_prompt.txt", path=CATALOG_PATH):
+    conn = connect_catalog(path)
+    tables = conn.execute("SELECT table_name, num_rows FROM tables ORDER BY table_name").fetchall()
+    with open(out_path, "w") as f:
+        f.write("\n\n".join(render_table(conn, name, num_rows) for name, num_rows in tables))
+    conn.close()
+    return len(tables)
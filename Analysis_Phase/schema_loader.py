@@ -1,15 +1,79 @@
+import fnmatch
+import mmap
+import os
+
+TABLE_MARKER = b"Table:"
+
+
+# Byte-offset index over the schema file. Only the "Table:" lines are scanned up front;
+# a chunk's text is read from the mmap when it is asked for, so seeking to a table by
+# name or number is O(1) and filtering by name never parses the other chunks.
+class SchemaIndex:
+    def __init__(self, file_path: str, max_lines: int = 20):
+        self.file_path = file_path
+        self.max_lines = max_lines
+        self.offsets = []
+        self.table_names = []
+        self.positions = {}
+        self._file = open(file_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._scan()
+
+    def _scan(self):
+        mm = self._mm
+        pos = 0 if mm[:len(TABLE_MARKER)] == TABLE_MARKER else mm.find(b"\n" + TABLE_MARKER)
+        if pos > 0:
+            pos += 1
+        while pos != -1:
+            line_end = mm.find(b"\n", pos)
+            line = mm[pos:line_end if line_end != -1 else len(mm)]
+            name = line[len(TABLE_MARKER):].strip().decode("utf-8")
+            self.positions.setdefault(name, len(self.offsets))
+            self.offsets.append(pos)
+            self.table_names.append(name)
+            if line_end == -1:
+                break
+            pos = mm.find(b"\n" + TABLE_MARKER, line_end)
+            if pos != -1:
+                pos += 1
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, step):
+        if step < 0:
+            step += len(self.offsets)
+        start = self.offsets[step]
+        end = self.offsets[step + 1] if step + 1 < len(self.offsets) else len(self._mm)
+        lines = self._mm[start:end].decode("utf-8").splitlines(keepends=True)
+        return "".join(lines[:self.max_lines])
+
+    def __iter__(self):
+        for step in range(len(self)):
+            yield self[step]
+
+    def name(self, step):
+        return self.table_names[step]
+
+    def position(self, table_name):
+        return self.positions.get(table_name)
+
+    def get(self, table_name):
+        step = self.position(table_name)
+        return None if step is None else self[step]
+
+    # Chunk numbers to analyze: from `start` on, optionally only tables matching a glob pattern
+    def steps(self, start=0, pattern=None):
+        for step in range(start, len(self)):
+            if pattern is None or fnmatch.fnmatchcase(self.table_names[step], pattern.upper()):
+                yield step
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+
 def load_schema_chunks(file_path: str, max_lines: int = 20):
-    with open(file_path, "r") as f:
-        lines = f.readlines()
-
-    chunks = []
-    current = []
-    for line in lines:
-        if line.startswith("Table:") and current:
-            chunks.append("".join(current))
-            current = [line]
-        else:
-            current.append(line)
-    if current:
-        chunks.append("".join(current))
-    return chunks
+    return SchemaIndex(file_path, max_lines=max_lines)
@@ -0,0 +1,205 @@
+import os
+import re
+import uuid
+from db import get_pool, get_backend, CALL_TIMEOUT_MS
+
+OWNER = "PROP"
+MAX_PLAN_COST = float(os.getenv("SQL_GUARD_MAX_COST", "500000"))
+MAX_PLAN_ROWS = float(os.getenv("SQL_GUARD_MAX_ROWS", "20000000"))
+# Sample size aimed for when an over-budget single-table query is rewritten
+TARGET_SAMPLE_ROWS = 1_000_000
+
+FORBIDDEN = {
+    "INSERT", "UPDATE", "DELETE", "MERGE", "UPSERT", "DROP", "TRUNCATE", "ALTER", "CREATE", "RENAME",
+    "GRANT", "REVOKE", "EXECUTE", "EXEC", "BEGIN", "DECLARE", "CALL", "LOCK", "COMMIT", "ROLLBACK",
+    "SAVEPOINT", "COMMENT", "PURGE", "FLASHBACK", "ANALYZE", "AUDIT",
+}
+# Dictionary views and DUAL may be read unqualified
+UNQUALIFIED_OK = re.compile(r"^(DUAL|ALL_\w+|USER_\w+|DBA_\w+|V\$\w+)$")
+CLAUSE_END = {"WHERE", "GROUP", "ORDER", "HAVING", "CONNECT", "START", "UNION", "INTERSECT", "MINUS",
+              "FETCH", "OFFSET", "ON", "USING", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS",
+              "NATURAL", "OUTER", "MODEL", "PIVOT", "UNPIVOT", "SAMPLE", "WINDOW", "FOR"}
+
+FUNCTIONS_WITH_FROM = {"EXTRACT", "TRIM"}
+
+_token = re.compile(r"""
+    '(?:[^']|'')*'        # string literal
+  | "[^"]*"               # quoted identifier
+  | [A-Za-z_][\w$#]*(?:\s*\.\s*(?:[A-Za-z_][\w$#]*|"[^"]*"))*   # (qualified) identifier
+  | \d+(?:\.\d+)?
+  | <>|!=|<=|>=|\|\|
+  | \S
+""", re.VERBOSE)
+
+
+# Comments blanked out with spaces, so token offsets still point into the original text
+def _strip_comments(sql):
+    blank = lambda m: " " * len(m.group())
+    sql = re.sub(r"--[^\n]*", blank, sql)
+    return re.sub(r"/\*.*?\*/", blank, sql, flags=re.DOTALL)
+
+
+def _matches(sql):
+    return [m for m in _token.finditer(_strip_comments(sql)) if not m.group().isspace()]
+
+
+def tokenize(sql):
+    return [m.group() for m in _matches(sql)]
+
+
+def _word(token):
+    return re.sub(r"\s+", "", token).upper()
+
+
+def _skip_parens(tokens, i):
+    depth = 0
+    while i < len(tokens):
+        if tokens[i] == "(":
+            depth += 1
+        elif tokens[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+# Table references after FROM (including comma lists) and JOIN, at any nesting depth.
+# FROM inside EXTRACT(...)/TRIM(...) is part of the function call, not a table source.
+def table_references(tokens):
+    return [_word(tokens[i]) for i in _reference_indices(tokens)]
+
+
+# Positions in `tokens` of the table references, for table_references() and add_sample()
+def _reference_indices(tokens, offset=0):
+    refs = []
+    opened_by = []
+    i = 0
+    while i < len(tokens):
+        word = _word(tokens[i])
+        if tokens[i] == "(":
+            opened_by.append(_word(tokens[i - 1]) if i else "")
+        elif tokens[i] == ")" and opened_by:
+            opened_by.pop()
+        elif word == "FROM" and opened_by and opened_by[-1] in FUNCTIONS_WITH_FROM:
+            i += 1
+            continue
+        if word in ("FROM", "JOIN"):
+            i += 1
+            while i < len(tokens):
+                if tokens[i] == "(":
+                    end = _skip_parens(tokens, i)  # inline view
+                    refs.extend(_reference_indices(tokens[i + 1:end - 1], offset + i + 1))
+                    i = end
+                elif tokens[i][0].isalpha() or tokens[i][0] in "_\"":
+                    refs.append(offset + i)
+                    i += 1
+                else:
+                    break
+                # optional alias
+                if i < len(tokens) and (tokens[i][0].isalpha() or tokens[i][0] == '"') and _word(tokens[i]) not in CLAUSE_END:
+                    i += 1
+                if word == "FROM" and i < len(tokens) and tokens[i] == ",":
+                    i += 1
+                    continue
+                break
+            continue
+        i += 1
+    return refs
+
+
+def cte_names(tokens):
+    names = set()
+    for i, token in enumerate(tokens[:-2]):
+        if tokens[i + 1].upper() == "AS" and tokens[i + 2] == "(" and (i == 0 or tokens[i - 1] in (",",) or _word(tokens[i - 1]) == "WITH"):
+            names.add(_word(token))
+    return names
+
+
+# Local checks: one statement, read-only, every table PROP-qualified.
+# Returns the reason for rejecting the statement, or None when it's acceptable.
+def validate(sql):
+    tokens = tokenize(sql.strip().rstrip(";"))
+    if not tokens:
+        return "empty statement"
+    if ";" in tokens:
+        return "only a single statement is allowed"
+    if _word(tokens[0]) not in ("SELECT", "WITH"):
+        return "only SELECT queries are allowed"
+    words = [_word(t) for t in tokens if not t.startswith("'")]
+    forbidden = sorted(FORBIDDEN.intersection(words))
+    if forbidden:
+        return f"statement contains {', '.join(forbidden)}"
+    for i, word in enumerate(words[:-1]):
+        if word == "FOR" and words[i + 1] == "UPDATE":
+            return "SELECT ... FOR UPDATE locks rows"
+        if word == "INTO":
+            return "SELECT ... INTO is not allowed"
+    ctes = cte_names(tokens)
+    for ref in table_references(tokens):
+        if ref in ctes or "." not in ref and UNQUALIFIED_OK.match(ref):
+            continue
+        if "." not in ref:
+            return f"table {ref} must be qualified as {OWNER}.{ref}"
+        if ref.split(".", 1)[0].strip('"') != OWNER and not UNQUALIFIED_OK.match(ref.split(".", 1)[1]):
+            return f"table {ref} is outside the {OWNER} schema"
+    return None
+
+
+# Optimizer estimate for a statement: (total cost, largest row estimate of any plan step)
+def explain(sql):
+    backend = get_backend()
+    if backend is not None:
+        return backend.explain(sql)
+    statement_id = uuid.uuid4().hex[:24]
+    with get_pool().acquire() as connection:
+        connection.call_timeout = CALL_TIMEOUT_MS
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN PLAN SET STATEMENT_ID = '{statement_id}' FOR {sql}")
+            cursor.execute("""
+                SELECT MAX(CASE WHEN id = 0 THEN cost END), MAX(cardinality)
+                FROM plan_table WHERE statement_id = :id
+            """, {"id": statement_id})
+            cost, rows = cursor.fetchone()
+            cursor.execute("DELETE FROM plan_table WHERE statement_id = :id", {"id": statement_id})
+        connection.commit()
+    return cost or 0, rows or 0
+
+
+# FROM/JOIN PROP.T [alias] -> PROP.T SAMPLE (p) [alias]; only the first table reference is
+# sampled, never a mention of the name elsewhere (e.g. a PROP.T.COL in the select list)
+def add_sample(sql, table, percent):
+    matches = _matches(sql)
+    tokens = [m.group() for m in matches]
+    for i in _reference_indices(tokens):
+        if _word(tokens[i]) == _word(table):
+            end = matches[i].end()
+            return f"{sql[:end]} SAMPLE ({percent:.4f}){sql[end:]}"
+    return sql
+
+
+# Cost gate run right before execution. Queries over budget that read a single table
+# are rewritten to scan a SAMPLE of it; anything else over budget is rejected.
+# Returns (sql to run, sample percent or None, None) or (None, None, reason). A sampled
+# result estimates counts and sums, so callers must say so wherever it is shown.
+def check_cost(sql):
+    try:
+        cost, rows = explain(sql)
+    except Exception as e:
+        return None, None, f"EXPLAIN PLAN failed: {e}"
+    if cost <= MAX_PLAN_COST and rows <= MAX_PLAN_ROWS:
+        return sql, None, None
+
+    tables = {ref for ref in table_references(tokenize(sql)) if ref.startswith(OWNER + ".")}
+    if len(tables) == 1 and rows > TARGET_SAMPLE_ROWS:
+        percent = max(0.0001, min(50.0, 100.0 * TARGET_SAMPLE_ROWS / rows))
+        sampled = add_sample(sql, tables.pop(), percent)
+        try:
+            sampled_cost, sampled_rows = explain(sampled)
+        except Exception as e:
+            return None, None, f"EXPLAIN PLAN failed for sampled rewrite: {e}"
+        if sampled_cost <= MAX_PLAN_COST and sampled_rows <= MAX_PLAN_ROWS:
+            print(f"[SQL guard] cost {cost:.0f}, ~{rows:.0f} rows; running on a {percent:.4f}% sample")
+            return sampled, percent, None
+    return None, None, (f"estimated cost {cost:.0f} / ~{rows:.0f} rows exceeds the limit "
+                  f"({MAX_PLAN_COST:.0f} / {MAX_PLAN_ROWS:.0f}); add selective filters or sample the table")
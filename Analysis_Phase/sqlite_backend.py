@@ -0,0 +1,156 @@
+import os
+import random
+import re
+import sqlite3
+import threading
+import zlib
+from datetime import datetime, timedelta
+import pandas as pd
+
+SCHEMA_NAME = "PROP"
+ROWS_PER_TABLE = 200
+
+NUMERIC_TYPES = ("NUMBER", "FLOAT", "BINARY_FLOAT", "BINARY_DOUBLE", "INTEGER")
+# Values the profiler's dummy-data check looks for, mixed into the text columns
+TEXT_VALUES = ("ACTIVE", "INACTIVE", "MUMBAI", "PUNE", "NAGPUR", "RESIDENTIAL", "COMMERCIAL",
+               "test", "NA", "-", "")
+NULL_RATE = 0.1
+
+# Oracle-only syntax the stand-in drops: SAMPLE clauses and ROWNUM filters (the fetch
+# itself is still capped at max_rows)
+SAMPLE_CLAUSE = re.compile(r"\s+SAMPLE\s*\(\s*[\d.]+\s*\)", re.IGNORECASE)
+ROWNUM_FILTER = re.compile(r"\bROWNUM\s*(<=|<|=)\s*\d+", re.IGNORECASE)
+
+
+def translate(query):
+    query = SAMPLE_CLAUSE.sub("", query)
+    return ROWNUM_FILTER.sub("1 = 1", query)
+
+
+class _CountDistinct:
+    def __init__(self):
+        self.values = set()
+
+    def step(self, value):
+        if value is not None:
+            self.values.add(value)
+
+    def finalize(self):
+        return len(self.values)
+
+
+def _to_char(value, fmt=None):
+    return None if value is None else str(value)
+
+
+def _ora_hash(value, max_bucket=4294967295, seed=0):
+    return None if value is None else zlib.crc32(f"{seed}:{value}".encode("utf-8")) % (int(max_bucket) + 1)
+
+
+def _nvl(value, default):
+    return default if value is None else value
+
+
+# The PROP schema on a local SQLite file, for running the agent without Oracle. Each
+# thread gets its own connection with the file attached as PROP, so "PROP.TABLE" names
+# resolve unchanged, and the Oracle functions the profiler and agent use are registered
+# as Python functions.
+class SQLiteBackend:
+    def __init__(self, path):
+        self.path = path
+        # Part of the query cache key, so these results never answer an Oracle run
+        self.name = f"sqlite:{os.path.abspath(path)}"
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            conn.execute("ATTACH DATABASE ? AS " + SCHEMA_NAME, (self.path,))
+            conn.create_aggregate("APPROX_COUNT_DISTINCT", 1, _CountDistinct)
+            conn.create_function("TO_CHAR", 1, _to_char, deterministic=True)
+            conn.create_function("TO_CHAR", 2, _to_char, deterministic=True)
+            for nargs in (1, 2, 3):
+                conn.create_function("ORA_HASH", nargs, _ora_hash, deterministic=True)
+            conn.create_function("NVL", 2, _nvl, deterministic=True)
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def execute(self, query, max_rows, timeout_ms):
+        cursor = self.connection().execute(translate(query))
+        columns = [col[0].upper() for col in cursor.description or ()]
+        return pd.DataFrame(cursor.fetchmany(max_rows), columns=columns)
+
+    # No optimizer costs here; every statement passes the cost gate
+    def explain(self, sql):
+        return 0, 0
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+        self.local = threading.local()
+
+
+def _value(rng, dtype, row):
+    if rng.random() < NULL_RATE:
+        return None
+    if dtype in NUMERIC_TYPES:
+        # Mostly small keys so joins and GROUP BYs find matches across tables
+        return rng.randint(1, 50) if rng.random() < 0.7 else round(rng.uniform(0, 1e6), 2)
+    if dtype == "DATE" or dtype.startswith("TIMESTAMP"):
+        return (datetime(2015, 1, 1) + timedelta(days=rng.randint(0, 3650))).strftime("%Y-%m-%d %H:%M:%S")
+    if rng.random() < 0.5:
+        return rng.choice(TEXT_VALUES)
+    return f"V{row % 97}"
+
+
+# Build a SQLite copy of the PROP schema from the dictionary dump (TABLE_NAME, COLUMN_NAME,
+# DATA_TYPE, ...), with `rows` synthetic rows per table and an all_tables table with the
+# row counts. Returns the chosen tables as {name: [(column, type), ...]}.
+def seed_database(path, schema_csv, tables=None, rows=ROWS_PER_TABLE, seed=0):
+    schema = pd.read_csv(schema_csv)
+    names = list(dict.fromkeys(schema["TABLE_NAME"]))
+    if tables is not None:
+        names = names[:tables]
+
+    layout = {}
+    for name, group in schema[schema["TABLE_NAME"].isin(names)].groupby("TABLE_NAME", sort=False):
+        # The dump repeats some columns; keep the first of each name
+        seen = set()
+        layout[name] = [(c, t) for c, t in zip(group["COLUMN_NAME"], group["DATA_TYPE"].str.upper())
+                        if not (c in seen or seen.add(c))]
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("DROP TABLE IF EXISTS all_tables")
+    conn.execute("CREATE TABLE all_tables (owner TEXT, table_name TEXT, num_rows INTEGER)")
+    for name in names:
+        columns = layout[name]
+        kinds = ", ".join(f'"{c}" {"REAL" if t in NUMERIC_TYPES else "TEXT"}' for c, t in columns)
+        conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+        conn.execute(f'CREATE TABLE "{name}" ({kinds})')
+        data = [[_value(rng, t, i) for _, t in columns] for i in range(rows)]
+        conn.executemany(f'INSERT INTO "{name}" VALUES ({", ".join("?" * len(columns))})', data)
+        conn.execute("INSERT INTO all_tables VALUES (?, ?, ?)", (SCHEMA_NAME, name, rows))
+    conn.commit()
+    conn.close()
+    return {name: layout[name] for name in names}
+
+
+# Schema file in the layout schema_catalog writes, for load_schema_chunks
+def write_schema_file(layout, out_path, rows=ROWS_PER_TABLE):
+    blocks = [
+        f"Table: {name}\n"
+        f"Columns: {', '.join(f'{c} ({t})' for c, t in columns)}\n"
+        f"Rows (stats): {rows}"
+        for name, columns in layout.items()
+    ]
+    with open(out_path, "w") as f:
+        f.write("\n\n".join(blocks))
+    return len(blocks)
@@ -0,0 +1,108 @@
+import openai
+import pytest
+import llm_gateway
+from llm_gateway import LLMGateway
+from mock_llm import MockChatServer
+
+MESSAGES = [{"role": "system", "content": "You are a data analyst."},
+            {"role": "user", "content": "Table: AOMS_WARD_MAS\nColumns: NUM_WARD_ID (NUMBER)"}]
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "BACKOFF_BASE", 0.01)
+
+
+def make_gateway(server, tmp_path, rate=5.0):
+    return LLMGateway(api_key="test", base_url=server.base_url, rate=rate,
+                      cache_path=str(tmp_path / "llm_cache.db"))
+
+
+def test_backs_off_on_429_then_recovers(tmp_path):
+    with MockChatServer(rate_limited=2, retry_after=0) as server:
+        gateway = make_gateway(server, tmp_path)
+        try:
+            response = gateway.complete(MESSAGES, model="mock")
+            assert "AOMS_WARD_MAS" in response.content
+            assert not response.cached
+            assert server.requests == 3
+            # Halved twice on the 429s, then one additive step back up
+            assert gateway.limiter.rate == pytest.approx(5.0 / 4 + 0.05 * 5.0)
+            throttled = gateway.limiter.rate
+
+            for n in range(5):
+                gateway.complete(MESSAGES + [{"role": "user", "content": f"round {n}"}], model="mock")
+            assert gateway.limiter.rate > throttled
+            metrics = gateway.metrics()
+            assert metrics["errors"] == 2
+            assert metrics["calls"] == 8
+        finally:
+            gateway.close()
+
+
+def test_gives_up_after_max_retries(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_gateway, "MAX_RETRIES", 2)
+    with MockChatServer(rate_limited=10) as server:
+        gateway = make_gateway(server, tmp_path)
+        try:
+            with pytest.raises(openai.RateLimitError):
+                gateway.complete(MESSAGES, model="mock")
+            assert server.requests == 3
+        finally:
+            gateway.close()
+
+
+def test_rate_follows_ratelimit_headers(tmp_path):
+    headers = {"x-ratelimit-remaining-requests": "2", "x-ratelimit-reset-requests": "10s"}
+    with MockChatServer(headers=headers) as server:
+        gateway = make_gateway(server, tmp_path)
+        try:
+            gateway.complete(MESSAGES, model="mock")
+            assert gateway.limiter.rate == pytest.approx(0.2)
+        finally:
+            gateway.close()
+
+
+def test_identical_prompts_are_served_from_cache(tmp_path):
+    with MockChatServer() as server:
+        gateway = make_gateway(server, tmp_path)
+        try:
+            first = gateway.complete(MESSAGES, model="mock")
+            second = gateway.complete(MESSAGES, model="mock")
+            other_temperature = gateway.complete(MESSAGES, model="mock", temperature=0.0)
+        finally:
+            gateway.close()
+        assert server.requests == 2
+        assert second.cached and second.content == first.content
+        assert not other_temperature.cached
+
+        # The cache is on disk, so a new gateway (a resumed run) replays it too
+        gateway = make_gateway(server, tmp_path)
+        try:
+            assert gateway.complete(MESSAGES, model="mock").cached
+            assert server.requests == 2
+        finally:
+            gateway.close()
+
+
+# llm_calls is shared by every run on the same file, but each gateway reports its own calls only
+def test_metrics_are_per_session(tmp_path):
+    with MockChatServer(rate_limited=1, retry_after=0) as server:
+        first = make_gateway(server, tmp_path)
+        try:
+            first.complete(MESSAGES, model="mock")
+            first.complete(MESSAGES, model="mock")
+            assert first.metrics()["calls"] == 3
+            assert first.metrics()["errors"] == 1
+        finally:
+            first.close()
+
+        second = make_gateway(server, tmp_path)
+        try:
+            assert second.metrics() == {"calls": 0, "cache_hits": 0, "avg_latency": None, "prompt_tokens": None,
+                                        "completion_tokens": None, "errors": 0}
+            second.complete(MESSAGES, model="mock")
+            metrics = second.metrics()
+            assert (metrics["calls"], metrics["cache_hits"], metrics["errors"]) == (1, 1, 0)
+        finally:
+            second.close()
@@ -0,0 +1,37 @@
+import pandas as pd
+from prompt_builder import Conversation, headline
+from result_format import render_result
+
+
+def test_headline_keeps_first_row_of_rendered_result():
+    preview = render_result(pd.DataFrame({"CNT": [12345], "NULLS": [3]}))
+    assert headline(preview) == "CNT|NULLS 12345|3"
+
+
+def test_headline_skips_sampling_note():
+    df = pd.DataFrame({"WARD": ["A", "B"], "CNT": [10, 20]})
+    df.attrs["sample_percent"] = 1.5
+    preview = render_result(df)
+    assert preview.startswith("[sampled at 1.5%")
+    assert headline(preview) == "WARD|CNT A|10 (sampled)"
+
+
+def test_headline_of_empty_result_and_error():
+    assert headline(render_result(pd.DataFrame({"CNT": []}))) == "CNT [0 rows]"
+    assert headline("[SQL Error] ORA-00904: invalid identifier") == "[SQL Error] ORA-00904: invalid identifier"
+
+
+def test_capped_result_count_is_a_lower_bound():
+    df = pd.DataFrame({"ID": range(50)})
+    assert render_result(df, row_cap=50).endswith("[5 of 50+ rows shown]")
+    assert render_result(df.head(49), row_cap=50).endswith("[5 of 49 rows shown]")
+    assert render_result(df).endswith("[5 of 50 rows shown]")
+
+
+def test_summarized_turns_keep_result_values():
+    conversation = Conversation([{"role": "system", "content": "s"}], "Table: T", budget=60)
+    for n in range(4):
+        preview = render_result(pd.DataFrame({"CNT": [1000 + n], "NULLS": [n]}))
+        conversation.add_reply("x" * 80, sql=f"SELECT COUNT(*) FROM T WHERE N = {n}", result_preview=preview)
+    assert conversation.summary
+    assert conversation.summary[0] == "- SELECT COUNT(*) FROM T WHERE N = 0 -> CNT|NULLS 1000|0"
@@ -0,0 +1,26 @@
+from sql_guard import add_sample, table_references, tokenize
+
+
+def test_sample_goes_on_the_from_reference_not_a_qualified_column():
+    sql = "SELECT PROP.T.COL, COUNT(*) FROM PROP.T t GROUP BY PROP.T.COL"
+    assert add_sample(sql, "PROP.T", 1.5) == (
+        "SELECT PROP.T.COL, COUNT(*) FROM PROP.T SAMPLE (1.5000) t GROUP BY PROP.T.COL")
+
+
+def test_sample_skips_earlier_mentions_of_the_name():
+    sql = ("SELECT 'PROP.T' AS src, x.\"PROP.T\" /* PROP.T */ FROM -- PROP.T\n"
+           "  prop . t x WHERE x.ID > 0")
+    assert add_sample(sql, "PROP.T", 2) == (
+        "SELECT 'PROP.T' AS src, x.\"PROP.T\" /* PROP.T */ FROM -- PROP.T\n"
+        "  prop . t SAMPLE (2.0000) x WHERE x.ID > 0")
+
+
+def test_sample_inside_inline_view_and_join():
+    sql = "SELECT * FROM (SELECT PROP.B.ID FROM PROP.A JOIN PROP.B ON PROP.A.ID = PROP.B.ID) v"
+    assert add_sample(sql, "PROP.B", 10) == (
+        "SELECT * FROM (SELECT PROP.B.ID FROM PROP.A JOIN PROP.B SAMPLE (10.0000) ON PROP.A.ID = PROP.B.ID) v")
+    assert table_references(tokenize(sql)) == ["PROP.A", "PROP.B"]
+
+
+def test_sql_without_a_reference_is_left_alone():
+    assert add_sample("SELECT PROP.T.COL FROM DUAL", "PROP.T", 1) == "SELECT PROP.T.COL FROM DUAL"
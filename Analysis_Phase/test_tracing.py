@@ -0,0 +1,38 @@
+import pytest
+import tracing
+from tracing import Tracer, span, summarize, write_prometheus
+
+
+@pytest.fixture
+def tracer(tmp_path, monkeypatch):
+    tracer = Tracer(path=str(tmp_path / "metrics.db"))
+    monkeypatch.setattr(tracing, "_tracer", tracer)
+    monkeypatch.setattr(tracing, "TRACING", True)
+    return tracer
+
+
+# Setup traced before start_run() (pool, gateway, index) belongs to the run that follows
+def test_spans_before_the_run_are_attached_to_it(tracer, tmp_path):
+    with span("setup"):
+        with span("db.run_sql", rows=3):
+            pass
+    tracer.flush()
+    with span("rag_sync"):
+        pass  # still buffered when the run starts
+
+    run_id = tracer.start_run()
+    with span("table", table_name="T"):
+        pass
+    tracer.finish_run()
+
+    summary = summarize(run_id, path=tracer.path)
+    assert set(summary["stages"]) == {"setup", "db.run_sql", "rag_sync", "table"}
+    assert summary["stages"]["db.run_sql"]["rows"] == 3
+    out = tmp_path / "metrics.prom"
+    write_prometheus(summary, str(out))
+    assert f'agent_stage_seconds_count{{run="{run_id}",stage="setup"}} 1' in out.read_text()
+
+    # Spans of a finished run stay with it
+    second = tracer.start_run()
+    tracer.finish_run()
+    assert summarize(second, path=tracer.path)["stages"] == {}
@@ -0,0 +1,325 @@
+import argparse
+import contextvars
+import itertools
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import numpy as np
+
+METRICS_PATH = os.getenv("AGENT_METRICS_PATH", "agent_metrics.db")
+TRACING = os.getenv("AGENT_TRACING", "1") != "0"
+BATCH_SIZE = 200
+FLUSH_INTERVAL = 2.0
+QUANTILES = (0.5, 0.9, 0.99)
+
+# Attributes a span can carry; they are the columns of the spans table
+FIELDS = ("step", "table_name", "round", "rows", "bytes", "prompt_tokens", "completion_tokens",
+          "cached", "status", "detail")
+# Attributes children copy from their parent, so a db.run_sql span knows its table and round
+INHERITED = ("step", "table_name", "round")
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("id", "parent", "name", "start", "started", "attrs")
+
+    def __init__(self, span_id, parent, name, attrs):
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.attrs = {k: parent.attrs[k] for k in INHERITED if parent and k in parent.attrs}
+        self.attrs.update(attrs)
+        self.started = time.time()
+        self.start = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            if value is not None:
+                self.attrs[key] = (self.attrs.get(key) or 0) + value
+
+
+class _NoSpan:
+    def set(self, **attrs):
+        pass
+
+    def add(self, **counts):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+# Spans of one process, buffered and written to the spans table in batches. A run
+# groups the spans of one process_schema_chunks call; spans closed before the first run
+# starts (setup work) are attached to that run rather than left without one.
+class Tracer:
+    def __init__(self, path=METRICS_PATH, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.run_id = None
+        self.unassigned = []  # ids of spans closed before any run started
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                started REAL,
+                finished REAL,
+                tables INTEGER,
+                failed INTEGER,
+                note TEXT
+            );
+            CREATE TABLE IF NOT EXISTS spans (
+                run_id TEXT,
+                span_id INTEGER,
+                parent_id INTEGER,
+                name TEXT,
+                started REAL,
+                duration REAL,
+                step INTEGER,
+                table_name TEXT,
+                round INTEGER,
+                rows INTEGER,
+                bytes INTEGER,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                cached INTEGER,
+                status TEXT,
+                detail TEXT,
+                PRIMARY KEY (run_id, span_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_spans_name ON spans(run_id, name);
+        """)
+        self.conn.commit()
+
+    def start_run(self, note=None):
+        with self.lock:
+            self._flush()
+            self.run_id = uuid.uuid4().hex[:12]
+            self.conn.execute("INSERT INTO runs (run_id, started, note) VALUES (?, ?, ?)",
+                              (self.run_id, time.time(), note))
+            self.conn.executemany("UPDATE spans SET run_id = ? WHERE run_id IS NULL AND span_id = ?",
+                                  [(self.run_id, span_id) for span_id in self.unassigned])
+            self.unassigned = []
+            self.conn.commit()
+        return self.run_id
+
+    # Tables attempted are counted from the run's table spans
+    def finish_run(self, failed=0):
+        self.flush()
+        with self.lock:
+            self.conn.execute("""
+                UPDATE runs SET finished = ?, failed = ?,
+                       tables = (SELECT COUNT(*) FROM spans WHERE run_id = ? AND name = 'table')
+                WHERE run_id = ?
+            """, (time.time(), failed, self.run_id, self.run_id))
+            self.conn.commit()
+
+    def open(self, name, attrs):
+        return Span(next(self.ids), _current.get(), name, attrs)
+
+    def close(self, span):
+        duration = time.perf_counter() - span.start
+        row = (self.run_id, span.id, span.parent.id if span.parent else None, span.name, span.started, duration,
+               *(span.attrs.get(f) for f in FIELDS))
+        with self.lock:
+            if row[0] is None:
+                self.unassigned.append(span.id)
+            self.buffer.append(row)
+            if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            self.conn.executemany(f"INSERT OR REPLACE INTO spans VALUES ({', '.join('?' * (6 + len(FIELDS)))})",
+                                  self.buffer)
+            self.conn.commit()
+            self.buffer = []
+        self.last_flush = time.monotonic()
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
+
+
+# Time a block as a span named `name`. Nested spans record their parent and inherit
+# step/table/round; the yielded span takes more attributes via set() and add().
+@contextmanager
+def span(name, **attrs):
+    if not TRACING:
+        yield NO_SPAN
+        return
+    tracer = get_tracer()
+    current = tracer.open(name, attrs)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs.setdefault("status", type(e).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        tracer.close(current)
+
+
+# Attributes for whichever span is open in this thread (e.g. a cache hit deep in a call)
+def annotate(**attrs):
+    current = _current.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(index=False, deep=True).sum())
+
+
+def _percentiles(values):
+    return {q: float(np.quantile(values, q)) for q in QUANTILES}
+
+
+def last_run(path=METRICS_PATH):
+    conn = sqlite3.connect(path)
+    row = conn.execute("SELECT run_id FROM runs ORDER BY started DESC LIMIT 1").fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+# Per-stage totals and quantiles, plus the tables and queries that took longest
+def summarize(run_id, path=METRICS_PATH, top=10):
+    conn = sqlite3.connect(path)
+    run = conn.execute("SELECT started, finished, tables, failed FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    durations = {}
+    for name, duration in conn.execute("SELECT name, duration FROM spans WHERE run_id = ?", (run_id,)):
+        durations.setdefault(name, []).append(duration)
+    totals = conn.execute("""
+        SELECT name, COUNT(*), SUM(duration), SUM(rows), SUM(bytes), SUM(prompt_tokens),
+               SUM(completion_tokens), SUM(cached), SUM(status IS NOT NULL AND status != 'ok')
+        FROM spans WHERE run_id = ? GROUP BY name
+    """, (run_id,)).fetchall()
+    tables = conn.execute("""
+        SELECT table_name, duration,
+               (SELECT COUNT(*) FROM spans r WHERE r.run_id = t.run_id AND r.parent_id = t.span_id AND r.name = 'round')
+        FROM spans t WHERE run_id = ? AND name = 'table' ORDER BY duration DESC LIMIT ?
+    """, (run_id, top)).fetchall()
+    queries = conn.execute("""
+        SELECT table_name, detail, duration, rows, bytes FROM spans
+        WHERE run_id = ? AND name = 'db.run_sql' ORDER BY duration DESC LIMIT ?
+    """, (run_id, top)).fetchall()
+    conn.close()
+
+    stages = {}
+    for name, count, total, rows, nbytes, prompt_tokens, completion_tokens, cached, errors in totals:
+        stages[name] = {"count": count, "total_s": total, "rows": rows, "bytes": nbytes,
+                        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                        "cached": cached, "errors": errors, "quantiles": _percentiles(durations[name])}
+    started, finished, n_tables, failed = run or (None, None, None, None)
+    wall = finished - started if started and finished else None
+    return {
+        "run_id": run_id,
+        "wall_s": wall,
+        "tables": n_tables,
+        "failed": failed,
+        "tables_per_minute": 60 * (n_tables - (failed or 0)) / wall if wall and n_tables else None,
+        "stages": stages,
+        "slowest_tables": [{"table": t, "seconds": d, "rounds": r} for t, d, r in tables],
+        "slowest_queries": [{"table": t, "query": q, "seconds": d, "rows": r, "bytes": b}
+                            for t, q, d, r, b in queries],
+    }
+
+
+def format_summary(summary):
+    lines = [f"Run {summary['run_id']}: {summary['tables']} tables ({summary['failed']} failed)"
+             + (f" in {summary['wall_s']:.1f}s, {summary['tables_per_minute']:.1f} tables/min"
+                if summary["wall_s"] and summary["tables_per_minute"] else "")]
+    header = ["stage", "count", "total_s", "p50_ms", "p90_ms", "p99_ms", "rows", "bytes", "tokens"]
+    lines.append("".join(f"{h:>16}" for h in header))
+    for name, s in sorted(summary["stages"].items(), key=lambda item: -item[1]["total_s"]):
+        tokens = (s["prompt_tokens"] or 0) + (s["completion_tokens"] or 0)
+        cells = [name, s["count"], f"{s['total_s']:.2f}",
+                 *(f"{s['quantiles'][q] * 1000:.1f}" for q in QUANTILES),
+                 s["rows"] or "", s["bytes"] or "", tokens or ""]
+        lines.append("".join(f"{str(c):>16}" for c in cells))
+    if summary["slowest_tables"]:
+        lines.append("Slowest tables:")
+        lines.extend(f"  {t['table']}: {t['seconds']:.1f}s over {t['rounds']} rounds" for t in summary["slowest_tables"])
+    if summary["slowest_queries"]:
+        lines.append("Slowest queries:")
+        lines.extend(f"  {q['seconds']:.2f}s {q['rows']} rows [{q['table']}] {(q['query'] or '')[:120]}"
+                     for q in summary["slowest_queries"])
+    return "\n".join(lines)
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+# The summary in Prometheus text exposition format, e.g. for node_exporter's textfile collector
+def write_prometheus(summary, out_path):
+    run = summary["run_id"]
+    lines = [
+        "# HELP agent_stage_seconds Span durations per agent stage.",
+        "# TYPE agent_stage_seconds summary",
+    ]
+    for name, s in summary["stages"].items():
+        for q, value in s["quantiles"].items():
+            lines.append(f"agent_stage_seconds{_labels(run=run, stage=name, quantile=q)} {value:.6f}")
+        lines.append(f"agent_stage_seconds_sum{_labels(run=run, stage=name)} {s['total_s']:.6f}")
+        lines.append(f"agent_stage_seconds_count{_labels(run=run, stage=name)} {s['count']}")
+    for metric, key, help_text in (("agent_stage_rows_total", "rows", "Rows returned per stage."),
+                                   ("agent_stage_bytes_total", "bytes", "Bytes fetched or written per stage."),
+                                   ("agent_stage_errors_total", "errors", "Spans that ended in an error.")):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        lines += [f"{metric}{_labels(run=run, stage=name)} {s[key] or 0}" for name, s in summary["stages"].items()]
+    lines += ["# HELP agent_llm_tokens_total LLM tokens by kind.", "# TYPE agent_llm_tokens_total counter"]
+    for kind in ("prompt", "completion"):
+        total = sum(s[f"{kind}_tokens"] or 0 for s in summary["stages"].values())
+        lines.append(f"agent_llm_tokens_total{_labels(run=run, kind=kind)} {total}")
+    if summary["tables_per_minute"] is not None:
+        lines += ["# HELP agent_tables_per_minute Tables analyzed per minute of wall time.",
+                  "# TYPE agent_tables_per_minute gauge",
+                  f"agent_tables_per_minute{_labels(run=run)} {summary['tables_per_minute']:.3f}"]
+    tmp = out_path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, out_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the agent's recorded spans")
+    parser.add_argument("--run", help="run id (default: the latest run)")
+    parser.add_argument("--db", default=METRICS_PATH)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--prometheus", help="also write Prometheus text format to this file")
+    args = parser.parse_args()
+
+    run_id = args.run or last_run(args.db)
+    if run_id is None:
+        parser.error(f"no runs recorded in {args.db}")
+    summary = summarize(run_id, path=args.db, top=args.top)
+    print(format_summary(summary))
+    if args.prometheus:
+        write_prometheus(summary, args.prometheus)
@@ -0,0 +1,209 @@
+import argparse
+import os
+import random
+import warnings
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import mean_absolute_error
+from xgboost import XGBRegressor
+from deap import base, creator, tools, algorithms
+from property_dataset import load_dataset, numeric_codes, DATASET_DIR, LEGACY_CSV
+
+warnings.filterwarnings("ignore")
+
+# The partitioned dataset when it has been built, else the flat CSV
+DATA_PATH = DATASET_DIR if os.path.isdir(DATASET_DIR) else LEGACY_CSV
+TARGET = "TOTAL_TAX"
+
+# GA parameters
+POP_SIZE = 30
+GENS = 15
+CXPB = 0.5
+MUTPB = 0.2
+# Generations without a better best fitness before the search stops
+PATIENCE = 5
+
+# Per-individual model: up to N_ESTIMATORS trees, stopped once the validation MAE
+# (a slice of the training set) hasn't improved for EARLY_STOPPING_ROUNDS
+N_ESTIMATORS = 100
+EARLY_STOPPING_ROUNDS = 10
+VALIDATION_FRACTION = 0.2
+
+
+# `path` is a partitioned dataset directory or a CSV; `start`/`end` ("YYYY-MM") limit
+# either to those months. Zone and ward stay numeric features either way.
+def load_data(path=DATA_PATH, target=TARGET, start=None, end=None):
+    df = numeric_codes(load_dataset(path, start=start, end=end))
+    X = df.drop(columns=[target])
+    y = df[target]
+    # Handle categorical variables
+    X = pd.get_dummies(X)
+    # Ensure no NaNs
+    X.fillna(0, inplace=True)
+    return X, y
+
+
+# Feature matrix as one float32, column-major array: selecting a subset of columns
+# is then a contiguous copy per column instead of a pandas .loc on the whole frame
+def as_matrix(X):
+    return np.asfortranarray(X.to_numpy(dtype=np.float32))
+
+
+def make_model(early_stopping=True):
+    return XGBRegressor(
+        n_estimators=N_ESTIMATORS,
+        random_state=42,
+        verbosity=0,
+        tree_method="hist",
+        n_jobs=1,  # parallelism comes from the process pool
+        eval_metric="mae",
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS if early_stopping else None,
+    )
+
+
+# Arrays each pool worker evaluates against, set once per process by the initializer
+_data = {}
+
+
+def init_worker(X_fit, y_fit, X_val, y_val, X_test, y_test):
+    _data.update(X_fit=X_fit, y_fit=y_fit, X_val=X_val, y_val=y_val, X_test=X_test, y_test=y_test)
+
+
+def evaluate_mask(mask):
+    columns = np.flatnonzero(mask)
+    if len(columns) == 0:
+        return (float("inf"),)  # Penalize empty selection
+
+    model = make_model()
+    model.fit(_data["X_fit"][:, columns], _data["y_fit"],
+              eval_set=[(_data["X_val"][:, columns], _data["y_val"])], verbose=False)
+    preds = model.predict(_data["X_test"][:, columns])
+    return (mean_absolute_error(_data["y_test"], preds),)
+
+
+def genome_key(individual):
+    return np.packbits(np.asarray(individual, dtype=np.uint8)).tobytes()
+
+
+# Fitness for a population, memoized by genome bitmask: crossover and mutation keep
+# reproducing genomes already scored, and only unseen ones go to toolbox.map
+class FitnessCache:
+    def __init__(self, toolbox):
+        self.toolbox = toolbox
+        self.scores = {}
+        self.hits = 0
+
+    def evaluate(self, individuals):
+        pending = {}
+        for ind in individuals:
+            key = genome_key(ind)
+            if key in self.scores:
+                self.hits += 1
+            elif key not in pending:
+                pending[key] = np.asarray(ind, dtype=bool)
+        results = self.toolbox.map(self.toolbox.evaluate, list(pending.values()))
+        self.scores.update(zip(pending, results))
+        for ind in individuals:
+            ind.fitness.values = self.scores[genome_key(ind)]
+        return len(pending)
+
+
+def make_toolbox(n_features):
+    if not hasattr(creator, "FitnessMin"):
+        creator.create("FitnessMin", base.Fitness, weights=(-1.0,))  # Minimize MAE
+        creator.create("Individual", list, fitness=creator.FitnessMin)
+
+    toolbox = base.Toolbox()
+    # Attribute generator: binary inclusion for each feature
+    toolbox.register("attr_bool", lambda: random.randint(0, 1))
+    toolbox.register("individual", tools.initRepeat, creator.Individual, toolbox.attr_bool, n=n_features)
+    toolbox.register("population", tools.initRepeat, list, toolbox.individual)
+
+    toolbox.register("evaluate", evaluate_mask)
+    toolbox.register("mate", tools.cxTwoPoint)
+    toolbox.register("mutate", tools.mutFlipBit, indpb=0.1)
+    toolbox.register("select", tools.selTournament, tournsize=3)
+    return toolbox
+
+
+# eaSimple's generational loop, with cached evaluation and a stop once the best
+# fitness has not improved for `patience` generations
+def run_ga(toolbox, pop_size=POP_SIZE, gens=GENS, cxpb=CXPB, mutpb=MUTPB, patience=PATIENCE, verbose=True):
+    pop = toolbox.population(n=pop_size)
+    hof = tools.HallOfFame(1)
+    stats = tools.Statistics(lambda ind: ind.fitness.values)
+    stats.register("avg", np.mean)
+    stats.register("min", np.min)
+    logbook = tools.Logbook()
+    logbook.header = ["gen", "nevals", "cached"] + stats.fields
+
+    cache = FitnessCache(toolbox)
+    best, stale = float("inf"), 0
+    for gen in range(gens + 1):
+        if gen:
+            pop = toolbox.select(pop, len(pop))
+            pop = algorithms.varAnd(pop, toolbox, cxpb, mutpb)
+        hits = cache.hits
+        nevals = cache.evaluate(pop)
+        hof.update(pop)
+        logbook.record(gen=gen, nevals=nevals, cached=cache.hits - hits, **stats.compile(pop))
+        if verbose:
+            print(logbook.stream)
+
+        if hof[0].fitness.values[0] < best:
+            best, stale = hof[0].fitness.values[0], 0
+        else:
+            stale += 1
+            if stale >= patience:
+                if verbose:
+                    print(f"No improvement in {patience} generations; stopping at generation {gen}.")
+                break
+    return hof[0], logbook
+
+
+def split(X, y, seed=42):
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=seed)
+    X_fit, X_val, y_fit, y_val = train_test_split(X_train, y_train, test_size=VALIDATION_FRACTION, random_state=seed)
+    return X_train, X_test, y_train, y_test, X_fit, X_val, y_fit, y_val
+
+
+# Feature search plus the final model on the chosen columns. Returns
+# (selected feature names, final test MAE, logbook).
+def select_features(X, y, workers=None, pop_size=POP_SIZE, gens=GENS, patience=PATIENCE, seed=42, verbose=True):
+    random.seed(seed)
+    X_train, X_test, y_train, y_test, X_fit, X_val, y_fit, y_val = split(X, y, seed)
+    arrays = (as_matrix(X_fit), y_fit.to_numpy(np.float32), as_matrix(X_val), y_val.to_numpy(np.float32),
+              as_matrix(X_test), y_test.to_numpy(np.float32))
+
+    toolbox = make_toolbox(X.shape[1])
+    with Pool(processes=workers or os.cpu_count(), initializer=init_worker, initargs=arrays) as pool:
+        toolbox.register("map", pool.map)
+        best_ind, logbook = run_ga(toolbox, pop_size=pop_size, gens=gens, patience=patience, verbose=verbose)
+
+    # Final model with best features, trained on the full training split
+    selected_features = [col for col, sel in zip(X.columns, best_ind) if sel == 1]
+    final_model = make_model(early_stopping=False)
+    final_model.fit(as_matrix(X_train[selected_features]), y_train)
+    preds = final_model.predict(as_matrix(X_test[selected_features]))
+    return selected_features, mean_absolute_error(y_test, preds), logbook
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GA feature selection for the property tax regressor")
+    parser.add_argument("--data", default=DATA_PATH, help="dataset directory or CSV")
+    parser.add_argument("--start", help="first month used from a dataset directory, YYYY-MM")
+    parser.add_argument("--end", help="last month used from a dataset directory, YYYY-MM")
+    parser.add_argument("--pop-size", type=int, default=POP_SIZE)
+    parser.add_argument("--gens", type=int, default=GENS)
+    parser.add_argument("--patience", type=int, default=PATIENCE)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    X, y = load_data(args.data, start=args.start, end=args.end)
+    selected_features, mae, _ = select_features(X, y, workers=args.workers, pop_size=args.pop_size,
+                                                gens=args.gens, patience=args.patience, seed=args.seed)
+    print("Selected Features:", selected_features)
+    print(f"Final MAE on Test Set: {mae:.4f}")
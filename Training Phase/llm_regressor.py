@@ -0,0 +1,162 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import numpy as np
+import torch
+from sklearn.metrics import mean_absolute_error
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+GPU_MODEL = "mistralai/Mistral-7B-Instruct-v0.1"
+# Small instruct model for CPU-only machines
+CPU_MODEL = os.getenv("CPU_LLM_MODEL", "Qwen/Qwen2.5-0.5B-Instruct")
+CACHE_PATH = os.getenv("LLM_PREDICTION_CACHE", "llm_predictions.db")
+MAX_NEW_TOKENS = 20
+MAX_BATCH_SIZE = 64
+# Padded tokens (prompt + generated) allowed per batch
+MAX_BATCH_TOKENS = 16384
+
+NUMBER = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+
+
+# Convert tabular row to natural language prompt
+def make_prompt(row, features):
+    parts = [f"{feat.replace('_',' ')} is {row[feat]}" for feat in features]
+    return "The property has " + ", ".join(parts) + ". What is the property tax?"
+
+
+# First number in the generated text, or the fallback when there is none
+def parse_prediction(text, fallback):
+    match = NUMBER.search(text or "")
+    if not match:
+        return fallback
+    try:
+        return float(match.group(0).replace(",", ""))
+    except ValueError:
+        return fallback
+
+
+# Generated text per (model, max_new_tokens, prompt); greedy decoding makes it deterministic,
+# so a prompt repeated across GA individuals or runs is generated once
+class PredictionCache:
+    def __init__(self, path=CACHE_PATH):
+        self.lock = threading.Lock()
+        self.memory = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False) if path else None
+        if self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, output TEXT)")
+            self.conn.commit()
+
+    @staticmethod
+    def key(model_name, max_new_tokens, prompt):
+        return hashlib.sha256(f"{model_name}\x00{max_new_tokens}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        found = {k: self.memory[k] for k in keys if k in self.memory}
+        missing = [k for k in keys if k not in found]
+        if self.conn and missing:
+            with self.lock:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = self.conn.execute(
+                        f"SELECT key, output FROM predictions WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    found.update(rows)
+                    self.memory.update(rows)
+        return found
+
+    def put_many(self, items):
+        self.memory.update(items)
+        if self.conn:
+            with self.lock:
+                self.conn.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?)", list(items.items()))
+                self.conn.commit()
+
+    def close(self):
+        if self.conn:
+            with self.lock:
+                self.conn.close()
+
+
+def default_device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+# Causal LM used as a regressor. predict() takes all prompts at once: duplicates and
+# cached prompts are dropped, the rest are sorted by length and generated in batches
+# sized to a padded-token budget, so short prompts aren't padded to the longest one.
+class LLMRegressor:
+    def __init__(self, model_name=None, device=None, max_new_tokens=MAX_NEW_TOKENS, max_batch_size=MAX_BATCH_SIZE,
+                 max_batch_tokens=MAX_BATCH_TOKENS, cache=None, token=None):
+        self.device = device or default_device()
+        self.model_name = model_name or (GPU_MODEL if self.device == "cuda" else CPU_MODEL)
+        self.max_new_tokens = max_new_tokens
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.cache = cache if cache is not None else PredictionCache()
+        token = token or os.getenv("HF_TOKEN")
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, token=token)
+        # Decoder-only models generate after the last prompt token, so pad on the left
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        if self.device == "cuda":
+            self.model = AutoModelForCausalLM.from_pretrained(self.model_name, token=token, device_map="auto",
+                                                              torch_dtype=torch.bfloat16)
+        else:
+            self.model = AutoModelForCausalLM.from_pretrained(self.model_name, token=token, torch_dtype=torch.float32)
+            self.model.to(self.device)
+        self.model.eval()
+
+    def _batches(self, prompts):
+        lengths = [len(ids) for ids in self.tokenizer(prompts)["input_ids"]]
+        batch, longest = [], 0
+        for i in sorted(range(len(prompts)), key=lengths.__getitem__):
+            widest = max(longest, lengths[i])
+            if batch and (len(batch) >= self.max_batch_size
+                          or (len(batch) + 1) * (widest + self.max_new_tokens) > self.max_batch_tokens):
+                yield [prompts[j] for j in batch]
+                batch, widest = [], lengths[i]
+            batch.append(i)
+            longest = widest
+        if batch:
+            yield [prompts[j] for j in batch]
+
+    def generate(self, prompts):
+        encoded = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.model.device)
+        with torch.inference_mode():
+            output = self.model.generate(**encoded, do_sample=False, max_new_tokens=self.max_new_tokens,
+                                         pad_token_id=self.tokenizer.pad_token_id)
+        # Only the continuation; the prompt's own numbers must not be parsed as the answer
+        return self.tokenizer.batch_decode(output[:, encoded["input_ids"].shape[1]:], skip_special_tokens=True)
+
+    # Generated text for each prompt, in order
+    def complete(self, prompts):
+        keys = {p: PredictionCache.key(self.model_name, self.max_new_tokens, p) for p in prompts}
+        cached = self.cache.get_many(list(set(keys.values())))
+        todo = sorted({p for p in prompts if keys[p] not in cached})
+        for batch in self._batches(todo) if todo else ():
+            generated = dict(zip((keys[p] for p in batch), self.generate(batch)))
+            self.cache.put_many(generated)
+            cached.update(generated)
+        return [cached[keys[p]] for p in prompts]
+
+    def predict(self, prompts, fallback):
+        return [parse_prediction(text, fallback) for text in self.complete(prompts)]
+
+
+# GA fitness: MAE of the LLM's predictions on the test rows described by the selected columns
+def make_fitness(regressor, X_test, y_test, columns):
+    fallback = float(y_test.mean())
+    records = X_test.to_dict("records")
+
+    def eval_individual(individual):
+        selected_cols = [col for col, gene in zip(columns, individual) if gene == 1]
+        if not selected_cols:
+            return (9999,)  # penalize empty selection
+        preds = regressor.predict([make_prompt(row, selected_cols) for row in records], fallback)
+        return (mean_absolute_error(y_test, np.asarray(preds)),)
+
+    return eval_individual
@@ -0,0 +1,73 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DATASETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Datasets")
+# Built by Analysis_Phase/build_dataset.py: YEAR=y/MONTH=m/part-0.parquet
+DATASET_DIR = os.path.join(DATASETS_DIR, "property_data")
+LEGACY_CSV = os.path.join(DATASETS_DIR, "clean_property_data.csv")
+
+# Integer codes, returned as categoricals
+CATEGORICAL = ["VAR_PROP_ZONEID", "NUM_PROP_WARDNO"]
+PARTITIONING = ds.partitioning(pa.schema([("YEAR", pa.int16()), ("MONTH", pa.int8())]), flavor="hive")
+
+
+def _month(value):
+    year, month = (int(part) for part in value.split("-"))
+    return year * 100 + month
+
+
+# The flat CSV with the same filters, for trees where the dataset hasn't been built
+# (Datasets/property_data/ is generated locally and not checked in)
+def _load_csv(path, columns, start, end):
+    df = pd.read_csv(path, index_col=0).reset_index(drop=True)
+    # The dataset's types, as build_dataset.py writes them
+    df = df.astype({"YEAR": "int16", "MONTH": "int8", **{col: "int16" for col in CATEGORICAL}})
+    month = df["YEAR"].astype("int32") * 100 + df["MONTH"]
+    keep = pd.Series(True, index=df.index)
+    if start:
+        keep &= month >= _month(start)
+    if end:
+        keep &= month <= _month(end)
+    df = df[keep] if columns is None else df.loc[keep, list(columns)]
+    return df.reset_index(drop=True)
+
+
+# The partitioned dataset as a DataFrame. Only the months between `start` and `end`
+# (inclusive, "YYYY-MM") are opened, only `columns` are read, and files are memory-mapped.
+# Without the dataset directory (or given a CSV path) the flat CSV is read instead.
+# Zone and ward come back as categoricals.
+def load_dataset(path=DATASET_DIR, columns=None, start=None, end=None):
+    if not os.path.isdir(path):
+        return _categorical(_load_csv(LEGACY_CSV if path == DATASET_DIR else path, columns, start, end))
+    month = ds.field("YEAR").cast(pa.int32()) * 100 + ds.field("MONTH").cast(pa.int32())
+    condition = None
+    if start:
+        condition = month >= _month(start)
+    if end:
+        condition = month <= _month(end) if condition is None else condition & (month <= _month(end))
+    df = pq.read_table(path, columns=columns, filters=condition, partitioning=PARTITIONING,
+                       memory_map=True).to_pandas()
+    if columns is None:
+        # Partition keys first, as in the flat CSV
+        df = df[["YEAR", "MONTH"] + [c for c in df.columns if c not in ("YEAR", "MONTH")]]
+    return _categorical(df)
+
+
+def _categorical(df):
+    for col in CATEGORICAL:
+        if col in df:
+            df[col] = df[col].astype("category")
+    return df
+
+
+# Categorical columns over numeric codes turned back into plain numbers, for models that
+# treat zone and ward as ordinal features (as they were when read from the CSV)
+def numeric_codes(df):
+    df = df.copy()
+    for col in df.select_dtypes("category").columns:
+        if df[col].cat.categories.dtype.kind in "iuf":
+            df[col] = df[col].astype(df[col].cat.categories.dtype)
+    return df